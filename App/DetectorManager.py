@@ -7,7 +7,7 @@ from pathlib import Path
 from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QLabel, QProgressBar, QHBoxLayout, QWidget, QLabel, QPushButton
 
-from GMMDetector import MaterialDetector
+from GMMDetector import DetectionPipeline, MaterialDetector
 from Parameters import Parameters
 from demo_functions import visualise_flakes, remove_vignette
 
@@ -86,6 +86,9 @@ class DetectorManager(QWidget):
             print(message)
             return
 
+        # compile the detector while the images are prepared
+        self.warmup_thread = self.model.warmup(background=True)
+
         # TODO: add options to change the confidence threshold
 
         if parameters.use_flatfield:
@@ -124,6 +127,20 @@ class DetectorManager(QWidget):
             self.progress_bar.setRange(0, self.total_images)
             self.progress_bar.setValue(0)
 
+            # the vignette removal, detection, drawing and saving of the images overlap in a pipeline of threads
+            self.warmup_thread.join()
+            self.write_error = None
+            pipeline = DetectionPipeline(
+                self.model,
+                read=self.read_image,
+                render=self.render_image,
+                write=self.write_image,
+                # flakes below the confidence threshold are not drawn, so they are removed early
+                features=["false_positive_probability"],
+                min_confidence=self.parameters.min_confidence,
+            )
+            self.results = pipeline.run(range(self.total_images))
+
             QTimer.singleShot(0, self.run_image)
             return
 
@@ -160,42 +177,65 @@ class DetectorManager(QWidget):
 
 
 
+    def read_image(self, image_index):
+        """ Returns the prepared image with the given index, runs in a thread of the pipeline. """
+        image = self.images[image_index]
+
+        # Remove vignette if necessary
+        if self.parameters.use_flatfield:
+            image = remove_vignette(image, self.flatfield)
+        return image
+
+
+    def render_image(self, image, flakes):
+        """ Draws the flakes on the image, runs in a thread of the pipeline. """
+        if len(flakes) == 0:
+            return image
+        return visualise_flakes(
+            flakes,
+            image,
+            confidence_threshold=self.parameters.min_confidence,
+        )
+
+
+    def write_image(self, image_index, image, flakes):
+        """ Saves the image if flakes were detected, runs in a thread of the pipeline.\n
+        The widgets are only updated from the UI thread, so a failed write is shown by `run_image`.
+        """
+        if len(flakes) == 0:
+            return
+
+        # Save the processed image with detected flakes
+        try:
+            cv2.imwrite(os.path.join(self.folder_path, "detected_" + self.image_names[image_index]), image)
+        except Exception as e:
+            message = f"OpenCV write failed: {e}"
+            self.write_error = message
+            print(message)
+
+
     def run_image(self):
-        if self.curr_idx >= self.total_images:
+        # waits for the next image which passed the pipeline
+        try:
+            image_index, flakes = next(self.results)
+        except StopIteration:
             self.run_button.setEnabled(True)
             self.debugging_label.setText("")
             self.progress_text.setText("Process complete.")
             print("Finished")
             return
-        
-        image = self.images[self.curr_idx]
-        image_name = self.image_names[self.curr_idx]
 
-        # Remove vignette if necessary
-        if self.parameters.use_flatfield:
-            image = remove_vignette(image, self.flatfield)
-        
-        flakes = self.model.detect_flakes(image)
+        image_name = self.image_names[image_index]
 
         if len(flakes) == 0:
             print(f"No flakes detected in {image_name}. Skipping.")
         else:
-            image = visualise_flakes(
-                flakes,
-                image,
-                confidence_threshold=self.parameters.min_confidence,
-            )
-            # Save the processed image with detected flakes
-            
-            try:
-                cv2.imwrite(os.path.join(self.folder_path, "detected_" + image_name), image)
-            except Exception as e:
-                message = f"OpenCV write failed: {e}"
-                self.debugging_label.setText(message)
-                print(message)
-
             print(f"Processed {image_name} with {len(flakes)} flakes detected.")
 
+        if self.write_error is not None:
+            self.debugging_label.setText(self.write_error)
+            self.write_error = None
+
         # Update progress
         self.curr_idx += 1
 
@@ -0,0 +1,95 @@
+"""
+This Benchmark compares `detect_flakes_batch` with a python loop over `detect_flakes`.
+The demo images are repeated to a stack of the given size, both variants are timed and their results are compared.
+The gain of the batch depends on the number of cores, numba splits the frames and their rows over its threads.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from numba import get_num_threads
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(FILE_DIR, ".."))
+
+from GMMDetector import MaterialDetector
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Batch Benchmark")
+    parser.add_argument("--material", dest="material", help="Material to process", default="Graphene", type=str)
+    parser.add_argument("--size", dest="size", help="Size threshold in pixels", default=200, type=int)
+    parser.add_argument("--engine", dest="engine", help="Engine of the detector", default="fused", type=str)
+    parser.add_argument("--batch_size", dest="batch_size", help="Number of frames per batch", default=16, type=int)
+    parser.add_argument("--repeats", dest="repeats", help="Number of timed runs", default=3, type=int)
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+def get_result_key(flakes) -> list:
+    """Returns the comparable attributes of the detected flakes of one frame"""
+    return [(flake.thickness, flake.size, tuple(flake.center)) for flake in flakes]
+
+
+args = arg_parse()
+
+IMAGE_DIR = os.path.join(FILE_DIR, "..", "demo", "images")
+CONTRAST_PATH = os.path.join(
+    FILE_DIR, "..", "GMMDetector", "trained_parameters", f"{args['material']}_GMM.json"
+)
+
+with open(CONTRAST_PATH) as f:
+    contrast_dict = json.load(f)
+
+image_paths = sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg")))
+images = np.stack(
+    [
+        cv2.imread(image_paths[index % len(image_paths)])
+        for index in range(args["batch_size"])
+    ]
+)
+
+detector = MaterialDetector(
+    contrast_dict=contrast_dict,
+    size_threshold=args["size"],
+    engine=args["engine"],
+)
+
+# the first calls compile the kernels
+loop_results = [detector.detect_flakes(image) for image in images]
+batch_results = detector.detect_flakes_batch(images)
+
+start_time = time.perf_counter()
+for _ in range(args["repeats"]):
+    loop_results = [detector.detect_flakes(image) for image in images]
+loop_time = (time.perf_counter() - start_time) / args["repeats"]
+
+start_time = time.perf_counter()
+for _ in range(args["repeats"]):
+    batch_results = detector.detect_flakes_batch(images)
+batch_time = (time.perf_counter() - start_time) / args["repeats"]
+
+same_results = all(
+    get_result_key(loop_flakes) == get_result_key(batch_flakes)
+    for loop_flakes, batch_flakes in zip(loop_results, batch_results)
+)
+
+print(f"Frames: {len(images)}, numba threads: {get_num_threads()}")
+print(f"Same results: {same_results}")
+print()
+print(f"{'variant':<8} {'total':>10} {'ms / frame':>11}")
+for name, total_time in (("loop", loop_time), ("batch", batch_time)):
+    print(f"{name:<8} {total_time:>9.2f}s {total_time / len(images) * 1000:>11.1f}")
+print(f"Speedup: {loop_time / batch_time:.2f}x")
@@ -0,0 +1,163 @@
+"""
+This Benchmark measures the pixel classification kernels for models with 3, 2 and 1 used channels.
+For every channel count the label map stage of each engine is timed on the demo images.
+The distance map of the "legacy" engine is also compared with a generic kernel, which copies the used channels of the contrast image
+and uses the nested loops over the triangular matrices, to show the gain of the unrolled kernels.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from numba import jit, prange
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(FILE_DIR, ".."))
+
+from GMMDetector import MaterialDetector
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Channel Kernel Benchmark")
+    parser.add_argument("--material", dest="material", help="Material to process", default="Graphene", type=str)
+    parser.add_argument("--channels", dest="channels", help="Comma separated used channels to benchmark", default="BGR,GR,G", type=str)
+    parser.add_argument("--engines", dest="engines", help="Comma separated engines to benchmark", default="legacy,fused,affine", type=str)
+    parser.add_argument("--num_image", dest="num_image", help="Number of images to process", default=4, type=int)
+    parser.add_argument("--repeats", dest="repeats", help="Number of timed runs per image", default=3, type=int)
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+@jit(parallel=True, fastmath=True, nopython=True, nogil=True)
+def generic_distance_map(
+    contrast_image: np.ndarray,
+    means: np.ndarray,
+    inv_choleskys: np.ndarray,
+) -> np.ndarray:
+    """The distance map kernel with the generic loops over the channels, the contrast image only contains the used channels
+
+    Args:
+        contrast_image (np.ndarray): The contrast image of shape H x W x C
+        means (np.ndarray): The means of the Gaussian Mixture of shape (K x C)
+        inv_choleskys (np.ndarray): The inverse cholesky matrices of the Gaussian Mixture of shape (K x C x C)
+
+    Returns:
+        np.ndarray: The Mahalanobis distances of shape (K x H x W)
+    """
+    mh_distance_map = np.zeros(
+        shape=(means.shape[0], contrast_image.shape[0], contrast_image.shape[1]),
+        dtype=np.float32,
+    )
+    for component_index in prange(means.shape[0]):
+        for i in prange(contrast_image.shape[0]):
+            for j in range(contrast_image.shape[1]):
+                mh_dist = means.dtype.type(0)
+                for k in range(contrast_image.shape[2]):
+                    tmp = means.dtype.type(0)
+                    for h in range(k + 1):
+                        tmp += (
+                            means[component_index, h] - contrast_image[i, j, h]
+                        ) * inv_choleskys[component_index, k, h]
+                    mh_dist += tmp * tmp
+                mh_distance_map[component_index, i, j] = np.sqrt(mh_dist)
+    return mh_distance_map
+
+
+def time_per_image(function, *argument_lists) -> float:
+    """Calls the function once to compile it, then returns the mean time of a call in ms
+
+    Args:
+        function (callable): The function to time
+        *argument_lists (list): The lists of arguments, one entry per image
+
+    Returns:
+        float: The mean time of a call in ms
+    """
+    function(*[arguments[0] for arguments in argument_lists])
+
+    start_time = time.perf_counter()
+    for _ in range(args["repeats"]):
+        for arguments in zip(*argument_lists):
+            function(*arguments)
+    return (
+        (time.perf_counter() - start_time)
+        / (args["repeats"] * len(argument_lists[0]))
+        * 1000
+    )
+
+
+args = arg_parse()
+
+IMAGE_DIR = os.path.join(FILE_DIR, "..", "demo", "images")
+CONTRAST_PATH = os.path.join(
+    FILE_DIR, "..", "GMMDetector", "trained_parameters", f"{args['material']}_GMM.json"
+)
+CHANNELS = args["channels"].split(",")
+ENGINES = args["engines"].split(",")
+
+with open(CONTRAST_PATH) as f:
+    contrast_dict = json.load(f)
+
+images = [
+    cv2.medianBlur(cv2.imread(image_path), 5)
+    for image_path in sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg")))[
+        : args["num_image"]
+    ]
+]
+background_values = [
+    MaterialDetector.get_mean_background_values_numba(image) for image in images
+]
+contrast_images = [
+    MaterialDetector.calculate_contrast_image(image, mean_background_values)
+    for image, mean_background_values in zip(images, background_values)
+]
+
+print(f"{'channels':>8} {'kernel':>15} {'precision':>9} {'ms / image':>11}")
+for used_channels in CHANNELS:
+    for precision in MaterialDetector.PRECISIONS:
+        for engine in ENGINES:
+            detector = MaterialDetector(
+                contrast_dict=contrast_dict,
+                used_channels=used_channels,
+                engine=engine,
+                precision=precision,
+            )
+            latency = time_per_image(
+                detector._generate_layer_label_map, images, background_values
+            )
+            print(f"{used_channels:>8} {engine:>15} {precision:>9} {latency:>11.1f}")
+
+        # the distance maps of the legacy engine, the generic kernel includes the copy of the used channels
+        detector = MaterialDetector(
+            contrast_dict=contrast_dict,
+            used_channels=used_channels,
+            precision=precision,
+        )
+        used_channel_indexes = detector._get_used_channel_indexes()
+        used_means, used_inv_choleskys = detector._get_used_parameters(detector.dtype)
+        latency = time_per_image(
+            lambda contrast_image: generic_distance_map(
+                contrast_image[:, :, used_channel_indexes].astype(detector.dtype),
+                used_means,
+                used_inv_choleskys,
+            ),
+            contrast_images,
+        )
+        print(f"{used_channels:>8} {'generic map':>15} {precision:>9} {latency:>11.1f}")
+        latency = time_per_image(
+            detector.generate_mh_distance_map_from_contrast_image, contrast_images
+        )
+        print(
+            f"{used_channels:>8} {'unrolled map':>15} {precision:>9} {latency:>11.1f}"
+        )
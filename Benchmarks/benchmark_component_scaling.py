@@ -0,0 +1,108 @@
+"""
+This Benchmark measures how the latency of the pixel classification scales with the number of components of the model.
+Synthetic models with K components are generated around the contrasts of the Graphene model and run on the demo images.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(FILE_DIR, ".."))
+
+from GMMDetector import MaterialDetector
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Component Scaling Benchmark")
+    parser.add_argument("--components", dest="components", help="Comma separated numbers of components", default="2,4,8,16,32,64", type=str)
+    parser.add_argument("--engines", dest="engines", help="Comma separated engines to benchmark", default="fused,affine,unique", type=str)
+    parser.add_argument("--indexes", dest="indexes", help="Comma separated component indexes to benchmark", default="boxes,grid", type=str)
+    parser.add_argument("--num_image", dest="num_image", help="Number of images to process", default=4, type=int)
+    parser.add_argument("--repeats", dest="repeats", help="Number of timed runs per image", default=3, type=int)
+    parser.add_argument("--seed", dest="seed", help="Seed of the synthetic models", default=0, type=int)
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+def generate_contrast_dict(
+    num_components: int,
+    rng: np.random.Generator,
+) -> dict:
+    """Generates a synthetic model with the given number of components\n
+    The means are scattered between the background and the thickest Graphene layer, the covariances are random but of similar size as the trained ones.
+
+    Args:
+        num_components (int): The number of components of the model
+        rng (np.random.Generator): The random number generator
+
+    Returns:
+        dict: The contrast dictionary of the model
+    """
+    contrast_dict = {}
+    for component in range(num_components):
+        mean = rng.uniform(-0.6, 0.05, size=3)
+        scale = rng.normal(size=(3, 3)) * 0.015
+        covariance_matrix = scale @ scale.T + np.eye(3) * 1e-4
+        contrast_dict[str(component + 1)] = {
+            "contrast": {"b": mean[0], "g": mean[1], "r": mean[2]},
+            "covariance_matrix": covariance_matrix.tolist(),
+        }
+    return contrast_dict
+
+
+args = arg_parse()
+
+IMAGE_DIR = os.path.join(FILE_DIR, "..", "demo", "images")
+COMPONENTS = [int(num_components) for num_components in args["components"].split(",")]
+ENGINES = args["engines"].split(",")
+INDEXES = args["indexes"].split(",")
+
+rng = np.random.default_rng(args["seed"])
+images = [
+    cv2.medianBlur(cv2.imread(image_path), 5)
+    for image_path in sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg")))[
+        : args["num_image"]
+    ]
+]
+background_values = [
+    MaterialDetector.get_mean_background_values_numba(image) for image in images
+]
+
+print(f"{'K':>4} {'engine':>8} {'index':>6} {'ms / image':>11}")
+for num_components in COMPONENTS:
+    contrast_dict = generate_contrast_dict(num_components, rng)
+
+    for engine in ENGINES:
+        for component_index in INDEXES:
+            detector = MaterialDetector(
+                contrast_dict=contrast_dict,
+                engine=engine,
+                component_index=component_index,
+            )
+
+            # the first call compiles the kernels
+            detector.generate_label_map(images[0], background_values[0])
+
+            start_time = time.perf_counter()
+            for _ in range(args["repeats"]):
+                for image, mean_background_values in zip(images, background_values):
+                    detector.generate_label_map(image, mean_background_values)
+            latency = (time.perf_counter() - start_time) / (
+                args["repeats"] * len(images)
+            )
+
+            print(
+                f"{num_components:>4} {engine:>8} {component_index:>6} {latency * 1000:>11.1f}"
+            )
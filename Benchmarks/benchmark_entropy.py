@@ -0,0 +1,129 @@
+"""
+This Benchmark compares the numba entropy kernel of the detector with `skimage.filters.rank.entropy`.
+The flakes of the demo images are detected once, then the mean shannon entropy of all flakes is calculated with both implementations.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from skimage.filters.rank import entropy
+from skimage.morphology import disk
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(FILE_DIR, ".."))
+
+from GMMDetector import MaterialDetector
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Entropy Benchmark")
+    parser.add_argument("--material", dest="material", help="Material to process", default="Graphene", type=str)
+    parser.add_argument("--size", dest="size", help="Size threshold in pixels", default=200, type=int)
+    parser.add_argument("--repeats", dest="repeats", help="Number of timed runs per image", default=3, type=int)
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+def get_skimage_entropies(
+    gray_image: np.ndarray,
+    entropy_masks: list,
+    entropy_boxes: list,
+) -> np.ndarray:
+    """Calculates the mean shannon entropy of each flake with skimage
+
+    Args:
+        gray_image (np.ndarray): The gray image
+        entropy_masks (list): The eroded masks of the flakes cut out to their expanded bounding boxes
+        entropy_boxes (list): The expanded bounding boxes (x, y, w, h) of the flakes
+
+    Returns:
+        np.ndarray: The mean shannon entropy of each flake
+    """
+    mean_entropies = []
+    for (x, y, w, h), entropy_mask in zip(entropy_boxes, entropy_masks):
+        entropied_image_area = entropy(
+            gray_image[y : y + h, x : x + w],
+            footprint=disk(2),
+            mask=entropy_mask,
+        )
+        mean_entropies.append(cv2.mean(entropied_image_area, mask=entropy_mask)[0])
+    return np.array(mean_entropies)
+
+
+args = arg_parse()
+
+IMAGE_DIR = os.path.join(FILE_DIR, "..", "demo", "images")
+CONTRAST_PATH = os.path.join(
+    FILE_DIR, "..", "GMMDetector", "trained_parameters", f"{args['material']}_GMM.json"
+)
+
+with open(CONTRAST_PATH) as f:
+    contrast_dict = json.load(f)
+
+detector = MaterialDetector(
+    contrast_dict=contrast_dict,
+    size_threshold=args["size"],
+)
+
+skimage_time = 0
+numba_time = 0
+max_difference = 0
+num_flakes = 0
+
+for image_path in sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg"))):
+    image = cv2.imread(image_path)
+    flakes = detector(image)
+    if len(flakes) == 0:
+        continue
+
+    gray_image = cv2.cvtColor(cv2.medianBlur(image, 5), cv2.COLOR_BGR2GRAY)
+    entropy_boxes, entropy_masks = zip(
+        *[
+            MaterialDetector._get_entropy_mask(
+                flake.cropped_mask, flake.bounding_box, image.shape
+            )
+            for flake in flakes
+        ]
+    )
+    flat_masks = np.concatenate([mask.ravel() for mask in entropy_masks])
+    mask_offsets = np.cumsum([0] + [mask.size for mask in entropy_masks])
+    boxes = np.array(entropy_boxes, dtype=np.int64)
+
+    # the first call compiles the kernel
+    MaterialDetector._get_mean_entropies(gray_image, flat_masks, mask_offsets, boxes)
+
+    start_time = time.perf_counter()
+    for _ in range(args["repeats"]):
+        skimage_entropies = get_skimage_entropies(
+            gray_image, entropy_masks, entropy_boxes
+        )
+    skimage_time += time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for _ in range(args["repeats"]):
+        numba_entropies = MaterialDetector._get_mean_entropies(
+            gray_image, flat_masks, mask_offsets, boxes
+        )
+    numba_time += time.perf_counter() - start_time
+
+    max_difference = max(
+        max_difference, np.abs(skimage_entropies - numba_entropies).max()
+    )
+    num_flakes += len(flakes)
+
+print(f"Flakes:             {num_flakes}")
+print(f"Max Difference:     {max_difference:.2e}")
+print(f"skimage:            {skimage_time / args['repeats'] * 1000:.1f} ms")
+print(f"numba:              {numba_time / args['repeats'] * 1000:.1f} ms")
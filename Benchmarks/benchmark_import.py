@@ -0,0 +1,117 @@
+"""
+This Benchmark measures the time of `import GMMDetector` in fresh python processes.
+It reports the median import time and the slowest imported packages.
+With `--record` the result is appended as one json line to a file, so the import time can be tracked over releases.
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(FILE_DIR, "..")
+
+# the code of the measured process, it prints the import time in seconds
+CHILD_CODE = """
+import sys, time
+sys.path.append(sys.argv[1])
+start_time = time.perf_counter()
+import GMMDetector
+print(time.perf_counter() - start_time)
+"""
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Import Benchmark")
+    parser.add_argument("--runs", dest="runs", help="Number of fresh processes", default=10, type=int)
+    parser.add_argument("--top", dest="top", help="Number of slowest packages to report", default=10, type=int)
+    parser.add_argument("--record", dest="record", help="Append the result to this json lines file", default=None, type=str)
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+def get_import_time() -> float:
+    """Imports the detector in a fresh python process
+
+    Returns:
+        float: The import time in seconds
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, REPO_DIR],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip())
+
+
+def get_package_import_times() -> dict:
+    """Imports the detector in a fresh python process with `-X importtime`
+
+    Returns:
+        dict: The import time in seconds of each package including its submodules, slowest first
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_CODE, REPO_DIR],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    package_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # the self time of every module is summed up, the cumulative times would count nested packages twice
+        self_time, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        package_times[package] = package_times.get(package, 0) + int(self_time) / 1e6
+    return dict(sorted(package_times.items(), key=lambda item: item[1], reverse=True))
+
+
+def get_git_commit() -> str:
+    """Returns the short hash of the checked out commit, or an empty string outside of a git repository"""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return result.stdout.strip()
+
+
+args = arg_parse()
+
+import_times = sorted(get_import_time() for _ in range(args["runs"]))
+median_import_time = import_times[len(import_times) // 2]
+package_times = get_package_import_times()
+
+print(f"Median import time: {median_import_time:.3f} s ({args['runs']} runs)")
+print(f"Fastest / slowest:  {import_times[0]:.3f} s / {import_times[-1]:.3f} s")
+print()
+print(f"{'package':<20} {'time':>8}")
+for package, package_time in list(package_times.items())[: args["top"]]:
+    print(f"{package:<20} {package_time:>7.3f}s")
+
+if args["record"] is not None:
+    with open(args["record"], "a") as f:
+        record = {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": get_git_commit(),
+            "python": sys.version.split()[0],
+            "median_import_time": median_import_time,
+            "packages": dict(list(package_times.items())[: args["top"]]),
+        }
+        f.write(json.dumps(record) + "\n")
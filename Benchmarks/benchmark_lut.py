@@ -0,0 +1,112 @@
+"""
+This Benchmark compares the "lut" engine with the "fused" engine for several table sizes and background steps.
+The demo images are processed repeatedly like the frames of a scan, the first pass builds the lookup tables and the later passes reuse them.
+The label maps of both engines are compared pixel by pixel as accuracy check, the "lut" engine is expected to give the same labels.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(FILE_DIR, ".."))
+
+from GMMDetector import MaterialDetector
+from GMMDetector.structures import LabelLUTCache
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Lookup Table Benchmark")
+    parser.add_argument("--material", dest="material", help="Material to process", default="Graphene", type=str)
+    parser.add_argument("--precision", dest="precision", help="Precision of the detectors", default="float32", type=str)
+    parser.add_argument("--passes", dest="passes", help="Number of passes over the images", default=3, type=int)
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+args = arg_parse()
+
+IMAGE_DIR = os.path.join(FILE_DIR, "..", "demo", "images")
+CONTRAST_PATH = os.path.join(
+    FILE_DIR, "..", "GMMDetector", "trained_parameters", f"{args['material']}_GMM.json"
+)
+# the pairs of lut_bits and lut_background_step
+LUT_SETTINGS = [(8, 1.0), (8, 4.0), (7, 1.0), (6, 1.0)]
+
+with open(CONTRAST_PATH) as f:
+    contrast_dict = json.load(f)
+
+# the label maps are generated from the blurred images, just like in `detect_flakes`
+images = [
+    cv2.medianBlur(cv2.imread(path), 5)
+    for path in sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg")))
+]
+background_values = [
+    MaterialDetector.get_mean_background_values_numba(image) for image in images
+]
+
+fused_detector = MaterialDetector(
+    contrast_dict=contrast_dict,
+    precision=args["precision"],
+    engine="fused",
+    load_false_positive_detector=False,
+)
+fused_detector.generate_label_map(images[0], background_values[0])
+start_time = time.perf_counter()
+fused_label_maps = [
+    fused_detector.generate_label_map(image, background)
+    for image, background in zip(images, background_values)
+]
+fused_time = (time.perf_counter() - start_time) / len(images)
+
+print(f"Images: {len(images)}, passes: {args['passes']}")
+print(f"fused: {fused_time * 1000:.1f} ms / frame")
+print()
+print(
+    f"{'bits':>4} {'step':>5} {'Differing px':>13} {'Hits':>5} {'Misses':>7} {'first pass':>11} {'later passes':>13}"
+)
+for lut_bits, lut_background_step in LUT_SETTINGS:
+    detector = MaterialDetector(
+        contrast_dict=contrast_dict,
+        precision=args["precision"],
+        engine="lut",
+        lut_bits=lut_bits,
+        lut_background_step=lut_background_step,
+        load_false_positive_detector=False,
+    )
+    # the first call compiles the kernels, the fresh cache keeps the tables of all images
+    detector.generate_label_map(images[0], background_values[0])
+    detector.lut_cache = LabelLUTCache(max_entries=max(8, len(images)))
+
+    num_differing = 0
+    pass_times = []
+    for _ in range(args["passes"]):
+        start_time = time.perf_counter()
+        label_maps = [
+            detector.generate_label_map(image, background)
+            for image, background in zip(images, background_values)
+        ]
+        pass_times.append((time.perf_counter() - start_time) / len(images))
+        num_differing += sum(
+            np.count_nonzero(label_map != fused_label_map)
+            for label_map, fused_label_map in zip(label_maps, fused_label_maps)
+        )
+
+    later_time = np.mean(pass_times[1:]) if len(pass_times) > 1 else float("nan")
+    print(
+        f"{lut_bits:>4} {lut_background_step:>5.1f} {num_differing:>13} "
+        f"{detector.lut_cache.hits:>5} {detector.lut_cache.misses:>7} "
+        f"{pass_times[0] * 1000:>8.1f} ms {later_time * 1000:>10.1f} ms"
+    )
@@ -0,0 +1,105 @@
+"""
+This Benchmark compares the `DetectionPipeline` with a serial loop which reads, detects, draws and saves each image.
+The demo images are repeated to the given number of images, the overlays are saved as png to a temporary directory.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(FILE_DIR, ".."))
+
+from GMMDetector import DetectionPipeline, MaterialDetector
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Pipeline Benchmark")
+    parser.add_argument("--material", dest="material", help="Material to process", default="Graphene", type=str)
+    parser.add_argument("--size", dest="size", help="Size threshold in pixels", default=200, type=int)
+    parser.add_argument("--num_image", dest="num_image", help="Number of images to process", default=32, type=int)
+    parser.add_argument("--readers", dest="readers", help="Number of reader threads", default=2, type=int)
+    parser.add_argument("--detectors", dest="detectors", help="Number of detector threads", default=1, type=int)
+    parser.add_argument("--renderers", dest="renderers", help="Number of renderer threads", default=1, type=int)
+    parser.add_argument("--writers", dest="writers", help="Number of writer threads", default=2, type=int)
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+def render(image: np.ndarray, flakes) -> np.ndarray:
+    """Draws the outline of each flake on a copy of the image"""
+    image = image.copy()
+    for flake in flakes:
+        contour = cv2.morphologyEx(
+            flake.mask, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8)
+        )
+        image[contour > 0] = (0, 0, 255)
+    return image
+
+
+args = arg_parse()
+
+IMAGE_DIR = os.path.join(FILE_DIR, "..", "demo", "images")
+CONTRAST_PATH = os.path.join(
+    FILE_DIR, "..", "GMMDetector", "trained_parameters", f"{args['material']}_GMM.json"
+)
+
+with open(CONTRAST_PATH) as f:
+    contrast_dict = json.load(f)
+
+image_paths = sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg")))
+image_paths = [
+    image_paths[index % len(image_paths)] for index in range(args["num_image"])
+]
+
+detector = MaterialDetector(contrast_dict=contrast_dict, size_threshold=args["size"])
+detector.warmup()
+
+with tempfile.TemporaryDirectory() as out_dir:
+
+    def write(index: int, image: np.ndarray, flakes) -> None:
+        cv2.imwrite(os.path.join(out_dir, f"{index}.png"), image)
+
+    start_time = time.perf_counter()
+    for index, image_path in enumerate(image_paths):
+        image = cv2.imread(image_path)
+        flakes = detector.detect_flakes(image)
+        write(index, render(image, flakes), flakes)
+    serial_time = time.perf_counter() - start_time
+
+    pipeline = DetectionPipeline(
+        detector,
+        read=lambda index: cv2.imread(image_paths[index]),
+        render=render,
+        write=write,
+        readers=args["readers"],
+        detectors=args["detectors"],
+        renderers=args["renderers"],
+        writers=args["writers"],
+    )
+    start_time = time.perf_counter()
+    for _ in pipeline.run(range(len(image_paths))):
+        pass
+    pipeline_time = time.perf_counter() - start_time
+
+print(f"Images: {len(image_paths)}")
+print()
+print(f"{'variant':<10} {'total':>10} {'ms / image':>11}")
+for name, total_time in (("serial", serial_time), ("pipeline", pipeline_time)):
+    print(
+        f"{name:<10} {total_time:>9.2f}s {total_time / len(image_paths) * 1000:>11.1f}"
+    )
+print(f"Speedup: {serial_time / pipeline_time:.2f}x")
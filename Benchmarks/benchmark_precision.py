@@ -0,0 +1,118 @@
+"""
+This Benchmark compares the float32 and the float64 precision of the pixel classification.
+The label maps of both precisions are generated for every engine and the fraction of pixels with the same label is reported,
+together with the number of detected flakes and the time per image of the label map stage.
+By default the demo images are used, the test images of the GMM Detector Dataset are used as well if they are downloaded.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(FILE_DIR, ".."))
+
+from GMMDetector import MaterialDetector
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Precision Benchmark")
+    parser.add_argument("--material", dest="material", help="Material to process", default="Graphene", type=str)
+    parser.add_argument("--size", dest="size", help="Size threshold in pixels", default=200, type=int)
+    parser.add_argument("--max_images", dest="max_images", help="Maximal number of images per image folder", default=100, type=int)
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+args = arg_parse()
+
+CONTRAST_PATH = os.path.join(
+    FILE_DIR, "..", "GMMDetector", "trained_parameters", f"{args['material']}_GMM.json"
+)
+IMAGE_DIRS = [
+    os.path.join(FILE_DIR, "..", "demo", "images"),
+    os.path.join(
+        FILE_DIR,
+        "..",
+        "Datasets",
+        "GMMDetectorDatasets",
+        args["material"],
+        "test_images",
+    ),
+]
+
+with open(CONTRAST_PATH) as f:
+    contrast_dict = json.load(f)
+
+image_paths = []
+for image_dir in IMAGE_DIRS:
+    paths = sorted(
+        glob.glob(os.path.join(image_dir, "*.jpg"))
+        + glob.glob(os.path.join(image_dir, "*.png"))
+    )
+    image_paths.extend(paths[: args["max_images"]])
+
+raw_images = [cv2.imread(path) for path in image_paths]
+
+# the label maps are generated from the blurred images, just like in `detect_flakes`
+images = [cv2.medianBlur(image, 5) for image in raw_images]
+background_values = [
+    MaterialDetector.get_mean_background_values_numba(image) for image in images
+]
+print(f"Images: {len(images)}")
+print()
+
+print(
+    f"{'Engine':<8} {'Agreement':>12} {'Differing px':>13} {'Flakes 32/64':>13} {'float32':>10} {'float64':>10}"
+)
+for engine in MaterialDetector.ENGINES:
+    label_maps = {}
+    num_flakes = {}
+    times = {}
+    for precision in MaterialDetector.PRECISIONS:
+        detector = MaterialDetector(
+            contrast_dict=contrast_dict,
+            size_threshold=args["size"],
+            engine=engine,
+            precision=precision,
+        )
+
+        # the first call compiles the kernels
+        detector._generate_layer_label_map(images[0], background_values[0])
+
+        start_time = time.perf_counter()
+        label_maps[precision] = [
+            detector._generate_layer_label_map(image, background)
+            for image, background in zip(images, background_values)
+        ]
+        times[precision] = (time.perf_counter() - start_time) / len(images)
+
+        num_flakes[precision] = sum(
+            len(detector.detect_flakes(image, features=[])) for image in raw_images
+        )
+
+    num_pixels = sum(label_map.size for label_map in label_maps["float64"])
+    num_differing = sum(
+        np.count_nonzero(label_map_32 != label_map_64)
+        for label_map_32, label_map_64 in zip(
+            label_maps["float32"], label_maps["float64"]
+        )
+    )
+    agreement = 1 - num_differing / num_pixels
+    print(
+        f"{engine:<8} {agreement * 100:>11.5f}% {num_differing:>13} "
+        f"{num_flakes['float32']:>6}/{num_flakes['float64']:<6} "
+        f"{times['float32'] * 1000:>7.1f} ms {times['float64'] * 1000:>7.1f} ms"
+    )
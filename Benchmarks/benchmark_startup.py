@@ -0,0 +1,116 @@
+"""
+This Benchmark measures the time to the first result of the detector in a fresh process.
+Each run starts a new python process, which imports the detector, creates it and detects the flakes of one demo image.
+The first run starts with an empty numba cache and compiles all kernels, the later runs load the compiled kernels from the cache.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the code of the measured process, it prints its timings as json
+CHILD_CODE = """
+import json, sys, time
+start_time = time.perf_counter()
+sys.path.append(sys.argv[1])
+import cv2
+from GMMDetector import MaterialDetector
+import_time = time.perf_counter()
+with open(sys.argv[2]) as f:
+    contrast_dict = json.load(f)
+detector = MaterialDetector(contrast_dict=contrast_dict, size_threshold=int(sys.argv[4]), engine=sys.argv[5])
+init_time = time.perf_counter()
+if sys.argv[6] == "1":
+    detector.warmup()
+warmup_time = time.perf_counter()
+detector(cv2.imread(sys.argv[3]))
+first_result_time = time.perf_counter()
+detector(cv2.imread(sys.argv[3]))
+second_result_time = time.perf_counter()
+print(json.dumps({
+    "import": import_time - start_time,
+    "init": init_time - import_time,
+    "warmup": warmup_time - init_time,
+    "first": first_result_time - warmup_time,
+    "second": second_result_time - first_result_time,
+    "total": first_result_time - start_time,
+}))
+"""
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Startup Benchmark")
+    parser.add_argument("--material", dest="material", help="Material to process", default="Graphene", type=str)
+    parser.add_argument("--size", dest="size", help="Size threshold in pixels", default=200, type=int)
+    parser.add_argument("--engine", dest="engine", help="Engine of the detector", default="fused", type=str)
+    parser.add_argument("--runs", dest="runs", help="Number of runs with a filled cache", default=3, type=int)
+    parser.add_argument("--warmup", dest="warmup", help="Call warmup before the first frame", action="store_true")
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+def run_process(cache_dir: str) -> dict:
+    """Runs the detector in a fresh python process using the given numba cache
+
+    Args:
+        cache_dir (str): The directory of the numba cache
+
+    Returns:
+        dict: The timings of the process in seconds
+    """
+    environment = dict(os.environ, NUMBA_CACHE_DIR=cache_dir, PYTHONWARNINGS="ignore")
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            CHILD_CODE,
+            os.path.join(FILE_DIR, ".."),
+            CONTRAST_PATH,
+            IMAGE_PATH,
+            str(args["size"]),
+            args["engine"],
+            "1" if args["warmup"] else "0",
+        ],
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+args = arg_parse()
+
+CONTRAST_PATH = os.path.join(
+    FILE_DIR, "..", "GMMDetector", "trained_parameters", f"{args['material']}_GMM.json"
+)
+IMAGE_PATH = sorted(glob.glob(os.path.join(FILE_DIR, "..", "demo", "images", "*.jpg")))[
+    0
+]
+
+print(
+    f"{'run':<8} {'import':>8} {'init':>8} {'warmup':>8} {'first':>8} {'second':>8} {'total':>8}"
+)
+with tempfile.TemporaryDirectory() as cache_dir:
+    for run in range(args["runs"] + 1):
+        timings = run_process(cache_dir)
+        name = "cold" if run == 0 else f"cached {run}"
+        print(
+            f"{name:<8} "
+            + " ".join(
+                f"{timings[key]:>7.2f}s"
+                for key in ("import", "init", "warmup", "first", "second", "total")
+            )
+        )
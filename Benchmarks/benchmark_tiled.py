@@ -0,0 +1,127 @@
+"""
+This Benchmark compares `detect_flakes_tiled` on a memory mapped mosaic with `detect_flakes` on the mosaic loaded into memory.
+The mosaic is stitched from flipped copies of a demo image and stored as .npy file in a temporary directory.
+Each variant runs in a fresh python process, which reports its time and peak memory, and the detected flakes of both are compared.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the code of the measured process, it prints its timings, peak memory and flakes as json
+CHILD_CODE = """
+import json, resource, sys, time
+sys.path.append(sys.argv[1])
+import numpy as np
+from GMMDetector import MaterialDetector
+with open(sys.argv[2]) as f:
+    contrast_dict = json.load(f)
+detector = MaterialDetector(contrast_dict=contrast_dict, size_threshold=int(sys.argv[4]))
+detector.warmup()
+start_time = time.perf_counter()
+if sys.argv[5] == "whole":
+    flakes = detector.detect_flakes(np.load(sys.argv[3]))
+else:
+    mosaic = np.load(sys.argv[3], mmap_mode="r")
+    flakes = detector.detect_flakes_tiled(mosaic, halo=int(sys.argv[6]), memory_budget=int(sys.argv[7]) * 1024**2)
+print(json.dumps({
+    "time": time.perf_counter() - start_time,
+    "peak_memory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "flakes": sorted([flake.thickness, int(flake.size), list(flake.bounding_box)] for flake in flakes),
+}))
+"""
+
+
+def arg_parse() -> dict:
+    """
+    Parse arguments to the benchmark
+
+    Returns:
+        dict: Dictionary of arguments
+    """
+    # fmt: off
+    parser = argparse.ArgumentParser(description="2DMatGMM Tiled Detection Benchmark")
+    parser.add_argument("--material", dest="material", help="Material to process", default="Graphene", type=str)
+    parser.add_argument("--size", dest="size", help="Size threshold in pixels", default=200, type=int)
+    parser.add_argument("--repeats", dest="repeats", help="Number of image copies along each side of the mosaic", default=8, type=int)
+    parser.add_argument("--halo", dest="halo", help="Width of the halo of the tiles in pixels", default=256, type=int)
+    parser.add_argument("--memory_budget", dest="memory_budget", help="Memory budget of one tile in MiB", default=256, type=int)
+    # fmt: on
+    return vars(parser.parse_args())
+
+
+def run_process(mode: str) -> dict:
+    """Runs the detector on the mosaic in a fresh python process
+
+    Args:
+        mode (str): "whole" to load the mosaic into memory, "tiled" to process the memory mapped mosaic in tiles
+
+    Returns:
+        dict: The time, the peak memory in MiB and the detected flakes of the process
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            CHILD_CODE,
+            os.path.join(FILE_DIR, ".."),
+            CONTRAST_PATH,
+            mosaic_path,
+            str(args["size"]),
+            mode,
+            str(args["halo"]),
+            str(args["memory_budget"]),
+        ],
+        env=dict(os.environ, PYTHONWARNINGS="ignore"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+args = arg_parse()
+
+CONTRAST_PATH = os.path.join(
+    FILE_DIR, "..", "GMMDetector", "trained_parameters", f"{args['material']}_GMM.json"
+)
+IMAGE_PATH = sorted(glob.glob(os.path.join(FILE_DIR, "..", "demo", "images", "*.jpg")))[
+    -1
+]
+
+image = cv2.imread(IMAGE_PATH)
+with tempfile.TemporaryDirectory() as mosaic_dir:
+    # the copies are flipped, so the flakes at the seams are continued in the neighbouring copy
+    mosaic_path = os.path.join(mosaic_dir, "mosaic.npy")
+    rows = [
+        np.concatenate(
+            [
+                image[:: (-1) ** row, :: (-1) ** column]
+                for column in range(args["repeats"])
+            ],
+            axis=1,
+        )
+        for row in range(args["repeats"])
+    ]
+    np.save(mosaic_path, np.concatenate(rows, axis=0))
+    mosaic_shape = (image.shape[0] * args["repeats"], image.shape[1] * args["repeats"])
+    del rows
+
+    results = {mode: run_process(mode) for mode in ("whole", "tiled")}
+
+print(f"Mosaic: {mosaic_shape[1]} x {mosaic_shape[0]} pixels")
+print(f"Same flakes: {results['whole']['flakes'] == results['tiled']['flakes']}")
+print()
+print(f"{'variant':<8} {'time':>9} {'peak memory':>12} {'flakes':>7}")
+for mode, result in results.items():
+    print(
+        f"{mode:<8} {result['time']:>8.2f}s {result['peak_memory']:>8.0f} MiB {len(result['flakes']):>7}"
+    )
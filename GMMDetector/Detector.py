@@ -1,17 +1,300 @@
 import copy
+import hashlib
 import os
+import threading
+import warnings
 from textwrap import dedent
-from typing import List
+from typing import Callable, Iterable, List, Tuple, Union
 
 import cv2
 import numpy as np
-from joblib import load
-from numba import jit, prange
-from skimage.filters.rank import entropy
-from skimage.morphology import disk
-from sklearn.linear_model import LogisticRegression
+from numba import get_num_threads, jit, prange
 
-from .structures import Flake
+from .structures import DetectorWorkspace, Flake, FlakeTable, LabelLUTCache
+
+
+@jit(fastmath=True, nopython=True, nogil=True, inline="always")
+def _collect_candidate_components(
+    pixel_values: np.ndarray,
+    bounding_boxes: np.ndarray,
+    union_box: np.ndarray,
+    candidates: np.ndarray,
+    scores: np.ndarray,
+) -> int:
+    """
+    Collects the components whose bounding box contains the pixel, sorted nearest first\n
+    Used by the pixel kernels of the MaterialDetector to skip components which can not contain the pixel\n
+
+    Args:
+        pixel_values (np.ndarray): The raw values of the used channels of the pixel
+        bounding_boxes (np.ndarray): The bounding boxes of the components in raw pixel space of shape (K x 2 x C), lower and upper bounds
+        union_box (np.ndarray): The bounding box of all components of shape (2 x C)
+        candidates (np.ndarray): Output array of length K, filled with the indexes of the candidate components
+        scores (np.ndarray): Scratch array of length K for the distances used for the sorting
+
+    Returns:
+        int: The number of candidate components written to `candidates`
+    """
+    num_channels = pixel_values.shape[0]
+
+    # most pixels are rejected by the union of all boxes
+    for c in range(num_channels):
+        if pixel_values[c] < union_box[0, c] or pixel_values[c] > union_box[1, c]:
+            return 0
+
+    num_candidates = 0
+    for component_index in range(bounding_boxes.shape[0]):
+        score = 0.0
+        is_inside = True
+        for c in range(num_channels):
+            lower = bounding_boxes[component_index, 0, c]
+            upper = bounding_boxes[component_index, 1, c]
+            if pixel_values[c] < lower or pixel_values[c] > upper:
+                is_inside = False
+                break
+            # the offset to the center of the box relative to its size
+            offset = (2 * pixel_values[c] - lower - upper) / (upper - lower)
+            score += offset * offset
+
+        if not is_inside:
+            continue
+
+        # insertion sort, there are only a few candidates per pixel
+        position = num_candidates
+        while position > 0 and scores[position - 1] > score:
+            scores[position] = scores[position - 1]
+            candidates[position] = candidates[position - 1]
+            position -= 1
+        scores[position] = score
+        candidates[position] = component_index
+        num_candidates += 1
+
+    return num_candidates
+
+
+@jit(fastmath=True, nopython=True, nogil=True, inline="always")
+def _query_component_grid(
+    pixel_values: np.ndarray,
+    grid_bounds: np.ndarray,
+    grid_shape: np.ndarray,
+    cell_offsets: np.ndarray,
+    cell_components: np.ndarray,
+    candidates: np.ndarray,
+) -> int:
+    """
+    Looks up the components whose ellipsoid could contain the pixel in the uniform grid index\n
+    Used by the pixel kernels of the MaterialDetector for models with many components\n
+
+    Args:
+        pixel_values (np.ndarray): The raw values of the used channels of the pixel
+        grid_bounds (np.ndarray): The origin and the cell size of the grid in raw pixel space of shape (2 x C)
+        grid_shape (np.ndarray): The number of cells along each channel
+        cell_offsets (np.ndarray): The start of the component list of each cell in `cell_components`, of length cells + 1
+        cell_components (np.ndarray): The concatenated component lists of all cells, each sorted nearest first
+        candidates (np.ndarray): Output array of length K, filled with the indexes of the candidate components
+
+    Returns:
+        int: The number of candidate components written to `candidates`
+    """
+    cell_index = 0
+    for c in range(pixel_values.shape[0]):
+        cell = int(np.floor((pixel_values[c] - grid_bounds[0, c]) / grid_bounds[1, c]))
+        # pixels outside of the grid are outside of every ellipsoid
+        if cell < 0 or cell >= grid_shape[c]:
+            return 0
+        cell_index = cell_index * grid_shape[c] + cell
+
+    start = cell_offsets[cell_index]
+    num_candidates = cell_offsets[cell_index + 1] - start
+    for n in range(num_candidates):
+        candidates[n] = cell_components[start + n]
+    return num_candidates
+
+
+@jit(fastmath=True, nopython=True, nogil=True, inline="always")
+def _squared_mahalanobis_distance(
+    pixel: np.ndarray,
+    means: np.ndarray,
+    inv_choleskys: np.ndarray,
+    component_index: int,
+    bound: float,
+) -> float:
+    """
+    Calculates the squared Mahalanobis distance of the contrast of a pixel to one component of the Gaussian Mixture\n
+    The triangular product with the inverse cholesky matrix is unrolled for models with 1, 2 and 3 channels,
+    the calculation stops as soon as the distance reaches `bound`, as the distance only increases with more channels\n
+
+    Args:
+        pixel (np.ndarray): The contrast of the used channels of the pixel
+        means (np.ndarray): The means of the Gaussian Mixture of shape (K x C)
+        inv_choleskys (np.ndarray): The inverse cholesky matrices of the Gaussian Mixture of shape (K x C x C)
+        component_index (int): The index of the component
+        bound (float): The squared distance at which the calculation stops
+
+    Returns:
+        float: The squared distance, or a partial sum which is at least `bound`
+    """
+    ###################
+    # tmp_1 = inv_cholesky[0, 0] * diff[0]
+    # tmp_2 = inv_cholesky[1, 0] * diff[0] + inv_cholesky[1, 1] * diff[1]
+    # tmp_3 = inv_cholesky[2, 0] * diff[0] + inv_cholesky[2, 1] * diff[1] + inv_cholesky[2, 2] * diff[2]
+    # dist = tmp_1 **2 + tmp_2 **2 + tmp_3 **2
+    ###################
+    k = component_index
+    diff_0 = means[k, 0] - pixel[0]
+    tmp = diff_0 * inv_choleskys[k, 0, 0]
+    mh_dist = tmp * tmp
+    if pixel.shape[0] == 1 or mh_dist >= bound:
+        return mh_dist
+
+    diff_1 = means[k, 1] - pixel[1]
+    tmp = diff_0 * inv_choleskys[k, 1, 0] + diff_1 * inv_choleskys[k, 1, 1]
+    mh_dist += tmp * tmp
+    if pixel.shape[0] == 2 or mh_dist >= bound:
+        return mh_dist
+
+    diff_2 = means[k, 2] - pixel[2]
+    tmp = (
+        diff_0 * inv_choleskys[k, 2, 0]
+        + diff_1 * inv_choleskys[k, 2, 1]
+        + diff_2 * inv_choleskys[k, 2, 2]
+    )
+    return mh_dist + tmp * tmp
+
+
+@jit(fastmath=True, nopython=True, nogil=True, inline="always")
+def _squared_affine_distance(
+    pixel: np.ndarray,
+    affine_matrices: np.ndarray,
+    affine_offsets: np.ndarray,
+    component_index: int,
+    bound: float,
+) -> float:
+    """
+    Calculates the squared Mahalanobis distance of the raw values of a pixel to one component with the affine transforms of the "affine" engine\n
+    Like `_squared_mahalanobis_distance` the triangular product is unrolled for models with 1, 2 and 3 channels and stops early at `bound`\n
+
+    Args:
+        pixel (np.ndarray): The raw values of the used channels of the pixel
+        affine_matrices (np.ndarray): The lower triangular affine matrices of shape (K x C x C)
+        affine_offsets (np.ndarray): The affine offsets of shape (K x C)
+        component_index (int): The index of the component
+        bound (float): The squared distance at which the calculation stops
+
+    Returns:
+        float: The squared distance, or a partial sum which is at least `bound`
+    """
+    k = component_index
+    tmp = affine_offsets[k, 0] + affine_matrices[k, 0, 0] * pixel[0]
+    mh_dist = tmp * tmp
+    if pixel.shape[0] == 1 or mh_dist >= bound:
+        return mh_dist
+
+    tmp = (
+        affine_offsets[k, 1]
+        + affine_matrices[k, 1, 0] * pixel[0]
+        + affine_matrices[k, 1, 1] * pixel[1]
+    )
+    mh_dist += tmp * tmp
+    if pixel.shape[0] == 2 or mh_dist >= bound:
+        return mh_dist
+
+    tmp = (
+        affine_offsets[k, 2]
+        + affine_matrices[k, 2, 0] * pixel[0]
+        + affine_matrices[k, 2, 1] * pixel[1]
+        + affine_matrices[k, 2, 2] * pixel[2]
+    )
+    return mh_dist + tmp * tmp
+
+
+@jit(fastmath=True, nopython=True, nogil=True, inline="always")
+def _get_distance_bounds(
+    center: np.ndarray,
+    radius: np.ndarray,
+    means: np.ndarray,
+    inv_choleskys: np.ndarray,
+    column_norms: np.ndarray,
+    component_index: int,
+    num_rows: int,
+    rounding_error: float,
+) -> Tuple[float, float]:
+    """
+    Calculates the Mahalanobis distance of the center of a box in contrast space to one component and how much it changes within the box\n
+    Only the first `num_rows` rows of the triangular product are used, they only depend on the first `num_rows` channels
+    and give a lower bound of the full distance\n
+
+    Args:
+        center (np.ndarray): The center of the box in contrast space
+        radius (np.ndarray): The half width of the box along each channel
+        means (np.ndarray): The means of the Gaussian Mixture of shape (K x C)
+        inv_choleskys (np.ndarray): The inverse cholesky matrices of the Gaussian Mixture of shape (K x C x C)
+        column_norms (np.ndarray): The norms of the first `num_rows` rows of the columns of the inverse cholesky matrices of shape (K x C)
+        component_index (int): The index of the component
+        num_rows (int): The number of rows of the triangular product
+        rounding_error (float): The relative error of the distances calculated by the exact kernels
+
+    Returns:
+        Tuple[float, float]: The distance of the center and the margin, the distance of every point of the box differs by less than the margin
+    """
+    k = component_index
+    squared_distance = 0.0
+    margin = 0.0
+    scale = 1.0
+    for r in range(num_rows):
+        tmp = 0.0
+        for c in range(r + 1):
+            tmp += inv_choleskys[k, r, c] * (center[c] - means[k, c])
+        squared_distance += tmp * tmp
+        margin += radius[r] * column_norms[k, r]
+        scale += column_norms[k, r] * (abs(center[r]) + abs(means[k, r]) + 1)
+    distance = np.sqrt(squared_distance)
+    return distance, margin + rounding_error * (scale + distance)
+
+
+@jit(fastmath=True, nopython=True, nogil=True, inline="always")
+def _find_root(
+    parents: np.ndarray,
+    index: int,
+) -> int:
+    """
+    Finds the root of a pixel in the union find forest of the connected component labeling\n
+
+    Args:
+        parents (np.ndarray): The parent of each pixel, the root of a component is its first pixel in raster order
+        index (int): The flat index of the pixel
+
+    Returns:
+        int: The flat index of the root
+    """
+    while parents[index] != index:
+        index = parents[index]
+    return index
+
+
+@jit(fastmath=True, nopython=True, nogil=True, inline="always")
+def _union_roots(
+    parents: np.ndarray,
+    index_a: int,
+    index_b: int,
+) -> None:
+    """
+    Merges the components of two pixels, the root with the smaller flat index becomes the root of both\n
+    This keeps the parent of every pixel before the pixel in raster order.
+
+    Args:
+        parents (np.ndarray): The parent of each pixel
+        index_a (int): The flat index of the first pixel
+        index_b (int): The flat index of the second pixel
+    """
+    root_a = _find_root(parents, index_a)
+    root_b = _find_root(parents, index_b)
+    if root_a < root_b:
+        parents[root_b] = root_a
+        parents[index_b] = root_a
+    elif root_b < root_a:
+        parents[root_a] = root_b
+        parents[index_a] = root_b
 
 
 class MaterialDetector:
@@ -22,6 +305,41 @@ class MaterialDetector:
     https://arxiv.org/abs/2306.14845
     """
 
+    # The available engines for the pixel classification stage
+    # "legacy" builds the full K x H x W Mahalanobis distance map and postprocesses it
+    # "fused" classifies every pixel in a single pass directly from the uint8 image
+    # "affine" folds the contrast calculation into the whitening transform and works on the raw uint8 pixels
+    # "unique" only classifies the distinct colors of the image and scatters the labels back to the pixels
+    # "lut" classifies the pixels with a cached color lookup table built for the quantized background color
+    ENGINES = ("legacy", "fused", "affine", "unique", "lut")
+
+    # The entry of the lookup tables of the "lut" engine for colors whose label depends on the exact background color
+    # these pixels are classified with the "fused" kernel, so the engine gives the same labels as the exact engines
+    LUT_UNCERTAIN = 255
+
+    # The structures used to find the candidate components of a pixel
+    # "boxes" tests the bounding box of every component, "grid" looks up a uniform grid over the ellipsoids
+    # "auto" uses the grid for models with at least `COMPONENT_GRID_MIN_COMPONENTS` components
+    COMPONENT_INDEXES = ("auto", "boxes", "grid")
+    COMPONENT_GRID_MIN_COMPONENTS = 8
+    COMPONENT_GRID_SIZE = 16
+
+    # The optional features of the detected flakes, ordered by their cost
+    # the mask, thickness, size, center and sidelengths of a flake are always calculated
+    FLAKE_FEATURES = ("mean_contrast", "false_positive_probability", "entropy")
+
+    # The floating point precisions of the pixel classification stage
+    # the contrast and the Mahalanobis distances of the pixels are calculated in this precision
+    PRECISIONS = ("float32", "float64")
+
+    # The distance in pixels to the edge of a tile within which a flake is affected by the edge, see `detect_flakes_tiled`
+    # it covers the median blur, the opening of the label map and the expanded box of the entropy
+    TILE_CONTEXT = 32
+
+    # The maximum number of bands of rows with their own 3D color histogram in the fast reject pre-screen
+    # every band zeroes and merges a 1 MB histogram, so more bands than this make the pre-screen slower
+    COLOR_HISTOGRAM_MAX_BANDS = 8
+
     def __init__(
         self,
         contrast_dict: dict,
@@ -29,6 +347,15 @@ class MaterialDetector:
         standard_deviation_threshold: float = 5,
         used_channels: str = "BGR",
         false_positive_detector_path: str = None,
+        engine: str = "fused",
+        lut_bits: int = 8,
+        lut_background_step: float = 1.0,
+        lut_cache: LabelLUTCache = None,
+        fast_reject: bool = True,
+        component_index: str = "auto",
+        workspace: DetectorWorkspace = None,
+        precision: str = "float32",
+        load_false_positive_detector: bool = True,
         **kwargs,
     ):
         """
@@ -40,14 +367,78 @@ class MaterialDetector:
             standard_deviation_threshold (float, optional): The maximal standard deviation threshold for the GMM of the contrast in a flake. Defaults to 5.
             used_channels (str, optional): The used channels for the detection. Defaults to "BGR" meaning all channels are used, BG would mean only the Blue and Green channel.
             false_positive_detector_path (str, optional): The path to the false positive detector model. Defaults to r"..\FalsePositiveDetector\models\classifier_L2_logistic.joblib". This is relative to the location of the Detector.py file.
+            engine (str, optional): The engine used to classify the pixels, one of `MaterialDetector.ENGINES`. Defaults to "fused".
+            lut_bits (int, optional): The bits per channel of the lookup tables of the "lut" engine, 8 builds a 256³ table, 6 a 64³ table. Fewer bits leave more colors to the exact fallback. Defaults to 8.
+            lut_background_step (float, optional): The step the background color is quantized to before looking up a table of the "lut" engine. A larger step reuses the tables for more frames but leaves more colors to the exact fallback. Defaults to 1.0.
+            lut_cache (LabelLUTCache, optional): The cache of the lookup tables of the "lut" engine. Defaults to None, meaning a new cache with default limits is created.
+            fast_reject (bool, optional): If True frames in which no component can reach the size threshold are skipped using a coarse color histogram. Defaults to True.
+            component_index (str, optional): The structure used to find the candidate components of a pixel, one of `MaterialDetector.COMPONENT_INDEXES`. Defaults to "auto".
+            workspace (DetectorWorkspace, optional): The reusable buffers of `detect_flakes`. Defaults to None, meaning a new workspace is created.
+            precision (str, optional): The floating point precision of the pixel classification, one of `MaterialDetector.PRECISIONS`. Defaults to "float32".
+            load_false_positive_detector (bool, optional): If False no False Positive Detector is loaded, used by `from_spec` which sets the coefficients directly. Defaults to True.
         """
+        if engine not in MaterialDetector.ENGINES:
+            raise ValueError(
+                f"Unknown engine '{engine}', expected one of {MaterialDetector.ENGINES}"
+            )
+        if component_index not in MaterialDetector.COMPONENT_INDEXES:
+            raise ValueError(
+                f"Unknown component index '{component_index}', expected one of {MaterialDetector.COMPONENT_INDEXES}"
+            )
+        if precision not in MaterialDetector.PRECISIONS:
+            raise ValueError(
+                f"Unknown precision '{precision}', expected one of {MaterialDetector.PRECISIONS}"
+            )
+        if not 1 <= lut_bits <= 8:
+            raise ValueError(f"lut_bits has to be between 1 and 8, got {lut_bits}")
+        if lut_background_step <= 0:
+            raise ValueError(
+                f"lut_background_step has to be positive, got {lut_background_step}"
+            )
+        if engine == "lut" and len(contrast_dict) >= MaterialDetector.LUT_UNCERTAIN:
+            raise ValueError(
+                f"The lut engine supports at most {MaterialDetector.LUT_UNCERTAIN - 1} components, got {len(contrast_dict)}"
+            )
 
         self.contrast_dict = copy.deepcopy(contrast_dict)
         self.size_threshold = size_threshold
         self.standard_deviation_threshold = standard_deviation_threshold
         self.used_channels = used_channels
-
-        self._try_loading_fp_detector(false_positive_detector_path)
+        self.engine = engine
+        self.lut_bits = lut_bits
+        self.lut_background_step = lut_background_step
+        self.lut_cache = lut_cache if lut_cache is not None else LabelLUTCache()
+        self.fast_reject = fast_reject
+        self.component_index = component_index
+        self.workspace = workspace if workspace is not None else DetectorWorkspace()
+        self.precision = precision
+        self.dtype = np.dtype(precision)
+
+        # counts the frames checked and skipped by the fast reject, summed over all calls and threads
+        self.fast_reject_stats = {"checked": 0, "rejected": 0}
+        self._stats_lock = threading.Lock()
+
+        # counts the flake candidates removed by each stage in the last finished call of detect_flakes
+        # "layer" counts the skipped layers, as their candidates are never extracted
+        # each call collects its own statistics, which are also stored on the workspace of the call
+        self.pruning_stats = {"layer": 0, "size": 0, "confidence": 0, "max_flakes": 0}
+
+        # counts the tiles and the candidates skipped at the tile edges in the last finished call of detect_flakes_tiled
+        self.tiling_stats = {
+            "tiles": 0,
+            "halo_duplicates": 0,
+            "truncated": 0,
+            "recovered": 0,
+            "lost": 0,
+        }
+
+        # the coefficients of the False Positive Detector, if it can be scored directly
+        self.FP_Detector = None
+        self.FP_coefficients = None
+        self.FP_intercept = None
+        self.false_positive_detector_path = false_positive_detector_path
+        if load_false_positive_detector:
+            self._try_loading_fp_detector(false_positive_detector_path)
 
         # add some more keys to the contrast_dict
         # the inverse of the cholesky decomposition of the covariance matrix in order to speed up the calculation of the distance
@@ -84,7 +475,18 @@ class MaterialDetector:
         self.contrast_means = np.array(self.contrast_means)
         self.inv_cholesky_matrices = np.array(self.inv_cholesky_matrices)
 
-    def _get_used_channel_indexes(self) -> List[int]:
+        # the parameters restricted to the used channels are sliced once and reused for every frame
+        self._used_parameters = {}
+        self._get_used_parameters(np.float64)
+        self._get_used_parameters(self.dtype)
+
+        # the grid index only depends on the model, so it is built once
+        self._component_grid_key = None
+        self._component_grid = None
+        if self._uses_component_grid():
+            self._get_component_grid()
+
+    def _get_used_channel_indexes(self) -> np.ndarray:
         """
         Interprets the used_channels string and returns the indexes of the used channels\n
         An example:\n
@@ -92,7 +494,7 @@ class MaterialDetector:
         "GR" -> [1,2]\n
 
         Returns:
-            List[int]: The indexes of the used channels
+            np.ndarray: The indexes of the used channels
         """
         used_channel_indexes = []
         for channel in self.used_channels:
@@ -105,7 +507,248 @@ class MaterialDetector:
         used_channel_indexes.sort()
         return np.array(used_channel_indexes)
 
+    def _get_used_parameters(
+        self,
+        dtype: np.dtype = np.float64,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the means and inverse cholesky matrices of the Gaussian Mixture restricted to the used channels\n
+        The arrays are contiguous so the numba kernels can be specialized for them,
+        they are sliced once for each used channels and dtype and must not be modified\n
+
+        Args:
+            dtype (np.dtype, optional): The dtype of the returned arrays, the pixel kernels use the precision of the detector. Defaults to np.float64.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The means of shape (K x C) and the inverse cholesky matrices of shape (K x C x C)
+        """
+        key = (self.used_channels, np.dtype(dtype).str)
+        if key in self._used_parameters:
+            return self._used_parameters[key]
+
+        used_channel_indexes = self._get_used_channel_indexes()
+        used_means = np.ascontiguousarray(
+            self.contrast_means[:, used_channel_indexes], dtype=dtype
+        )
+        used_inv_choleskys = np.ascontiguousarray(
+            self.inv_cholesky_matrices[:, used_channel_indexes, :][
+                :, :, used_channel_indexes
+            ],
+            dtype=dtype,
+        )
+        self._used_parameters[key] = (used_means, used_inv_choleskys)
+        return used_means, used_inv_choleskys
+
+    def _get_contrast_bounding_boxes(self) -> np.ndarray:
+        """
+        Calculates the axis aligned bounding boxes of the components at the standard deviation threshold in contrast space\n
+        The half width of the ellipsoid along channel i is the threshold times the standard deviation of that channel\n
+
+        Returns:
+            np.ndarray: The bounding boxes of shape (K x 2 x C) with the lower and upper bounds of the used channels
+        """
+        used_means, used_inv_choleskys = self._get_used_parameters()
+
+        # the covariance of the used channels is (L^T L)^-1 = L^-1 L^-T
+        cholesky_matrices = np.linalg.inv(used_inv_choleskys)
+        variances = np.einsum("kch,kch->kc", cholesky_matrices, cholesky_matrices)
+        half_widths = self.standard_deviation_threshold * np.sqrt(variances)
+
+        return np.stack(
+            [used_means - half_widths, used_means + half_widths],
+            axis=1,
+        )
+
+    def _get_pixel_bounding_boxes(
+        self,
+        mean_background_values: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Converts the bounding boxes of the components from contrast space into raw pixel space for one image\n
+        The boxes are widened slightly to account for the rounding of the fastmath kernels\n
+
+        Args:
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+
+        Returns:
+            np.ndarray: The bounding boxes of shape (K x 2 x C) with the lower and upper bounds of the used channels
+        """
+        background_values = np.asarray(mean_background_values, dtype=np.float64)[
+            self._get_used_channel_indexes()
+        ]
+        pixel_bounding_boxes = (
+            self._get_contrast_bounding_boxes() + 1
+        ) * background_values
+        pixel_bounding_boxes[:, 0] -= 1e-6 * background_values
+        pixel_bounding_boxes[:, 1] += 1e-6 * background_values
+        return np.ascontiguousarray(pixel_bounding_boxes)
+
+    def _get_rounding_error(self) -> float:
+        """
+        Returns the relative rounding error of the Mahalanobis distances calculated by the kernels in the working precision\n
+        A generous multiple of the machine epsilon also covers the reordering of the operations by fastmath,
+        the bounds of the fast reject and of the lookup tables add it to their margins\n
+
+        Returns:
+            float: The relative rounding error
+        """
+        return 64 * float(np.finfo(self.dtype).eps)
+
+    def _get_squared_distance_lower_bounds(
+        self,
+        box_centers: np.ndarray,
+        box_radii: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Calculates a lower bound of the squared Mahalanobis distance of axis aligned boxes in contrast space to each component\n
+        The whitened box y = L (x - mean) is enclosed by an axis aligned box,
+        the squared distance of that box to the origin never overestimates the distance of any point of the box\n
+
+        Args:
+            box_centers (np.ndarray): The centers of the boxes of shape (N x C), only containing the used channels
+            box_radii (np.ndarray): The half widths of the boxes of shape (N x C), only containing the used channels
+
+        Returns:
+            np.ndarray: The lower bounds of the squared distances of shape (N x K)
+        """
+        used_means, used_inv_choleskys = self._get_used_parameters()
+
+        # shape (N x K x C)
+        whitened_centers = np.einsum(
+            "kch,nkh->nkc",
+            used_inv_choleskys,
+            box_centers[:, None, :] - used_means[None, :, :],
+        )
+        whitened_radii = np.einsum("kch,nh->nkc", np.abs(used_inv_choleskys), box_radii)
+
+        return (np.maximum(np.abs(whitened_centers) - whitened_radii, 0) ** 2).sum(
+            axis=2
+        )
+
+    def _uses_component_grid(self) -> bool:
+        """
+        Checks if the pixel kernels use the grid index or the bounding boxes to find the candidate components\n
+
+        Returns:
+            bool: True if the grid index is used
+        """
+        if self.component_index == "auto":
+            return (
+                len(self.contrast_means)
+                >= MaterialDetector.COMPONENT_GRID_MIN_COMPONENTS
+            )
+        return self.component_index == "grid"
+
+    def _get_component_grid(self) -> Tuple[np.ndarray, ...]:
+        """
+        Returns the uniform grid index over the component ellipsoids in contrast space\n
+        The grid spans the union of the bounding boxes, each cell lists the components whose ellipsoid could intersect it
+        sorted by their distance to the cell, so the early exit of the kernels triggers sooner\n
+        The grid is rebuilt if the threshold or the used channels changed since it was built\n
+
+        Returns:
+            Tuple[np.ndarray, ...]: The origin and the cell size of the grid of shape (2 x C), the number of cells along each channel,
+            the start of the component list of each cell and the concatenated component lists
+        """
+        key = (self.used_channels, float(self.standard_deviation_threshold))
+        if self._component_grid_key == key:
+            return self._component_grid
+
+        bounding_boxes = self._get_contrast_bounding_boxes()
+        grid_lower = bounding_boxes[:, 0].min(axis=0)
+        grid_upper = bounding_boxes[:, 1].max(axis=0)
+        num_channels = grid_lower.shape[0]
+
+        grid_shape = np.full(num_channels, MaterialDetector.COMPONENT_GRID_SIZE)
+        cell_size = (grid_upper - grid_lower) / grid_shape
+
+        # all cells in C order, the same order the kernels use to flatten the cell index
+        cells = np.indices(grid_shape).reshape(num_channels, -1).T
+        cell_centers = grid_lower + (cells + 0.5) * cell_size
+        cell_radii = np.broadcast_to(cell_size / 2 * (1 + 1e-6), cell_centers.shape)
+
+        squared_lower_bounds = self._get_squared_distance_lower_bounds(
+            cell_centers, cell_radii
+        )
+        is_candidate = squared_lower_bounds <= self.standard_deviation_threshold**2 * (
+            1 + 1e-6
+        )
+
+        cell_offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+        cell_offsets[1:] = np.cumsum(is_candidate.sum(axis=1))
+        cell_components = np.concatenate(
+            [
+                order[is_candidate[cell_index, order]]
+                for cell_index, order in enumerate(
+                    np.argsort(squared_lower_bounds, axis=1, kind="stable")
+                )
+            ]
+        ).astype(np.int64)
+
+        self._component_grid_key = key
+        self._component_grid = (
+            np.stack([grid_lower, cell_size]),
+            grid_shape.astype(np.int64),
+            cell_offsets,
+            cell_components,
+        )
+        return self._component_grid
+
+    def _get_pixel_component_index(
+        self,
+        mean_background_values: np.ndarray,
+    ) -> Tuple[np.ndarray, ...]:
+        """
+        Returns the structures the pixel kernels use to find the candidate components, converted into raw pixel space\n
+        If the bounding boxes are used, the grid arrays are empty\n
+
+        Args:
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+
+        Returns:
+            Tuple[np.ndarray, ...]: The bounding boxes of shape (K x 2 x C), the origin and the cell size of the grid of shape (2 x C),
+            the number of cells along each channel, the start of the component list of each cell and the concatenated component lists
+        """
+        bounding_boxes = self._get_pixel_bounding_boxes(mean_background_values)
+
+        if not self._uses_component_grid():
+            num_channels = bounding_boxes.shape[2]
+            return (
+                bounding_boxes,
+                np.ones(shape=(2, num_channels), dtype=np.float64),
+                np.zeros(num_channels, dtype=np.int64),
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64),
+            )
+
+        (
+            grid_bounds,
+            grid_shape,
+            cell_offsets,
+            cell_components,
+        ) = self._get_component_grid()
+        background_values = np.asarray(mean_background_values, dtype=np.float64)[
+            self._get_used_channel_indexes()
+        ]
+        pixel_grid_bounds = np.stack(
+            [
+                (grid_bounds[0] + 1) * background_values,
+                grid_bounds[1] * background_values,
+            ]
+        )
+        return (
+            bounding_boxes,
+            pixel_grid_bounds,
+            grid_shape,
+            cell_offsets,
+            cell_components,
+        )
+
     def _try_loading_fp_detector(self, path: str) -> None:
+        # joblib and sklearn take more than a second to import, so they are only imported when a detector is loaded
+        from joblib import load
+        from sklearn.linear_model import LogisticRegression
+
         try:
             if path is None:
                 detector_path = os.path.join(
@@ -120,6 +763,14 @@ class MaterialDetector:
 
             self.FP_Detector: LogisticRegression = load(detector_path)
 
+            # a binary logistic regression is scored directly with its coefficients
+            # this avoids the input validation of sklearn on every call
+            if isinstance(self.FP_Detector, LogisticRegression) and (
+                self.FP_Detector.coef_.shape[0] == 1
+            ):
+                self.FP_coefficients = self.FP_Detector.coef_[0].astype(np.float64)
+                self.FP_intercept = float(self.FP_Detector.intercept_[0])
+
         except FileNotFoundError as e:
             print(
                 dedent(
@@ -136,8 +787,133 @@ class MaterialDetector:
     def __call__(
         self,
         image: np.ndarray,
-    ) -> List[Flake]:
-        return self.detect_flakes(image)
+        **kwargs,
+    ) -> Union[List[Flake], FlakeTable]:
+        return self.detect_flakes(image, **kwargs)
+
+    def to_spec(self) -> dict:
+        """
+        Returns a compact description of the detector, from which `from_spec` creates an equal detector\n
+        The description only contains the contrast dictionary, the parameters of the detector and the coefficients of the False Positive Detector,
+        it can be stored as json and is cheap to send to other processes. A False Positive Detector which can not be scored with its coefficients
+        is described by its path and loaded again\n
+
+        Returns:
+            dict: The description of the detector
+        """
+        spec = {
+            "contrast_dict": copy.deepcopy(self.contrast_dict),
+            "size_threshold": self.size_threshold,
+            "standard_deviation_threshold": self.standard_deviation_threshold,
+            "used_channels": self.used_channels,
+            "engine": self.engine,
+            "lut_bits": self.lut_bits,
+            "lut_background_step": self.lut_background_step,
+            "fast_reject": self.fast_reject,
+            "component_index": self.component_index,
+            "precision": self.precision,
+            "false_positive_coefficients": None,
+            "false_positive_intercept": None,
+            "false_positive_detector_path": None,
+        }
+        if self.FP_coefficients is not None:
+            spec["false_positive_coefficients"] = self.FP_coefficients.tolist()
+            spec["false_positive_intercept"] = self.FP_intercept
+        elif self.FP_Detector is not None:
+            spec["false_positive_detector_path"] = self.false_positive_detector_path
+        return spec
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> "MaterialDetector":
+        """
+        Creates a detector from the description returned by `to_spec`\n
+        sklearn and joblib are not imported if the description contains the coefficients of the False Positive Detector\n
+
+        Args:
+            spec (dict): The description of the detector
+
+        Returns:
+            MaterialDetector: The detector
+        """
+        spec = dict(spec)
+        coefficients = spec.pop("false_positive_coefficients")
+        intercept = spec.pop("false_positive_intercept")
+        path = spec.pop("false_positive_detector_path")
+
+        detector = cls(**spec, load_false_positive_detector=False)
+        if coefficients is not None:
+            detector.FP_coefficients = np.asarray(coefficients, dtype=np.float64)
+            detector.FP_intercept = float(intercept)
+        elif path is not None:
+            detector.false_positive_detector_path = path
+            detector._try_loading_fp_detector(path)
+        return detector
+
+    def _get_warmup_image(self) -> np.ndarray:
+        """
+        Creates a synthetic frame with one square flake per layer on a gray background\n
+        The squares are larger than the size threshold and colored with the mean contrast of their layer,
+        so every stage of `detect_flakes` runs on the frame\n
+
+        Returns:
+            np.ndarray: The frame of shape H x W x 3, dtype=np.uint8
+        """
+        background_value = 128
+        side = int(np.ceil(np.sqrt(self.size_threshold))) + 16
+        gap = 16
+        num_layers = len(self.contrast_means)
+
+        # the background has to stay the most frequent color of the frame
+        image = np.full(
+            shape=(3 * side, num_layers * (side + gap) + gap, 3),
+            fill_value=background_value,
+            dtype=np.uint8,
+        )
+        for layer_index, contrast_mean in enumerate(self.contrast_means):
+            x = gap + layer_index * (side + gap)
+            image[side : 2 * side, x : x + side] = np.clip(
+                np.round(background_value * (1 + contrast_mean)), 0, 255
+            )
+        return image
+
+    def warmup(
+        self,
+        background: bool = False,
+    ) -> Union[threading.Thread, None]:
+        """
+        Compiles the numba kernels used by `detect_flakes` by running it on a small synthetic frame\n
+        The kernels are cached on disk, so only the first process compiles them, later processes only load them.
+        The warm-up runs on a copy of the detector with its own workspace and lookup table cache, the statistics, buffers and cached tables of the detector are not changed\n
+        A warm-up in the background has to be joined before the detector is used. It runs the parallel kernels, which must not run
+        in two threads at the same time with the default "workqueue" threading layer of numba, see `DetectionPipeline`\n
+
+        Args:
+            background (bool, optional): If True the warm-up runs in a daemon thread, e.g. while the first frames are loaded. Defaults to False.
+
+        Returns:
+            Union[threading.Thread, None]: The started thread if `background` is True, which has to be joined before the first detection, else None
+        """
+        detector = copy.copy(self)
+        detector.workspace = DetectorWorkspace()
+        # the table of the synthetic background would take the place of a real one in the cache
+        detector.lut_cache = LabelLUTCache(max_entries=1)
+        detector.fast_reject_stats = {"checked": 0, "rejected": 0}
+        detector._stats_lock = threading.Lock()
+        image = self._get_warmup_image()
+
+        if not background:
+            detector.detect_flakes(image, features=self.FLAKE_FEATURES)
+            return None
+
+        thread = threading.Thread(
+            target=detector.detect_flakes,
+            args=(image,),
+            kwargs={"features": self.FLAKE_FEATURES},
+            name="MaterialDetectorWarmup",
+            daemon=True,
+        )
+        thread.start()
+        return thread
 
     @staticmethod
     def get_mean_background_values(
@@ -193,7 +969,7 @@ class MaterialDetector:
         return mean_background_values
 
     @staticmethod
-    @jit(parallel=True, fastmath=True, nopython=True, nogil=True)
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
     def get_mean_background_values_numba(
         image: np.ndarray, radius: int = 5, min_value: int = 20, max_value: int = 230
     ) -> np.ndarray:
@@ -242,7 +1018,260 @@ class MaterialDetector:
         return means
 
     @staticmethod
-    @jit(parallel=True, fastmath=True, nopython=True, nogil=True)
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _get_color_histograms(
+        image: np.ndarray,
+        color_histograms: np.ndarray,
+        shift: int = 2,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates a coarse 3D color histogram and the full histogram of each channel in one pass over the image\n
+
+        Args:
+            image (NxMx3 Numpy Array): The image to calculate the histograms from.
+            color_histograms (np.ndarray): Scratch space for the 3D histogram of each band of rows of shape (T x B x B x B), dtype=np.int32, see `_get_color_histogram_buffer`
+            shift (int, optional): The number of dropped bits per channel of the 3D histogram, 2 results in 64 bins per channel. Defaults to 2.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The 3D histogram of shape (B x B x B) indexed by the binned B, G and R values
+            and the histograms of each channel of shape (3 x 256), both dtype=np.int64
+        """
+        num_bands = min(image.shape[0], color_histograms.shape[0])
+
+        # each band of rows gets its own histograms so the rows can be processed in parallel
+        channel_histograms = np.zeros(shape=(num_bands, 3, 256), dtype=np.int64)
+
+        for band in prange(num_bands):
+            color_histograms[band] = 0
+            for i in range(band, image.shape[0], num_bands):
+                for j in range(image.shape[1]):
+                    b = image[i, j, 0]
+                    g = image[i, j, 1]
+                    r = image[i, j, 2]
+                    color_histograms[band, b >> shift, g >> shift, r >> shift] += 1
+                    channel_histograms[band, 0, b] += 1
+                    channel_histograms[band, 1, g] += 1
+                    channel_histograms[band, 2, r] += 1
+
+        # the bands are merged in parallel over the bins of the first channel
+        color_histogram = np.empty(shape=color_histograms.shape[1:], dtype=np.int64)
+        for b in prange(color_histogram.shape[0]):
+            color_histogram[b] = color_histograms[0, b]
+            for band in range(1, num_bands):
+                color_histogram[b] += color_histograms[band, b]
+        return color_histogram, channel_histograms.sum(axis=0)
+
+    @staticmethod
+    def _get_color_histogram_buffer(workspace: DetectorWorkspace) -> np.ndarray:
+        """
+        Returns the scratch space of `_get_color_histograms` from the workspace\n
+        There is one band per thread, but at most `COLOR_HISTOGRAM_MAX_BANDS`, as each band adds the zeroing and merging of a 3D histogram\n
+
+        Args:
+            workspace (DetectorWorkspace): The workspace of the call
+
+        Returns:
+            np.ndarray: The buffer of shape (T x 64 x 64 x 64), dtype=np.int32
+        """
+        num_bands = min(get_num_threads(), MaterialDetector.COLOR_HISTOGRAM_MAX_BANDS)
+        return workspace.get("color_histograms", (num_bands, 64, 64, 64), np.int32)
+
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _get_color_histograms_batch(
+        images: np.ndarray,
+        color_histograms: np.ndarray,
+        band_histograms: np.ndarray,
+        shift: int = 2,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates the coarse 3D color histogram and the histograms of the channels of every image of a stack in one call\n
+        The pairs of frames and bands of rows are processed in parallel, so a stack with fewer frames than threads still uses all threads.
+        The histograms are the same as those of `_get_color_histograms`\n
+
+        Args:
+            images (np.ndarray): The images of shape N x H x W x 3, dtype=np.uint8
+            color_histograms (np.ndarray): The output 3D histograms of shape (N x B x B x B), dtype=np.int32, they are overwritten
+            band_histograms (np.ndarray): Scratch space for the 3D histogram of each band of shape (N * T x B x B x B) with T bands per frame, dtype=np.int32,
+                with one band per frame the output histograms are passed, see `_get_color_histogram_buffers_batch`
+            shift (int, optional): The number of dropped bits per channel of the 3D histogram, 2 results in 64 bins per channel. Defaults to 2.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The 3D histograms of shape (N x B x B x B), dtype=np.int32,
+            and the histograms of each channel of shape (N x 3 x 256), dtype=np.int64
+        """
+        num_images = images.shape[0]
+        num_bands = band_histograms.shape[0] // num_images
+        band_channel_histograms = np.zeros(
+            shape=(num_images * num_bands, 3, 256), dtype=np.int64
+        )
+
+        for pair in prange(num_images * num_bands):
+            n = pair // num_bands
+            band_histograms[pair] = 0
+            for i in range(pair % num_bands, images.shape[1], num_bands):
+                for j in range(images.shape[2]):
+                    b = images[n, i, j, 0]
+                    g = images[n, i, j, 1]
+                    r = images[n, i, j, 2]
+                    band_histograms[pair, b >> shift, g >> shift, r >> shift] += 1
+                    band_channel_histograms[pair, 0, b] += 1
+                    band_channel_histograms[pair, 1, g] += 1
+                    band_channel_histograms[pair, 2, r] += 1
+
+        # the bands of each frame are merged in parallel over the frames and the bins of the first channel
+        if num_bands > 1:
+            num_bins = color_histograms.shape[1]
+            for index in prange(num_images * num_bins):
+                n = index // num_bins
+                b = index % num_bins
+                color_histograms[n, b] = band_histograms[n * num_bands, b]
+                for band in range(1, num_bands):
+                    color_histograms[n, b] += band_histograms[n * num_bands + band, b]
+
+        channel_histograms = band_channel_histograms.reshape(
+            (num_images, num_bands, 3, 256)
+        ).sum(axis=1)
+        return color_histograms, channel_histograms
+
+    @staticmethod
+    def _get_color_histogram_buffers_batch(
+        workspace: DetectorWorkspace,
+        num_images: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the output and the scratch space of `_get_color_histograms_batch` from the workspace\n
+        The threads are split over the frames, each frame gets at most `COLOR_HISTOGRAM_MAX_BANDS` bands.
+        With one band per frame the bands are the output histograms, so no scratch space is needed\n
+
+        Args:
+            workspace (DetectorWorkspace): The workspace of the call
+            num_images (int): The number of images of the stack
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The output histograms of shape (N x 64 x 64 x 64) and the band histograms of shape (N * T x 64 x 64 x 64), dtype=np.int32
+        """
+        color_histograms = workspace.get(
+            "color_histograms_batch", (num_images, 64, 64, 64), np.int32
+        )
+        num_bands = min(
+            -(-get_num_threads() // num_images),
+            MaterialDetector.COLOR_HISTOGRAM_MAX_BANDS,
+        )
+        if num_bands == 1:
+            return color_histograms, color_histograms
+        return color_histograms, workspace.get(
+            "color_histograms", (num_images * num_bands, 64, 64, 64), np.int32
+        )
+
+    @staticmethod
+    def _get_mean_background_values_from_histograms(
+        channel_histograms: np.ndarray,
+        radius: int = 5,
+        min_value: int = 20,
+        max_value: int = 230,
+    ) -> np.ndarray:
+        """
+        Calculates the mean background values for each channel from the histograms of the channels\n
+        Gives the same result as `get_mean_background_values_numba` without another pass over the image\n
+
+        Args:
+            channel_histograms (3x256 Numpy Array): The histograms of each channel, see `_get_color_histograms`
+            radius (int, optional): The size of the area around the mode of the histogram used for the calcuations. Defaults to 5.
+            min_value (int, optional): The minimum value of the histogram used for the calcuations, everything under this value will not be used. Defaults to 20.
+            max_value (int, optional): The maximum value of the histogram used for the calcuations, everything above this value will not be used. Defaults to 230.
+
+        Returns:
+            np.ndarray: The mean background values for each channel in form BGR, dtype=np.float32
+        """
+        means = np.zeros(3, dtype=np.float32)
+        values = np.arange(256)
+
+        for channel in range(3):
+            count = channel_histograms[channel]
+            mode_value = np.argmax(count[min_value : max_value + 1]) + min_value
+
+            lower_bound = max(min_value, mode_value - radius)
+            upper_bound = min(max_value, mode_value + radius)
+
+            num_values = count[lower_bound : upper_bound + 1].sum()
+            sum_values = (
+                values[lower_bound : upper_bound + 1]
+                * count[lower_bound : upper_bound + 1]
+            ).sum()
+
+            means[channel] = sum_values / num_values if num_values > 0 else 0
+
+        return means
+
+    def _could_contain_flakes(
+        self,
+        color_histogram: np.ndarray,
+        mean_background_values: np.ndarray,
+    ) -> bool:
+        """
+        Checks if any component could be assigned at least `size_threshold` pixels\n
+        Every occupied bin of the color histogram is a box in contrast space, a bin is counted for a component
+        if a lower bound of the Mahalanobis distance of the box to the component is within the standard deviation threshold\n
+        The bound never overestimates the distance, so a frame is only rejected if the full detection would not find any flake\n
+
+        Args:
+            color_histogram (np.ndarray): The 3D color histogram of shape (B x B x B), see `_get_color_histograms`
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+
+        Returns:
+            bool: False if no flake can be detected in the frame
+        """
+        used_channel_indexes = self._get_used_channel_indexes()
+        bin_width = 256 // color_histogram.shape[0]
+
+        occupied_bins = np.argwhere(color_histogram > 0)
+        bin_counts = color_histogram[tuple(occupied_bins.T)]
+
+        background_values = np.asarray(mean_background_values, dtype=np.float64)[
+            used_channel_indexes
+        ]
+        # the contrast is undefined for a black or saturated background, so the full detection decides
+        if np.any(background_values <= 0):
+            return True
+
+        # the range of pixel values of each bin converted to contrast, shape (N x C)
+        lower_contrast = (
+            occupied_bins[:, used_channel_indexes] * bin_width
+        ) / background_values - 1
+        upper_contrast = (
+            (occupied_bins[:, used_channel_indexes] + 1) * bin_width - 1
+        ) / background_values - 1
+        box_centers = (lower_contrast + upper_contrast) / 2
+        box_radii = (upper_contrast - lower_contrast) / 2
+
+        squared_lower_bounds = self._get_squared_distance_lower_bounds(
+            box_centers, box_radii
+        )
+
+        # the bounds are calculated in float64, but the kernels calculate the distances in the working precision
+        # so the threshold is raised by their rounding error, which grows with the contrast and the means weighted with the column norms
+        used_means, used_inv_choleskys = self._get_used_parameters()
+        column_norms = np.linalg.norm(used_inv_choleskys, axis=1)
+        margins = self._get_rounding_error() * (
+            (np.abs(box_centers) + box_radii + 1) @ column_norms.T
+            + (np.abs(used_means) * column_norms).sum(axis=1)
+            + self.standard_deviation_threshold
+        )
+        squared_thresholds = (self.standard_deviation_threshold + margins) ** 2
+
+        for component_index in range(squared_lower_bounds.shape[1]):
+            possible_pixels = bin_counts[
+                squared_lower_bounds[:, component_index]
+                <= squared_thresholds[:, component_index]
+            ].sum()
+            if possible_pixels >= self.size_threshold:
+                return True
+
+        return False
+
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
     def calculate_contrast_image(
         image: np.ndarray,
         mean_background_values: np.ndarray,
@@ -270,7 +1299,7 @@ class MaterialDetector:
         )
 
     @staticmethod
-    @jit(fastmath=True, nopython=True, nogil=True)
+    @jit(fastmath=True, nopython=True, nogil=True, cache=True)
     def assign_components_to_pixel(
         pixel: np.ndarray,
         means: np.ndarray,
@@ -331,7 +1360,7 @@ class MaterialDetector:
         return current_closest_layer
 
     @staticmethod
-    @jit(parallel=True, fastmath=True, nopython=True, nogil=True)
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
     def assign_components_to_pixels(
         contrast_image: np.ndarray,
         means: np.ndarray,
@@ -406,19 +1435,18 @@ class MaterialDetector:
 
         return flake_component_mask
 
-    def _get_fp_probability(
-        self,
+    @staticmethod
+    def _get_fp_features(
         flake_contour: np.ndarray,
-    ) -> float:
+    ) -> Tuple[float, float]:
         """
-        Calculates the probability of the flake being a false positive.\n
-        Uses the False Positive Detector.
+        Calculates the shape features of the flake used by the False Positive Detector.\n
 
         Args:
             flake_contour (np.ndarray): A CV2 contour of the flake
 
         Returns:
-            float: The probability of the flake being a false positive; between 0 and 1
+            Tuple[float, float]: The ratio of the arclength to the square root of the area and the solidity of the flake
         """
         convex_hull = cv2.convexHull(flake_contour)
         convex_hull_area = cv2.contourArea(convex_hull)
@@ -427,70 +1455,244 @@ class MaterialDetector:
         solidity = float(area) / convex_hull_area
         arcarea = arclength / area**0.5
 
-        return round(self.FP_Detector.predict_proba([[arcarea, solidity]])[0][0], 3)
+        return arcarea, solidity
 
-    def _get_mean_entropy(
+    def _get_fp_probabilities(
         self,
-        image: np.ndarray,
-        masked_flake: np.ndarray,
-        flake_contour: np.ndarray,
-    ) -> float:
+        fp_features: np.ndarray,
+    ) -> List[float]:
         """
-        Calculates the mean shannon entropy of the flake.\n
+        Calculates the probability of each flake being a false positive in one call.\n
+        Uses the False Positive Detector.
 
         Args:
-            image (np.ndarray): The original image
-            masked_flake (np.ndarray): The mask of the flake
-            flake_contour (np.ndarray): The CV2 contour of the flake
+            fp_features (np.ndarray): The features of the flakes of shape (N x 2), see `_get_fp_features`
 
         Returns:
-            float: The mean shannon entropy of the flake
+            List[float]: The probability of each flake being a false positive; between 0 and 1
         """
-        x, y, w, h = cv2.boundingRect(flake_contour)
+        if len(fp_features) == 0:
+            return []
 
-        # We use a bounding box to speed up the calculation
-        # As shannon entropy is a local property, we can do this
-        # But it is really slow to calculate it for the whole image
-        # So using a local bounding box is a good compromise
+        if self.FP_coefficients is not None:
+            from scipy.special import expit
 
-        # Expand the Bounding Box
-        x_min = max(x - 20, 0)
-        x_max = min(x + w + 20, image.shape[1])
-        y_min = max(y - 20, 0)
-        y_max = min(y + h + 20, image.shape[0])
+            # the same computation as LogisticRegression.predict_proba for the first class
+            decision = fp_features @ self.FP_coefficients + self.FP_intercept
+            probabilities = 1 - expit(decision)
+        else:
+            probabilities = self.FP_Detector.predict_proba(fp_features)[:, 0]
 
-        # Cut out the Bounding boxes
-        cut_out_flake = image[
-            y_min:y_max,
-            x_min:x_max,
-        ]
-        cut_out_flake_mask = masked_flake[
-            y_min:y_max,
-            x_min:x_max,
-        ]
+        return [round(float(probability), 3) for probability in probabilities]
 
-        # Erode the mask to not accidentally have the Edges in the mean
-        cut_out_flake_mask = cv2.erode(cut_out_flake_mask, disk(2), iterations=2)
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _get_label_sums(
+        labeled_mask: np.ndarray,
+        image: np.ndarray,
+        num_labels: int,
+        num_threads: int,
+    ) -> np.ndarray:
+        """
+        Sums up the pixel values of every label in one pass over the labeled mask
 
-        # go to Gray as we only need the gray Entropy
-        entropy_area_gray = cv2.cvtColor(cut_out_flake, cv2.COLOR_BGR2GRAY)
 
-        # Do the entropy function, really quick as we only use a small part
-        entropied_image_area = entropy(
-            entropy_area_gray,
-            footprint=disk(2),
-            mask=cut_out_flake_mask,
-        )
+        Args:
+            labeled_mask (NxM Numpy Array): The labeled mask as returned by `cv2.connectedComponentsWithStats`, dtype=np.int32
+            image (NxMx3 Numpy Array): The blurred image, dtype=np.uint8
+            num_labels (int): The number of labels in the labeled mask, including the background label 0
+            num_threads (int): The number of bands of rows processed in parallel, usually `numba.get_num_threads()`
 
-        return cv2.mean(
-            entropied_image_area,
-            mask=cut_out_flake_mask,
-        )[0]
+        Returns:
+            np.ndarray: The summed pixel values of each label of shape (num_labels x 3) in BGR, dtype=np.int64
+        """
+        num_bands = min(image.shape[0], num_threads)
 
-    @staticmethod
-    @jit(parallel=True, fastmath=True, nopython=True, nogil=True)
-    def _generate_mh_distance_map(
-        image: np.ndarray,
+        # each band of rows gets its own sums so the rows can be processed in parallel
+        label_sums = np.zeros(shape=(num_bands, num_labels, 3), dtype=np.int64)
+
+        for band in prange(num_bands):
+            for i in range(band, image.shape[0], num_bands):
+                for j in range(image.shape[1]):
+                    label = labeled_mask[i, j]
+                    if label == 0:
+                        continue
+                    label_sums[band, label, 0] += image[i, j, 0]
+                    label_sums[band, label, 1] += image[i, j, 1]
+                    label_sums[band, label, 2] += image[i, j, 2]
+
+        return label_sums.sum(axis=0)
+
+    def _get_mean_contrast(
+        self,
+        pixel_sums: np.ndarray,
+        num_pixels: int,
+        mean_background_values: np.ndarray,
+    ) -> List[float]:
+        """
+        Calculates the mean contrast of the flake.\n
+        As the contrast is linear in the pixel values, the mean contrast is the contrast of the mean pixel values,
+        this way the contrast image never needs to be calculated.
+
+        Args:
+            pixel_sums (np.ndarray): The summed pixel values of the flake in BGR
+            num_pixels (int): The number of pixels of the flake
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+
+        Returns:
+            List[float]: The mean contrast of the flake in BGR
+        """
+        mean_values = pixel_sums / num_pixels
+        return (mean_values / mean_background_values - 1).tolist()
+
+    @staticmethod
+    def _get_entropy_mask(
+        flake_mask: np.ndarray,
+        bounding_box: Tuple[int, int, int, int],
+        image_shape: Tuple[int, int],
+    ) -> Tuple[Tuple[int, int, int, int], np.ndarray]:
+        """
+        Prepares the mask of the flake used for the mean shannon entropy.\n
+        The bounding box of the flake is expanded and the mask is eroded to not have the edges of the flake in the mean.
+
+        Args:
+            flake_mask (np.ndarray): The mask of the flake cut out to its bounding box
+            bounding_box (Tuple[int, int, int, int]): The bounding box (x, y, w, h) of the flake
+            image_shape (Tuple[int, int]): The shape of the image
+
+        Returns:
+            Tuple[Tuple[int, int, int, int], np.ndarray]: The expanded bounding box (x, y, w, h) and the eroded mask cut out to it
+        """
+        x, y, w, h = bounding_box
+
+        # We use a bounding box to speed up the calculation
+        # As shannon entropy is a local property, we can do this
+        # But it is really slow to calculate it for the whole image
+        # So using a local bounding box is a good compromise
+
+        # Expand the Bounding Box
+        x_min = max(x - 20, 0)
+        x_max = min(x + w + 20, image_shape[1])
+        y_min = max(y - 20, 0)
+        y_max = min(y + h + 20, image_shape[0])
+
+        # Cut out the Bounding box
+        cut_out_flake_mask = np.zeros(
+            shape=(y_max - y_min, x_max - x_min),
+            dtype=np.uint8,
+        )
+        cut_out_flake_mask[
+            y - y_min : y - y_min + h,
+            x - x_min : x - x_min + w,
+        ] = flake_mask
+
+        # skimage is only imported once the entropy is calculated
+        from skimage.morphology import disk
+
+        # Erode the mask to not accidentally have the Edges in the mean
+        cut_out_flake_mask = cv2.erode(cut_out_flake_mask, disk(2), iterations=2)
+
+        return (x_min, y_min, x_max - x_min, y_max - y_min), cut_out_flake_mask
+
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _get_mean_entropies(
+        gray_image: np.ndarray,
+        entropy_masks: np.ndarray,
+        mask_offsets: np.ndarray,
+        entropy_boxes: np.ndarray,
+        radius: int = 2,
+    ) -> np.ndarray:
+        """
+        Calculates the mean shannon entropy of all flakes of an image in one call.\n
+        The entropy of each masked pixel is calculated from the histogram of the masked pixels in a disk around it,
+        like `skimage.filters.rank.entropy`, the histogram is updated incrementally while sliding along the rows.
+
+        Args:
+            gray_image (NxM Numpy Array): The gray image, dtype=np.uint8
+            entropy_masks (np.ndarray): The flattened masks of all flakes, see `_get_entropy_mask`, dtype=np.uint8
+            mask_offsets (np.ndarray): The start of each mask in `entropy_masks` of shape (F + 1), dtype=np.int64
+            entropy_boxes (np.ndarray): The bounding boxes (x, y, w, h) of the masks of shape (F x 4), dtype=np.int64
+            radius (int, optional): The radius of the disk. Defaults to 2.
+
+        Returns:
+            np.ndarray: The mean shannon entropy of each flake of shape (F), dtype=np.float64
+        """
+        num_flakes = entropy_boxes.shape[0]
+        mean_entropies = np.zeros(num_flakes, dtype=np.float64)
+
+        # the half width of each row of the disk
+        half_widths = np.zeros(2 * radius + 1, dtype=np.int64)
+        for dy in range(-radius, radius + 1):
+            half_widths[dy + radius] = int(np.sqrt(radius * radius - dy * dy))
+
+        # the entropy of a histogram is log(n) - sum(n_i * log(n_i)) / n
+        # the sum is updated with a lookup table for each change of the histogram
+        max_count = (2 * radius + 1) ** 2
+        count_log_counts = np.zeros(max_count + 1, dtype=np.float64)
+        for count in range(1, max_count + 1):
+            count_log_counts[count] = count * np.log(count)
+        log_2 = np.log(2)
+
+        for flake_index in prange(num_flakes):
+            x, y, w, h = entropy_boxes[flake_index]
+            mask = entropy_masks[
+                mask_offsets[flake_index] : mask_offsets[flake_index + 1]
+            ].reshape((h, w))
+
+            histogram = np.zeros(256, dtype=np.int64)
+            entropy_sum = 0.0
+            num_masked_pixels = 0
+
+            for i in range(h):
+                histogram[:] = 0
+                population = 0
+                count_log_count_sum = 0.0
+
+                for j in range(-radius - 1, w):
+                    # slide the disk one pixel to the right
+                    for dy in range(-radius, radius + 1):
+                        row = i + dy
+                        if row < 0 or row >= h:
+                            continue
+                        half_width = half_widths[dy + radius]
+
+                        left = j - half_width
+                        if left >= 0 and mask[row, left] != 0:
+                            value = gray_image[y + row, x + left]
+                            count_log_count_sum -= count_log_counts[histogram[value]]
+                            histogram[value] -= 1
+                            count_log_count_sum += count_log_counts[histogram[value]]
+                            population -= 1
+
+                        right = j + 1 + half_width
+                        if 0 <= right < w and mask[row, right] != 0:
+                            value = gray_image[y + row, x + right]
+                            count_log_count_sum -= count_log_counts[histogram[value]]
+                            histogram[value] += 1
+                            count_log_count_sum += count_log_counts[histogram[value]]
+                            population += 1
+
+                    # the disk is now centered at j + 1
+                    center = j + 1
+                    if center < 0 or center >= w or mask[i, center] == 0:
+                        continue
+
+                    num_masked_pixels += 1
+                    if population > 0:
+                        entropy_sum += (
+                            np.log(population) - count_log_count_sum / population
+                        ) / log_2
+
+            if num_masked_pixels > 0:
+                mean_entropies[flake_index] = entropy_sum / num_masked_pixels
+
+        return mean_entropies
+
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _generate_mh_distance_map(
+        image: np.ndarray,
         means: np.ndarray,
         inv_choleskys: np.ndarray,
         max_mode_value: int = 230,
@@ -617,25 +1819,30 @@ class MaterialDetector:
         )
 
     @staticmethod
-    @jit(parallel=True, fastmath=True, nopython=True, nogil=True)
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
     def _generate_mh_distance_map_from_contrast_image(
         contrast_image: np.ndarray,
+        used_channel_indexes: np.ndarray,
         means: np.ndarray,
         inv_choleskys: np.ndarray,
     ) -> np.ndarray:
         """Generate the Mahalanobis Distance Map of the image given the Gaussian Mixture Componentes\n
         You should call this function via the `generate_mh_distance_map_from_contrast_image` wrapper function of the MaterialDetector class\n
+        The used channels are read directly from the contrast image, so it is not copied if only some channels are used\n
 
         Args:
-            contrast_image (np.ndarray): The image of shape H x W x C, dtype=np.uint8
-            means (np.ndarray): The means of the Gaussian Mixture with C components.
-            inv_choleskys (np.ndarray): The inverse of the cholesky decomposition of the covariance matrix of the Gaussian Mixture with C components.
+            contrast_image (np.ndarray): The contrast image of shape H x W x 3
+            used_channel_indexes (np.ndarray): The indexes of the channels used for the classification
+            means (np.ndarray): The means of the Gaussian Mixture with C components, only containing the used channels
+            inv_choleskys (np.ndarray): The inverse of the cholesky decomposition of the covariance matrix of the Gaussian Mixture with C components, only containing the used channels
 
         Returns:
             np.ndarray: An array of shape (K x H x W) with K being the number of components and H and W being the height and width of the image
             The values of the array are the Mahalanobis Distances of the pixels to the components
         """
-
+        # the distances are calculated in the precision of the parameters
+        infinity = means.dtype.type(np.inf)
+        num_channels = used_channel_indexes.shape[0]
         mh_distance_map = np.zeros(
             shape=(means.shape[0], contrast_image.shape[0], contrast_image.shape[1]),
             dtype=np.float32,
@@ -644,26 +1851,15 @@ class MaterialDetector:
         # Iterate over all pixels
         for component_index in prange(means.shape[0]):
             for i in prange(contrast_image.shape[0]):
-                for j in prange(contrast_image.shape[1]):
-                    # run the following loop to calculate the distance
-                    # calculate the Mahalanobis distance by utilizing the speedup of the inverse Cholesky decomposition
-                    ###################
-                    # tmp_1 = inv_cholesky[0, 0] * diff[0]
-                    # tmp_2 = inv_cholesky[1, 0] * diff[0] + inv_cholesky[1, 1] * diff[1]
-                    # tmp_3 = inv_cholesky[2, 0] * diff[0] + inv_cholesky[2, 1] * diff[1] + inv_cholesky[2, 2] * diff[2]
-                    # dist = tmp_1 **2 + tmp_2 **2 + tmp_3 **2
-                    ###################
-
-                    # mh_dist : Mahalanobis Distance of the current pixel to the current gaussian
-                    mh_dist = 0
-                    for k in range(contrast_image.shape[2]):
-                        tmp = 0
-                        for h in range(k + 1):
-                            tmp += (
-                                means[component_index, h] - contrast_image[i, j, h]
-                            ) * inv_choleskys[component_index, k, h]
-                        mh_dist += tmp**2
-
+                pixel = np.empty(num_channels, dtype=means.dtype)
+                for j in range(contrast_image.shape[1]):
+                    for c in range(num_channels):
+                        pixel[c] = contrast_image[i, j, used_channel_indexes[c]]
+
+                    # the full distance is needed, so the calculation never stops early
+                    mh_dist = _squared_mahalanobis_distance(
+                        pixel, means, inv_choleskys, component_index, infinity
+                    )
                     mh_distance_map[component_index, i, j] = np.sqrt(mh_dist)
 
         return mh_distance_map
@@ -682,19 +1878,12 @@ class MaterialDetector:
             np.ndarray: An array of shape (K x H x W) with K being the number of components and H and W being the height and width of the image
             The values of the array are the Mahalanobis Distances of the pixels to the components
         """
-        if len(self.used_channels) == 3:
-            return MaterialDetector._generate_mh_distance_map_from_contrast_image(
-                contrast_image,
-                self.contrast_means,
-                self.inv_cholesky_matrices,
-            )
-        used_channel_indexes = self._get_used_channel_indexes()
+        used_means, used_inv_choleskys = self._get_used_parameters(self.dtype)
         return MaterialDetector._generate_mh_distance_map_from_contrast_image(
-            contrast_image[:, :, used_channel_indexes],
-            self.contrast_means[:, used_channel_indexes],
-            self.inv_cholesky_matrices[:, used_channel_indexes, :][
-                :, :, used_channel_indexes
-            ],
+            contrast_image,
+            self._get_used_channel_indexes(),
+            used_means,
+            used_inv_choleskys,
         )
 
     def postprocess_mh_map(
@@ -720,128 +1909,2121 @@ class MaterialDetector:
 
         return semantic_masks
 
-    def detect_flakes(
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _generate_label_map(
+        images: np.ndarray,
+        mean_background_values: np.ndarray,
+        used_channel_indexes: np.ndarray,
+        means: np.ndarray,
+        inv_choleskys: np.ndarray,
+        bounding_boxes: np.ndarray,
+        grid_bounds: np.ndarray,
+        grid_shape: np.ndarray,
+        cell_offsets: np.ndarray,
+        cell_components: np.ndarray,
+        standard_deviations: float,
+        return_distance_map: bool,
+        label_maps: np.ndarray,
+    ):
+        """Generate the label maps of a stack of images in a single pass over the pixels\n
+        You should call this function via the `generate_label_map` wrapper function of the MaterialDetector class\n
+        The contrast of each pixel is calculated on the fly, so neither the contrast image nor the K x H x W distance map is allocated.
+        The rows of all images are processed in parallel, a single image is passed as a stack of one image\n
+
+        Args:
+            images (np.ndarray): The images of shape N x H x W x 3, dtype=np.uint8
+            mean_background_values (np.ndarray): The mean background values of each image of shape (N x 3) in form BGR
+            used_channel_indexes (np.ndarray): The indexes of the channels used for the classification
+            means (np.ndarray): The means of the Gaussian Mixture with C components, only containing the used channels
+            inv_choleskys (np.ndarray): The inverse of the cholesky decomposition of the covariance matrix of the Gaussian Mixture, only containing the used channels
+            bounding_boxes (np.ndarray): The bounding boxes of the components in raw pixel space of each image of shape (N x K x 2 x C), see `_get_pixel_component_index`
+            grid_bounds (np.ndarray): The origin and the cell size of the grid index in raw pixel space of each image of shape (N x 2 x C)
+            grid_shape (np.ndarray): The number of cells of the grid index along each channel
+            cell_offsets (np.ndarray): The start of the component list of each cell, empty if the bounding boxes are used instead of the grid index
+            cell_components (np.ndarray): The concatenated component lists of all cells
+            standard_deviations (float): The maximum standard deviation of the Gaussian Mixture for which a pixel is still assigned to a component
+            return_distance_map (bool): If True the Mahalanobis distance to the closest component is returned for each pixel, this disables the pruning by the bounding boxes
+            label_maps (np.ndarray): The output label maps of shape N x H x W, dtype=np.uint8, every pixel is overwritten
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The label maps of shape N x H x W, dtype=np.uint8, 0 means that the pixel is not assigned to any component.
+            The distance maps of shape N x H x W, dtype=np.float32, or an empty array of shape N x 0 x 0 if `return_distance_map` is False
+        """
+        # all distances are calculated in the precision of the parameters
+        one = means.dtype.type(1)
+        infinity = means.dtype.type(np.inf)
+        maximum_squared_stddev = means.dtype.type(standard_deviations**2)
+        num_images, height, width = images.shape[0], images.shape[1], images.shape[2]
+        num_channels = used_channel_indexes.shape[0]
+
+        if return_distance_map:
+            distance_maps = np.empty(
+                shape=(num_images, height, width),
+                dtype=np.float32,
+            )
+        else:
+            distance_maps = np.empty(shape=(num_images, 0, 0), dtype=np.float32)
+
+        use_grid = cell_offsets.shape[0] > 0
+        union_boxes = np.empty(shape=(num_images, 2, num_channels), dtype=np.float64)
+        for n in range(num_images):
+            for c in range(num_channels):
+                union_boxes[n, 0, c] = bounding_boxes[n, :, 0, c].min()
+                union_boxes[n, 1, c] = bounding_boxes[n, :, 1, c].max()
+
+        for row in prange(num_images * height):
+            n = row // height
+            i = row - n * height
+            frame_bounding_boxes = bounding_boxes[n]
+            frame_union_box = union_boxes[n]
+            frame_grid_bounds = grid_bounds[n]
+
+            # the raw values and the contrast of the current pixel, reused for every component
+            pixel_values = np.empty(num_channels, dtype=means.dtype)
+            pixel = np.empty(num_channels, dtype=means.dtype)
+            candidates = np.arange(means.shape[0])
+            scores = np.empty(means.shape[0], dtype=np.float64)
+            for j in range(width):
+                for c in range(num_channels):
+                    channel = used_channel_indexes[c]
+                    pixel_values[c] = images[n, i, j, channel]
+                    pixel[c] = (
+                        pixel_values[c] / mean_background_values[n, channel] - one
+                    )
+
+                # without a distance map only components within the threshold are of interest
+                # so only the components whose bounding box or grid cell contains the pixel are tested, nearest first
+                if return_distance_map:
+                    smallest_distance = infinity
+                    num_candidates = means.shape[0]
+                elif use_grid:
+                    smallest_distance = maximum_squared_stddev
+                    num_candidates = _query_component_grid(
+                        pixel_values,
+                        frame_grid_bounds,
+                        grid_shape,
+                        cell_offsets,
+                        cell_components,
+                        candidates,
+                    )
+                else:
+                    smallest_distance = maximum_squared_stddev
+                    num_candidates = _collect_candidate_components(
+                        pixel_values,
+                        frame_bounding_boxes,
+                        frame_union_box,
+                        candidates,
+                        scores,
+                    )
+                current_closest_layer = 0
+
+                for candidate_index in range(num_candidates):
+                    component_index = candidates[candidate_index]
+                    # the calculation stops once the distance exceeds the current smallest distance
+                    mh_dist = _squared_mahalanobis_distance(
+                        pixel, means, inv_choleskys, component_index, smallest_distance
+                    )
+                    if mh_dist < smallest_distance:
+                        smallest_distance = mh_dist
+                        current_closest_layer = component_index + 1
+
+                if smallest_distance < maximum_squared_stddev:
+                    label_maps[n, i, j] = current_closest_layer
+                else:
+                    label_maps[n, i, j] = 0
+                if return_distance_map:
+                    distance_maps[n, i, j] = np.sqrt(smallest_distance)
+
+        return label_maps, distance_maps
+
+    def _classify_pixels(
         self,
         image: np.ndarray,
-    ) -> List[Flake]:
+        mean_background_values: np.ndarray,
+        return_distance_map: bool,
+        label_map: np.ndarray = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Classifies every pixel of the image with the per pixel kernel of the selected engine\n
+
+        Args:
+            image (np.ndarray): The image of shape H x W x 3, dtype=np.uint8
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+            return_distance_map (bool): If True the Mahalanobis distance to the closest component is returned for each pixel
+            label_map (np.ndarray, optional): The output label map of shape H x W, dtype=np.uint8. Defaults to None, meaning a new one is allocated.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The label map of shape H x W and the distance map of shape H x W, which is empty if `return_distance_map` is False
         """
-        Detects Flakes in the given Image.\n
-        Expects images without vignette.\n
+        if label_map is None:
+            label_map = np.empty(shape=image.shape[:2], dtype=np.uint8)
+
+        label_maps, distance_maps = self._classify_frames(
+            image[None],
+            np.asarray(mean_background_values)[None],
+            return_distance_map,
+            label_map[None],
+        )
+        return label_maps[0], distance_maps[0]
+
+    def _classify_frames(
+        self,
+        images: np.ndarray,
+        mean_background_values: np.ndarray,
+        return_distance_map: bool,
+        label_maps: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Classifies every pixel of a stack of images in one call of the per pixel kernel of the selected engine\n
 
         Args:
-            image (NxMx3 Numpy Array): The original image without vignette, Expected to be in format BGR
+            images (np.ndarray): The images of shape N x H x W x 3, dtype=np.uint8
+            mean_background_values (np.ndarray): The mean background values of each image of shape (N x 3) in form BGR
+            return_distance_map (bool): If True the Mahalanobis distance to the closest component is returned for each pixel
+            label_maps (np.ndarray): The output label maps of shape N x H x W, dtype=np.uint8
 
         Returns:
-            (Kx1 Numpy Array): An Array of Flakes
+            Tuple[np.ndarray, np.ndarray]: The label maps of shape N x H x W and the distance maps of shape N x H x W, which are empty if `return_distance_map` is False
         """
+        # only the bounding boxes and the grid bounds depend on the background of an image
+        component_indexes = [
+            self._get_pixel_component_index(background_values)
+            for background_values in mean_background_values
+        ]
+        bounding_boxes = np.stack([index[0] for index in component_indexes])
+        grid_bounds = np.stack([index[1] for index in component_indexes])
+        grid_shape, cell_offsets, cell_components = component_indexes[0][2:]
 
-        assert (
-            image.shape[2] == 3
-        ), f"The Image has to have the shape of NxMx3, the shape is {image.shape}"
-        assert image.dtype == np.uint8, "The Image has to be of type uint8"
+        used_channel_indexes = self._get_used_channel_indexes()
+        if self.engine == "affine":
+            affine_parameters = [
+                self._get_affine_parameters(background_values)
+                for background_values in mean_background_values
+            ]
+            return MaterialDetector._generate_label_map_affine(
+                images,
+                used_channel_indexes,
+                np.stack([parameters[0] for parameters in affine_parameters]),
+                np.stack([parameters[1] for parameters in affine_parameters]),
+                bounding_boxes,
+                grid_bounds,
+                grid_shape,
+                cell_offsets,
+                cell_components,
+                self.standard_deviation_threshold,
+                return_distance_map,
+                label_maps,
+            )
 
-        detected_flakes = []
+        used_means, used_inv_choleskys = self._get_used_parameters(self.dtype)
+        return MaterialDetector._generate_label_map(
+            images,
+            np.asarray(mean_background_values, dtype=self.dtype),
+            used_channel_indexes,
+            used_means,
+            used_inv_choleskys,
+            bounding_boxes,
+            grid_bounds,
+            grid_shape,
+            cell_offsets,
+            cell_components,
+            self.standard_deviation_threshold,
+            return_distance_map,
+            label_maps,
+        )
+
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _get_unique_colors(
+        image: np.ndarray,
+        keys: np.ndarray,
+        occupied: np.ndarray,
+        unique_keys: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Packs the BGR pixels of the image into 24 bit keys and finds the distinct colors\n
+        Uses a 2^24 entry occupancy table instead of sorting, so the runtime is linear in the number of pixels.
+        The distinct keys are collected while marking the table, so the table is never scanned as a whole\n
+        The occupancy table has to be zero on entry, only the entries of the distinct keys are used and they are reset before returning\n
+
+        Args:
+            image (np.ndarray): The image of shape H x W x 3, dtype=np.uint8
+            keys (np.ndarray): The output keys of each pixel of shape H x W, dtype=np.uint32
+            occupied (np.ndarray): The occupancy table of shape 2^24, dtype=np.uint8
+            unique_keys (np.ndarray): The output buffer of the distinct keys of shape H * W, dtype=np.uint32
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The keys of each pixel of shape H x W and the distinct keys in order of their first pixel, dtype=np.uint32
+        """
+        for i in prange(image.shape[0]):
+            for j in range(image.shape[1]):
+                keys[i, j] = (
+                    (np.uint32(image[i, j, 0]) << 16)
+                    | (np.uint32(image[i, j, 1]) << 8)
+                    | np.uint32(image[i, j, 2])
+                )
+
+        # a blurred frame contains few distinct colors, so this serial pass mostly hits marked entries
+        num_unique = 0
+        for i in range(image.shape[0]):
+            for j in range(image.shape[1]):
+                key = keys[i, j]
+                if occupied[key] == 0:
+                    occupied[key] = 1
+                    unique_keys[num_unique] = key
+                    num_unique += 1
 
-        image = cv2.medianBlur(image, 5)
+        for index in prange(num_unique):
+            occupied[unique_keys[index]] = 0
+        return keys, unique_keys[:num_unique]
 
-        mean_background_values = MaterialDetector.get_mean_background_values_numba(
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _scatter_unique_labels(
+        keys: np.ndarray,
+        unique_keys: np.ndarray,
+        unique_labels: np.ndarray,
+        label_table: np.ndarray,
+        label_map: np.ndarray,
+    ) -> np.ndarray:
+        """Scatters the labels of the distinct colors back to the pixels through a direct 24 bit lookup table\n
+        Only the entries of the distinct keys are written and read, so the table does not need to be cleared between the calls\n
+
+        Args:
+            keys (np.ndarray): The keys of each pixel of shape H x W, dtype=np.uint32
+            unique_keys (np.ndarray): The distinct keys of shape U, dtype=np.uint32
+            unique_labels (np.ndarray): The label of each distinct key of shape U, dtype=np.uint8
+            label_table (np.ndarray): The lookup table of shape 2^24, dtype=np.uint8
+            label_map (np.ndarray): The output label map of shape H x W, dtype=np.uint8
+
+        Returns:
+            np.ndarray: The label map of shape H x W, dtype=np.uint8
+        """
+        for index in prange(unique_keys.shape[0]):
+            label_table[unique_keys[index]] = unique_labels[index]
+
+        for i in prange(keys.shape[0]):
+            for j in range(keys.shape[1]):
+                label_map[i, j] = label_table[keys[i, j]]
+        return label_map
+
+    def _generate_label_map_unique(
+        self,
+        image: np.ndarray,
+        mean_background_values: np.ndarray,
+        return_distance_map: bool,
+        label_map: np.ndarray,
+        workspace: DetectorWorkspace,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Generates the label map by only classifying the distinct colors of the image\n
+        After the median blur a frame usually contains only tens of thousands of distinct colors,
+        these are classified with the same kernel as the "fused" engine and the labels are scattered back to the pixels\n
+        The 2^24 entry tables and the keys of the pixels are kept in the workspace, only the entries of the distinct colors are touched\n
+
+        Args:
+            image (np.ndarray): The image of shape H x W x 3, dtype=np.uint8
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+            return_distance_map (bool): If True the Mahalanobis distance to the closest component is returned for each pixel
+            label_map (np.ndarray): The output label map of shape H x W, dtype=np.uint8
+            workspace (DetectorWorkspace): The workspace holding the tables and the keys
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The label map of shape H x W and the distance map of shape H x W, which is empty if `return_distance_map` is False
+        """
+        height, width = image.shape[:2]
+        keys, unique_keys = MaterialDetector._get_unique_colors(
             image,
+            workspace.get("unique_color_keys", (height, width), np.uint32),
+            workspace.get_zeros("unique_color_occupancy", (1 << 24,), np.uint8),
+            workspace.get("unique_color_list", (height * width,), np.uint32),
         )
 
-        contrast_image = MaterialDetector.calculate_contrast_image(
-            image,
+        # the unique colors are classified as an image of shape U x 1 x 3
+        unique_colors = np.empty(shape=(unique_keys.shape[0], 1, 3), dtype=np.uint8)
+        unique_colors[:, 0, 0] = (unique_keys >> 16) & 0xFF
+        unique_colors[:, 0, 1] = (unique_keys >> 8) & 0xFF
+        unique_colors[:, 0, 2] = unique_keys & 0xFF
+
+        unique_labels, unique_distances = self._classify_pixels(
+            unique_colors,
             mean_background_values,
+            return_distance_map,
         )
 
-        mh_distance_map = self.generate_mh_distance_map_from_contrast_image(
-            contrast_image
+        label_map = MaterialDetector._scatter_unique_labels(
+            keys,
+            unique_keys,
+            unique_labels[:, 0],
+            workspace.get("unique_color_labels", (1 << 24,), np.uint8),
+            label_map,
         )
 
-        semantic_masks = self.postprocess_mh_map(
-            mh_distance_map, distance_threshold=self.standard_deviation_threshold
-        )
+        if not return_distance_map:
+            return label_map, unique_distances
 
-        for layer_index, layer_mask in enumerate(semantic_masks):
-            layer_name = self.layer_name_lookup[layer_index]
+        sort_order = np.argsort(unique_keys)
+        inverse_index = sort_order[np.searchsorted(unique_keys[sort_order], keys)]
+        return label_map, unique_distances[:, 0][inverse_index]
 
-            # Remove small outliers
-            layer_mask = cv2.morphologyEx(layer_mask, cv2.MORPH_OPEN, disk(2))
+    def _get_model_fingerprint(self) -> str:
+        """
+        Returns a hash of the Gaussian Mixture, which identifies the model in the keys of a shared `LabelLUTCache`\n
+        The hash covers the means, the inverse cholesky matrices and the order of the layers\n
 
-            # Skip the layer if there are not enough pixels
-            if cv2.countNonZero(layer_mask) < self.size_threshold:
-                continue
+        Returns:
+            str: The hex digest of the hash
+        """
+        model_hash = hashlib.sha1()
+        model_hash.update(np.ascontiguousarray(self.contrast_means, np.float64))
+        model_hash.update(np.ascontiguousarray(self.inv_cholesky_matrices, np.float64))
+        model_hash.update(
+            "\0".join(
+                self.layer_name_lookup[layer_index]
+                for layer_index in range(len(self.layer_name_lookup))
+            ).encode()
+        )
+        return model_hash.hexdigest()
 
-            # label each connected 'blob' on the mask with an individual number
-            # each of these blobs is a flake candidate
-            num_labels, labeled_mask = cv2.connectedComponents(
-                layer_mask,
-                connectivity=4,
-            )
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _generate_label_lut(
+        used_channel_indexes: np.ndarray,
+        background_bounds: np.ndarray,
+        shift: int,
+        means: np.ndarray,
+        inv_choleskys: np.ndarray,
+        standard_deviations: float,
+        rounding_error: float,
+        uncertain_label: int,
+        lut: np.ndarray,
+    ) -> np.ndarray:
+        """Fills the color lookup table of the "lut" engine\n
+        Each entry covers the colors of its bin and all background colors between the bounds, so the contrast of the entry lies in a box.
+        The distance to a component changes by at most the radius of the box weighted with the column norms of its inverse cholesky matrix,
+        an entry gets a label if the label is the same for every point of the box, else it is marked as uncertain\n
 
-            # iterate over all flake candidates IDs, the 0 ID is the background
-            for i in range(1, num_labels + 1):
-                # mask out only the pixels of certain flakes, quite fast ~1ms
-                masked_flake = cv2.inRange(labeled_mask, i, i)
+        Args:
+            used_channel_indexes (np.ndarray): The indexes of the channels used for the classification
+            background_bounds (np.ndarray): The lower and upper bound of the background values of shape (2 x 3) in form BGR, all positive
+            shift (int): The number of dropped bits per channel, 8 - bits
+            means (np.ndarray): The means of the Gaussian Mixture of shape (K x C), dtype=np.float64
+            inv_choleskys (np.ndarray): The inverse cholesky matrices of the Gaussian Mixture of shape (K x C x C), dtype=np.float64
+            standard_deviations (float): The maximum standard deviation of the Gaussian Mixture for which a pixel is still assigned to a component
+            rounding_error (float): The relative error of the distances calculated by the exact kernels, added to the margins and the threshold
+            uncertain_label (int): The entry of the colors whose label depends on the exact background
+            lut (np.ndarray): The output lookup table of shape (2^bits x 2^bits x 2^bits), dtype=np.uint8
 
-                # if the flake has less pixel than the Threshold skip it
-                flake_size = cv2.countNonZero(masked_flake)
-                if flake_size < self.size_threshold:
-                    continue
+        Returns:
+            np.ndarray: The lookup table of shape (2^bits x 2^bits x 2^bits), dtype=np.uint8
+        """
+        num_bins = lut.shape[0]
+        num_components, num_channels = means.shape[0], means.shape[1]
+        bin_width = 1 << shift
+        # the threshold is compared in the working precision as well
+        margin_threshold = standard_deviations * (1 + rounding_error)
+
+        # the channels before the red channel are the same for all entries of a row of the table
+        # as the matrices are triangular, the first rows of the product only depend on these channels
+        num_row_channels = num_channels
+        if used_channel_indexes[num_channels - 1] == 2:
+            num_row_channels = num_channels - 1
+
+        # the change of the distance to a component per unit change of each contrast channel
+        column_norms = np.zeros(shape=(num_components, num_channels), dtype=np.float64)
+        row_column_norms = np.zeros(
+            shape=(num_components, num_channels), dtype=np.float64
+        )
+        for k in range(num_components):
+            for c in range(num_channels):
+                for r in range(num_channels):
+                    column_norms[k, c] += inv_choleskys[k, r, c] ** 2
+                    if r < num_row_channels:
+                        row_column_norms[k, c] += inv_choleskys[k, r, c] ** 2
+                column_norms[k, c] = np.sqrt(column_norms[k, c])
+                row_column_norms[k, c] = np.sqrt(row_column_norms[k, c])
+
+        for row in prange(num_bins * num_bins):
+            color_bins = np.empty(3, dtype=np.int64)
+            color_bins[0] = row // num_bins
+            color_bins[1] = row % num_bins
+            color_bins[2] = 0
+            center = np.empty(num_channels, dtype=np.float64)
+            radius = np.empty(num_channels, dtype=np.float64)
+            distances = np.empty(num_components, dtype=np.float64)
+            margins = np.empty(num_components, dtype=np.float64)
+
+            for color_bin in range(num_bins):
+                color_bins[2] = color_bin
+                for c in range(num_channels):
+                    # the channels of the row are the same for every entry
+                    if color_bin > 0 and c < num_row_channels:
+                        continue
+                    channel = used_channel_indexes[c]
+                    lowest_value = color_bins[channel] << shift
+                    lowest = lowest_value / background_bounds[1, channel] - 1
+                    highest = (lowest_value + bin_width - 1) / background_bounds[
+                        0, channel
+                    ] - 1
+                    center[c] = (lowest + highest) / 2
+                    radius[c] = (highest - lowest) / 2
+
+                # most rows are far from every component, they are background without looking at the single entries
+                if color_bin == 0 and num_row_channels > 0:
+                    is_background_row = True
+                    for k in range(num_components):
+                        distance, margin = _get_distance_bounds(
+                            center,
+                            radius,
+                            means,
+                            inv_choleskys,
+                            row_column_norms,
+                            k,
+                            num_row_channels,
+                            rounding_error,
+                        )
+                        if distance - margin <= margin_threshold:
+                            is_background_row = False
+                            break
+                    if is_background_row:
+                        lut[color_bins[0], color_bins[1], :] = 0
+                        break
+
+                closest = 0
+                for k in range(num_components):
+                    distances[k], margins[k] = _get_distance_bounds(
+                        center,
+                        radius,
+                        means,
+                        inv_choleskys,
+                        column_norms,
+                        k,
+                        num_channels,
+                        rounding_error,
+                    )
+                    if distances[k] < distances[closest]:
+                        closest = k
 
-                contours, hierarchy = cv2.findContours(
-                    image=masked_flake,
-                    mode=cv2.RETR_TREE,
-                    method=cv2.CHAIN_APPROX_NONE,
+                # the closest component wins if it is within the threshold and closer than every other component in the whole box
+                farthest_closest = distances[closest] + margins[closest]
+                is_certain = farthest_closest < standard_deviations * (
+                    1 - rounding_error
                 )
+                is_background = True
+                for k in range(num_components):
+                    nearest = distances[k] - margins[k]
+                    if k != closest and nearest <= farthest_closest:
+                        is_certain = False
+                    if nearest <= margin_threshold:
+                        is_background = False
+
+                if is_certain:
+                    lut[color_bins[0], color_bins[1], color_bin] = closest + 1
+                elif is_background:
+                    lut[color_bins[0], color_bins[1], color_bin] = 0
+                else:
+                    lut[color_bins[0], color_bins[1], color_bin] = uncertain_label
+        return lut
+
+    def _build_label_lut(
+        self,
+        quantized_background_values: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Builds the color lookup table of the "lut" engine for a quantized background color\n
+        The table is valid for every background within half a `lut_background_step` of the quantized background.
+        Colors whose label differs within their bin or within these backgrounds are marked with `LUT_UNCERTAIN`\n
+
+        Args:
+            quantized_background_values (np.ndarray): The quantized mean background values for each channel in form BGR
+
+        Returns:
+            np.ndarray: The lookup table of shape (2^bits x 2^bits x 2^bits) indexed by the quantized B, G and R values, dtype=np.uint8
+        """
+        num_bins = 1 << self.lut_bits
+        lut = np.empty(shape=(num_bins, num_bins, num_bins), dtype=np.uint8)
+
+        half_step = self.lut_background_step / 2
+        background_bounds = np.stack(
+            [
+                quantized_background_values - half_step,
+                quantized_background_values + half_step,
+            ]
+        ).astype(np.float64)
+        # the contrast is unbounded for a background close to zero
+        if background_bounds[0].min() <= 0:
+            lut.fill(MaterialDetector.LUT_UNCERTAIN)
+            return lut
+
+        used_means, used_inv_choleskys = self._get_used_parameters(np.float64)
+        return MaterialDetector._generate_label_lut(
+            self._get_used_channel_indexes(),
+            background_bounds,
+            8 - self.lut_bits,
+            used_means,
+            used_inv_choleskys,
+            float(self.standard_deviation_threshold),
+            self._get_rounding_error(),
+            MaterialDetector.LUT_UNCERTAIN,
+            lut,
+        )
+
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _apply_label_lut(
+        image: np.ndarray,
+        lut: np.ndarray,
+        shift: int,
+        uncertain_label: int,
+        label_map: np.ndarray,
+    ) -> Tuple[np.ndarray, int]:
+        """Looks up the label of every pixel in the color lookup table\n
+
+        Args:
+            image (np.ndarray): The image of shape H x W x 3, dtype=np.uint8
+            lut (np.ndarray): The lookup table of shape (2^bits x 2^bits x 2^bits), dtype=np.uint8
+            shift (int): The number of dropped bits per channel, 8 - bits
+            uncertain_label (int): The entry of the colors which have to be classified exactly
+            label_map (np.ndarray): The output label map of shape H x W, dtype=np.uint8
 
-                # extract the toplevel contour by finding the contour with no parents
-                top_level_contour = [
-                    contours[i]
-                    for i in range(len(contours))
-                    if hierarchy[0, i, 3] == -1
+        Returns:
+            Tuple[np.ndarray, int]: The label map of shape H x W, dtype=np.uint8, and the number of pixels with an uncertain label
+        """
+        uncertain_counts = np.zeros(image.shape[0], dtype=np.int64)
+        for i in prange(image.shape[0]):
+            for j in range(image.shape[1]):
+                label = lut[
+                    image[i, j, 0] >> shift,
+                    image[i, j, 1] >> shift,
+                    image[i, j, 2] >> shift,
                 ]
+                label_map[i, j] = label
+                if label == uncertain_label:
+                    uncertain_counts[i] += 1
+        return label_map, uncertain_counts.sum()
 
-                # Fill all the holes in the contour by redrawing the contour
-                masked_flake = cv2.drawContours(
-                    masked_flake, top_level_contour, -1, 255, -1
-                )
+    def _generate_label_map_lut(
+        self,
+        image: np.ndarray,
+        mean_background_values: np.ndarray,
+        label_map: np.ndarray = None,
+    ) -> np.ndarray:
+        """Generates the label map with the cached lookup table of the quantized background color\n
+        The background changes only slightly within a scan, so most frames reuse an existing table\n
+        The pixels with an uncertain entry are classified with the "fused" kernel at the exact background,
+        so the labels are the same as those of the exact engines for every `lut_bits` and `lut_background_step`\n
 
-                #### Calculate the Contrast of the Flakes
-                mean_contrast, _ = cv2.meanStdDev(contrast_image, mask=masked_flake)
-                mean_contrast = mean_contrast[:, 0].tolist()
+        Args:
+            image (np.ndarray): The image of shape H x W x 3, dtype=np.uint8
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+            label_map (np.ndarray, optional): The output label map of shape H x W, dtype=np.uint8. Defaults to None, meaning a new one is allocated.
 
-                #### Calculate the false positive probability
-                if self.FP_Detector is not None:
-                    false_positive_probability = self._get_fp_probability(
-                        top_level_contour[0]
-                    )
-                else:
-                    false_positive_probability = 0
+        Returns:
+            np.ndarray: The label map of shape H x W, dtype=np.uint8
+        """
+        quantized_background_values = (
+            np.round(np.asarray(mean_background_values) / self.lut_background_step)
+            * self.lut_background_step
+        )
 
-                #### Calculate the Aspect Ratio and Center Position of the Flake
-                ((center_x, center_y), (width_r, height_r), _) = cv2.minAreaRect(
-                    top_level_contour[0]
-                )
+        # the table also depends on the parameters which might be changed on the instance
+        # and on the model, as the cache can be shared between detectors
+        key = (
+            self._get_model_fingerprint(),
+            self.lut_bits,
+            self.precision,
+            self.used_channels,
+            float(self.standard_deviation_threshold),
+            *quantized_background_values.tolist(),
+        )
+        lut = self.lut_cache.get_or_create(
+            key,
+            lambda: self._build_label_lut(quantized_background_values),
+        )
+        if label_map is None:
+            label_map = np.empty(shape=image.shape[:2], dtype=np.uint8)
+        label_map, num_uncertain = MaterialDetector._apply_label_lut(
+            image, lut, 8 - self.lut_bits, MaterialDetector.LUT_UNCERTAIN, label_map
+        )
+        if num_uncertain == 0:
+            return label_map
 
-                #### Calculate the Entropy
-                flake_entropy = self._get_mean_entropy(
-                    image,
-                    masked_flake,
-                    top_level_contour[0],
-                )
+        # the uncertain pixels are classified as an image of shape U x 1 x 3
+        is_uncertain = label_map == MaterialDetector.LUT_UNCERTAIN
+        uncertain_labels, _ = self._classify_pixels(
+            image[is_uncertain][:, None],
+            mean_background_values,
+            False,
+        )
+        label_map[is_uncertain] = uncertain_labels[:, 0]
+        return label_map
 
-                flake = Flake(
-                    mask=masked_flake,
-                    thickness=layer_name,
-                    size=flake_size,
-                    mean_contrast=mean_contrast,
-                    center=(int(center_x), int(center_y)),
-                    min_sidelength=min(width_r, height_r),
-                    max_sidelength=max(width_r, height_r),
-                    false_positive_probability=false_positive_probability,
-                    entropy=flake_entropy,
-                )
+    def generate_label_map(
+        self,
+        image: np.ndarray,
+        mean_background_values: np.ndarray = None,
+        return_distance_map: bool = False,
+        label_map: np.ndarray = None,
+        workspace: DetectorWorkspace = None,
+    ):
+        """Generate the label map of the image given the Gaussian Mixture Components\n
+        Each pixel is assigned to the closest component if it is within the standard deviation threshold\n
 
-                detected_flakes.append(flake)
+        Args:
+            image (np.ndarray): The image of shape H x W x 3, dtype=np.uint8
+            mean_background_values (np.ndarray, optional): The mean background values for each channel in form BGR. Defaults to None, meaning they are estimated from the image.
+            return_distance_map (bool, optional): If True the Mahalanobis distance of each pixel to the closest component is returned as well. Defaults to False.
+            label_map (np.ndarray, optional): A preallocated label map of shape H x W, dtype=np.uint8, which is overwritten. Defaults to None, meaning a new one is allocated.
+            workspace (DetectorWorkspace, optional): The workspace holding the color tables of the "unique" engine. Defaults to None, meaning the workspace of the detector.
 
-        return np.array(detected_flakes)
+        Returns:
+            np.ndarray: The label map of shape H x W, dtype=np.uint8, the value of each pixel is the index of the component it is assigned to; 0 means that the pixel is not assigned to any component.
+            If `return_distance_map` is True a tuple of the label map and the distance map of shape H x W, dtype=np.float32 is returned
+        """
+        if mean_background_values is None:
+            mean_background_values = MaterialDetector.get_mean_background_values_numba(
+                image
+            )
+
+        if self.engine == "unique":
+            if label_map is None:
+                label_map = np.empty(shape=image.shape[:2], dtype=np.uint8)
+            if workspace is None:
+                workspace = self.workspace
+            label_map, distance_map = self._generate_label_map_unique(
+                image,
+                mean_background_values,
+                return_distance_map,
+                label_map,
+                workspace,
+            )
+        elif self.engine == "lut" and not return_distance_map:
+            # the lookup tables only store labels, the distance map is always calculated exactly
+            label_map = self._generate_label_map_lut(
+                image,
+                mean_background_values,
+                label_map,
+            )
+        else:
+            label_map, distance_map = self._classify_pixels(
+                image,
+                mean_background_values,
+                return_distance_map,
+                label_map,
+            )
+
+        if return_distance_map:
+            return label_map, distance_map
+        return label_map
+
+    def _get_affine_parameters(
+        self,
+        mean_background_values: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Folds the contrast calculation and the whitening of the Gaussian Mixture into one affine transform per component\n
+        The contrast is `pixel / background - 1`, so `inv_cholesky_k (mean_k - contrast)` equals `matrix_k pixel + offset_k` with\n
+        `matrix_k = -inv_cholesky_k diag(1 / background)` and `offset_k = inv_cholesky_k (mean_k + 1)`\n
+        The matrices stay lower triangular, so the early exit of the kernels still works\n
+
+        Args:
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The affine matrices of shape (K x C x C) and the affine offsets of shape (K x C) in the precision of the detector
+        """
+        used_channel_indexes = self._get_used_channel_indexes()
+        used_means, used_inv_choleskys = self._get_used_parameters()
+        inverse_background_values = 1 / np.asarray(
+            mean_background_values[used_channel_indexes], dtype=np.float64
+        )
+
+        affine_matrices = -used_inv_choleskys * inverse_background_values[None, None, :]
+        affine_offsets = np.einsum("kch,kh->kc", used_inv_choleskys, used_means + 1)
+        return np.ascontiguousarray(
+            affine_matrices, dtype=self.dtype
+        ), np.ascontiguousarray(affine_offsets, dtype=self.dtype)
+
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _generate_label_map_affine(
+        images: np.ndarray,
+        used_channel_indexes: np.ndarray,
+        affine_matrices: np.ndarray,
+        affine_offsets: np.ndarray,
+        bounding_boxes: np.ndarray,
+        grid_bounds: np.ndarray,
+        grid_shape: np.ndarray,
+        cell_offsets: np.ndarray,
+        cell_components: np.ndarray,
+        standard_deviations: float,
+        return_distance_map: bool,
+        label_maps: np.ndarray,
+    ):
+        """Generate the label maps of a stack of images from the raw pixel values using the per image affine transforms\n
+        You should call this function via the `generate_label_map` wrapper function of the MaterialDetector class with the "affine" engine\n
+        The rows of all images are processed in parallel, a single image is passed as a stack of one image\n
+
+        Args:
+            images (np.ndarray): The images of shape N x H x W x 3, dtype=np.uint8
+            used_channel_indexes (np.ndarray): The indexes of the channels used for the classification
+            affine_matrices (np.ndarray): The lower triangular affine matrices of each image of shape (N x K x C x C), see `_get_affine_parameters`
+            affine_offsets (np.ndarray): The affine offsets of each image of shape (N x K x C), see `_get_affine_parameters`
+            bounding_boxes (np.ndarray): The bounding boxes of the components in raw pixel space of each image of shape (N x K x 2 x C), see `_get_pixel_component_index`
+            grid_bounds (np.ndarray): The origin and the cell size of the grid index in raw pixel space of each image of shape (N x 2 x C)
+            grid_shape (np.ndarray): The number of cells of the grid index along each channel
+            cell_offsets (np.ndarray): The start of the component list of each cell, empty if the bounding boxes are used instead of the grid index
+            cell_components (np.ndarray): The concatenated component lists of all cells
+            standard_deviations (float): The maximum standard deviation of the Gaussian Mixture for which a pixel is still assigned to a component
+            return_distance_map (bool): If True the Mahalanobis distance to the closest component is returned for each pixel, this disables the pruning by the bounding boxes
+            label_maps (np.ndarray): The output label maps of shape N x H x W, dtype=np.uint8, every pixel is overwritten
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The label maps of shape N x H x W, dtype=np.uint8, 0 means that the pixel is not assigned to any component.
+            The distance maps of shape N x H x W, dtype=np.float32, or an empty array of shape N x 0 x 0 if `return_distance_map` is False
+        """
+        # all distances are calculated in the precision of the parameters
+        infinity = affine_matrices.dtype.type(np.inf)
+        maximum_squared_stddev = affine_matrices.dtype.type(standard_deviations**2)
+        num_images, height, width = images.shape[0], images.shape[1], images.shape[2]
+        num_components = affine_matrices.shape[1]
+        num_channels = used_channel_indexes.shape[0]
+
+        if return_distance_map:
+            distance_maps = np.empty(
+                shape=(num_images, height, width),
+                dtype=np.float32,
+            )
+        else:
+            distance_maps = np.empty(shape=(num_images, 0, 0), dtype=np.float32)
+
+        use_grid = cell_offsets.shape[0] > 0
+        union_boxes = np.empty(shape=(num_images, 2, num_channels), dtype=np.float64)
+        for n in range(num_images):
+            for c in range(num_channels):
+                union_boxes[n, 0, c] = bounding_boxes[n, :, 0, c].min()
+                union_boxes[n, 1, c] = bounding_boxes[n, :, 1, c].max()
+
+        for row in prange(num_images * height):
+            n = row // height
+            i = row - n * height
+            frame_affine_matrices = affine_matrices[n]
+            frame_affine_offsets = affine_offsets[n]
+            frame_bounding_boxes = bounding_boxes[n]
+            frame_union_box = union_boxes[n]
+            frame_grid_bounds = grid_bounds[n]
+
+            pixel = np.empty(num_channels, dtype=affine_matrices.dtype)
+            candidates = np.arange(num_components)
+            scores = np.empty(num_components, dtype=np.float64)
+            for j in range(width):
+                for c in range(num_channels):
+                    pixel[c] = images[n, i, j, used_channel_indexes[c]]
+
+                # without a distance map only components within the threshold are of interest
+                # so only the components whose bounding box or grid cell contains the pixel are tested, nearest first
+                if return_distance_map:
+                    smallest_distance = infinity
+                    num_candidates = num_components
+                elif use_grid:
+                    smallest_distance = maximum_squared_stddev
+                    num_candidates = _query_component_grid(
+                        pixel,
+                        frame_grid_bounds,
+                        grid_shape,
+                        cell_offsets,
+                        cell_components,
+                        candidates,
+                    )
+                else:
+                    smallest_distance = maximum_squared_stddev
+                    num_candidates = _collect_candidate_components(
+                        pixel,
+                        frame_bounding_boxes,
+                        frame_union_box,
+                        candidates,
+                        scores,
+                    )
+                current_closest_layer = 0
+
+                for candidate_index in range(num_candidates):
+                    component_index = candidates[candidate_index]
+                    # the calculation stops once the distance exceeds the current smallest distance
+                    mh_dist = _squared_affine_distance(
+                        pixel,
+                        frame_affine_matrices,
+                        frame_affine_offsets,
+                        component_index,
+                        smallest_distance,
+                    )
+                    if mh_dist < smallest_distance:
+                        smallest_distance = mh_dist
+                        current_closest_layer = component_index + 1
+
+                if smallest_distance < maximum_squared_stddev:
+                    label_maps[n, i, j] = current_closest_layer
+                else:
+                    label_maps[n, i, j] = 0
+                if return_distance_map:
+                    distance_maps[n, i, j] = np.sqrt(smallest_distance)
+
+        return label_maps, distance_maps
+
+    def _generate_layer_label_map(
+        self,
+        image: np.ndarray,
+        mean_background_values: np.ndarray,
+        label_map: np.ndarray = None,
+        workspace: DetectorWorkspace = None,
+    ) -> np.ndarray:
+        """Generates the label map of the image using the selected engine\n
+        Only the "legacy" engine needs the contrast image, all other engines work on the uint8 image directly\n
+
+        Args:
+            image (np.ndarray): The blurred image of shape H x W x 3, dtype=np.uint8
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+            label_map (np.ndarray, optional): A preallocated label map of shape H x W, dtype=np.uint8, see `generate_label_map`. Defaults to None.
+            workspace (DetectorWorkspace, optional): The workspace of the call, see `generate_label_map`. Defaults to None.
+
+        Returns:
+            np.ndarray: The label map of shape (H x W), 0 is the background and k + 1 is the k-th component, dtype=np.uint8
+        """
+        if self.engine == "legacy":
+            contrast_image = MaterialDetector.calculate_contrast_image(
+                image,
+                mean_background_values,
+            )
+            mh_distance_map = self.generate_mh_distance_map_from_contrast_image(
+                contrast_image
+            )
+            semantic_masks = self.postprocess_mh_map(
+                mh_distance_map, distance_threshold=self.standard_deviation_threshold
+            )
+
+            # on exact ties the first component is used, like in the other engines
+            label_map = np.argmax(semantic_masks, axis=0).astype(np.uint8) + 1
+            label_map[semantic_masks.max(axis=0) == 0] = 0
+            return label_map
+
+        return self.generate_label_map(
+            image,
+            mean_background_values,
+            label_map=label_map,
+            workspace=workspace,
+        )
+
+    def _generate_layer_label_maps(
+        self,
+        images: np.ndarray,
+        mean_background_values: np.ndarray,
+        label_maps: np.ndarray,
+        workspace: DetectorWorkspace,
+    ) -> np.ndarray:
+        """Generates the label maps of a stack of images using the selected engine\n
+        The "fused" and "affine" engines classify all images in one call of their kernel, the other engines classify the images one by one\n
+
+        Args:
+            images (np.ndarray): The blurred images of shape N x H x W x 3, dtype=np.uint8
+            mean_background_values (np.ndarray): The mean background values of each image of shape (N x 3) in form BGR
+            label_maps (np.ndarray): The output label maps of shape N x H x W, dtype=np.uint8
+            workspace (DetectorWorkspace): The workspace of the call, see `generate_label_map`
+
+        Returns:
+            np.ndarray: The label maps of shape (N x H x W), 0 is the background and k + 1 is the k-th component, dtype=np.uint8
+        """
+        if self.engine in ("fused", "affine"):
+            return self._classify_frames(
+                images,
+                mean_background_values,
+                False,
+                label_maps,
+            )[0]
+
+        for index in range(len(images)):
+            label_maps[index] = self._generate_layer_label_map(
+                images[index],
+                mean_background_values[index],
+                label_maps[index],
+                workspace,
+            )
+        return label_maps
+
+    @staticmethod
+    @jit(parallel=True, fastmath=True, nopython=True, nogil=True, cache=True)
+    def _label_layer_components(
+        label_map: np.ndarray,
+        eroded_map: np.ndarray,
+        opened_map: np.ndarray,
+        parents: np.ndarray,
+        labeled_mask: np.ndarray,
+        num_threads: int,
+        radius: int = 2,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Removes small outliers of all layers and labels the connected components of all layers in one go\n
+        The result is the same as opening the mask of each layer with a disk and labeling it with `cv2.connectedComponentsWithStats` using 4-connectivity.
+        The openings of different layers never overlap, as the opening of a mask is a subset of the mask, so one label image holds the components of all layers.\n
+        The rows are processed in parallel bands, the components crossing the bands are merged afterwards.
+
+        Args:
+            label_map (NxM Numpy Array): The label map, 0 is the background and k + 1 is the k-th component, dtype=np.uint8
+            eroded_map (NxM Numpy Array): Scratch space for the eroded label map, dtype=np.uint8
+            opened_map (NxM Numpy Array): Scratch space for the opened label map, dtype=np.uint8
+            parents (np.ndarray): Scratch space for the union find forest of shape (N * M), dtype=np.int32
+            labeled_mask (NxM Numpy Array): The output labeled components, dtype=np.int32
+            num_threads (int): The number of bands of rows processed in parallel, usually `numba.get_num_threads()`
+            radius (int, optional): The radius of the disk used for the opening. Defaults to 2.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: The labeled components of shape (N x M), 0 is the background, dtype=np.int32,
+            the statistics of each component of shape (L x 5) in the layout of `cv2.connectedComponentsWithStats` (x, y, w, h, area) and
+            the label of the layer of each component of shape (L), both dtype=np.int32, with L being the number of components including the background.
+            The components are numbered in raster order of their first pixel.
+        """
+        height, width = label_map.shape
+        num_bands = min(height, num_threads)
+
+        # the half width of each row of the disk
+        half_widths = np.zeros(2 * radius + 1, dtype=np.int64)
+        for dy in range(-radius, radius + 1):
+            half_widths[dy + radius] = int(np.sqrt(radius * radius - dy * dy))
+
+        # erode each layer, pixels outside of the image do not erode the layer
+        for i in prange(height):
+            for j in range(width):
+                layer = label_map[i, j]
+                eroded_map[i, j] = 0
+                if layer == 0:
+                    continue
+                is_inside = True
+                for dy in range(-radius, radius + 1):
+                    row = i + dy
+                    if row < 0 or row >= height:
+                        continue
+                    for dx in range(
+                        -half_widths[dy + radius], half_widths[dy + radius] + 1
+                    ):
+                        column = j + dx
+                        if 0 <= column < width and label_map[row, column] != layer:
+                            is_inside = False
+                            break
+                    if not is_inside:
+                        break
+                if is_inside:
+                    eroded_map[i, j] = layer
+
+        # dilate each layer, only pixels of the same layer can be reached by the dilation
+        for i in prange(height):
+            for j in range(width):
+                layer = label_map[i, j]
+                opened_map[i, j] = 0
+                if layer == 0:
+                    continue
+                for dy in range(-radius, radius + 1):
+                    row = i + dy
+                    if row < 0 or row >= height:
+                        continue
+                    for dx in range(
+                        -half_widths[dy + radius], half_widths[dy + radius] + 1
+                    ):
+                        column = j + dx
+                        if 0 <= column < width and eroded_map[row, column] == layer:
+                            opened_map[i, j] = layer
+                            break
+                    if opened_map[i, j] != 0:
+                        break
+
+        # label the components of each band of rows with a union find forest
+        band_starts = np.zeros(num_bands + 1, dtype=np.int64)
+        for band in range(num_bands + 1):
+            band_starts[band] = band * height // num_bands
+
+        for band in prange(num_bands):
+            for i in range(band_starts[band], band_starts[band + 1]):
+                for j in range(width):
+                    index = i * width + j
+                    parents[index] = index
+                    layer = opened_map[i, j]
+                    if layer == 0:
+                        continue
+                    if j > 0 and opened_map[i, j - 1] == layer:
+                        _union_roots(parents, index - 1, index)
+                    if i > band_starts[band] and opened_map[i - 1, j] == layer:
+                        _union_roots(parents, index - width, index)
+
+        # merge the components crossing the borders of the bands
+        for band in range(1, num_bands):
+            i = band_starts[band]
+            for j in range(width):
+                layer = opened_map[i, j]
+                if layer != 0 and opened_map[i - 1, j] == layer:
+                    _union_roots(parents, (i - 1) * width + j, i * width + j)
+
+        # number the roots in raster order
+        band_num_roots = np.zeros(num_bands + 1, dtype=np.int64)
+        for band in prange(num_bands):
+            for i in range(band_starts[band], band_starts[band + 1]):
+                for j in range(width):
+                    index = i * width + j
+                    if opened_map[i, j] != 0 and parents[index] == index:
+                        band_num_roots[band + 1] += 1
+        band_first_labels = np.cumsum(band_num_roots) + 1
+        num_labels = band_first_labels[num_bands]
+
+        component_layers = np.zeros(num_labels, dtype=np.int32)
+        for band in prange(num_bands):
+            label = band_first_labels[band]
+            for i in range(band_starts[band], band_starts[band + 1]):
+                for j in range(width):
+                    index = i * width + j
+                    if opened_map[i, j] != 0 and parents[index] == index:
+                        labeled_mask[i, j] = label
+                        component_layers[label] = opened_map[i, j]
+                        label += 1
+
+        # label all pixels with the label of their root and gather the statistics
+        band_stats = np.zeros(shape=(num_bands, num_labels, 5), dtype=np.int32)
+        band_stats[:, :, 0] = width
+        band_stats[:, :, 1] = height
+        band_stats[:, :, 2] = -1
+        band_stats[:, :, 3] = -1
+        for band in prange(num_bands):
+            for i in range(band_starts[band], band_starts[band + 1]):
+                for j in range(width):
+                    if opened_map[i, j] == 0:
+                        labeled_mask[i, j] = 0
+                        continue
+                    root = _find_root(parents, i * width + j)
+                    label = labeled_mask[root // width, root % width]
+                    labeled_mask[i, j] = label
+                    band_stats[band, label, 0] = min(band_stats[band, label, 0], j)
+                    band_stats[band, label, 1] = min(band_stats[band, label, 1], i)
+                    band_stats[band, label, 2] = max(band_stats[band, label, 2], j)
+                    band_stats[band, label, 3] = max(band_stats[band, label, 3], i)
+                    band_stats[band, label, 4] += 1
+
+        stats = np.zeros(shape=(num_labels, 5), dtype=np.int32)
+        for label in prange(1, num_labels):
+            x_min, y_min, x_max, y_max, area = width, height, -1, -1, 0
+            for band in range(num_bands):
+                x_min = min(x_min, band_stats[band, label, 0])
+                y_min = min(y_min, band_stats[band, label, 1])
+                x_max = max(x_max, band_stats[band, label, 2])
+                y_max = max(y_max, band_stats[band, label, 3])
+                area += band_stats[band, label, 4]
+            stats[label, 0] = x_min
+            stats[label, 1] = y_min
+            stats[label, 2] = x_max - x_min + 1
+            stats[label, 3] = y_max - y_min + 1
+            stats[label, 4] = area
+
+        return labeled_mask, stats, component_layers
+
+    def _count_fast_reject(
+        self,
+        num_checked: int,
+        num_rejected: int,
+    ) -> None:
+        """
+        Adds the frames checked and rejected by the fast reject to `fast_reject_stats`, which is shared by all threads using the detector\n
+
+        Args:
+            num_checked (int): The number of checked frames
+            num_rejected (int): The number of rejected frames
+        """
+        with self._stats_lock:
+            self.fast_reject_stats["checked"] += num_checked
+            self.fast_reject_stats["rejected"] += num_rejected
+
+    def _set_pruning_stats(
+        self,
+        pruning_stats: dict,
+        workspace: DetectorWorkspace,
+    ) -> None:
+        """
+        Stores the pruning statistics of a finished call on the detector and on the workspace of the call\n
+        The statistics are collected in a dictionary of the call and only stored at its end,
+        so with several threads `pruning_stats` of the detector holds the last finished call and each workspace the last call of its thread\n
+
+        Args:
+            pruning_stats (dict): The number of removed candidates of each stage in the call
+            workspace (DetectorWorkspace): The workspace used by the call
+        """
+        workspace.pruning_stats = pruning_stats
+        self.pruning_stats = pruning_stats
+
+    def _prune_flakes(
+        self,
+        flakes: List[Flake],
+        min_confidence: float,
+        max_flakes: int,
+        pruning_stats: dict,
+    ) -> List[int]:
+        """
+        Selects the flakes to keep using only the cheap features of the flakes\n
+        Adds the number of removed flakes to `pruning_stats`.
+
+        Args:
+            flakes (List[Flake]): The flake candidates
+            min_confidence (float): The minimum confidence (1 - false positive probability) of the kept flakes, None keeps all flakes
+            max_flakes (int): The maximum number of kept flakes, the largest flakes are kept, None keeps all flakes
+            pruning_stats (dict): The pruning statistics of the call
+
+        Returns:
+            List[int]: The indexes of the kept flakes in their original order
+        """
+        kept_flake_indexes = list(range(len(flakes)))
+
+        # the same condition as used when visualising the flakes
+        if min_confidence is not None:
+            kept_flake_indexes = [
+                index
+                for index in kept_flake_indexes
+                if (1 - flakes[index].false_positive_probability) > min_confidence
+            ]
+            pruning_stats["confidence"] += len(flakes) - len(kept_flake_indexes)
+
+        if max_flakes is not None and len(kept_flake_indexes) > max_flakes:
+            pruning_stats["max_flakes"] += len(kept_flake_indexes) - max_flakes
+            largest_flake_indexes = sorted(
+                kept_flake_indexes,
+                key=lambda index: flakes[index].size,
+                reverse=True,
+            )[:max_flakes]
+            kept_flake_indexes = sorted(largest_flake_indexes)
+
+        return kept_flake_indexes
+
+    def _get_requested_features(
+        self,
+        features: Iterable[str],
+    ) -> set:
+        """
+        Checks the features requested from `detect_flakes`\n
+
+        Args:
+            features (Iterable[str]): The requested features, None requests all features
+
+        Returns:
+            set: The requested features
+        """
+        if features is None:
+            return set(MaterialDetector.FLAKE_FEATURES)
+
+        if isinstance(features, str):
+            features = [features]
+
+        features = set(features)
+        unknown_features = features - set(MaterialDetector.FLAKE_FEATURES)
+        if unknown_features:
+            raise ValueError(
+                f"Unknown features {sorted(unknown_features)}, expected any of {MaterialDetector.FLAKE_FEATURES}"
+            )
+        return features
+
+    def _format_detected_flakes(
+        self,
+        detected_flakes: List[Flake],
+        as_table: bool,
+        frame_index: int = 0,
+    ) -> Union[np.ndarray, FlakeTable]:
+        """
+        Converts the detected flakes to the requested return type of `detect_flakes`\n
+
+        Args:
+            detected_flakes (List[Flake]): The detected flakes
+            as_table (bool): If True the flakes are returned as a FlakeTable
+            frame_index (int, optional): The frame index of the FlakeTable. Defaults to 0.
+
+        Returns:
+            Union[np.ndarray, FlakeTable]: An Array of Flakes or a FlakeTable
+        """
+        if as_table:
+            return FlakeTable.from_flakes(
+                detected_flakes,
+                layer_names=[
+                    self.layer_name_lookup[layer_index]
+                    for layer_index in range(len(self.layer_name_lookup))
+                ],
+                frame_index=frame_index,
+            )
+        return np.array(detected_flakes)
+
+    def detect_flakes(
+        self,
+        image: np.ndarray,
+        as_table: bool = False,
+        features: Iterable[str] = None,
+        min_confidence: float = None,
+        max_flakes: int = None,
+        layers: Iterable[str] = None,
+        workspace: DetectorWorkspace = None,
+    ) -> Union[List[Flake], FlakeTable]:
+        """
+        Detects Flakes in the given Image.\n
+        Expects images without vignette.\n
+        The mask, thickness, size, center and sidelengths are always calculated, the other features only if requested.
+        Features that are not calculated keep their default value, NaN for the mean contrast, 0 for the false positive probability and -1 for the entropy.\n
+        Flakes removed by `layers`, `min_confidence` or `max_flakes` are removed before the contrast and entropy are calculated,
+        the number of removed candidates of each stage is stored in `pruning_stats` of the detector and of the workspace.\n
+
+        Args:
+            image (NxMx3 Numpy Array): The original image without vignette, Expected to be in format BGR
+            as_table (bool, optional): If True the flakes are returned as a FlakeTable with one column per attribute. Defaults to False.
+            features (Iterable[str], optional): The features to calculate, any of `MaterialDetector.FLAKE_FEATURES`. Defaults to None, which calculates all features.
+            min_confidence (float, optional): The minimum confidence (1 - false positive probability) of the returned flakes, also calculates the false positive probability. Defaults to None.
+            max_flakes (int, optional): The maximum number of returned flakes, the largest flakes are kept. Defaults to None.
+            layers (Iterable[str], optional): The names of the layers to detect flakes of. Defaults to None, which detects all layers.
+            workspace (DetectorWorkspace, optional): The reusable buffers used for this call, needed when the detector is used by several threads at once. Defaults to None, meaning the workspace of the detector is used.
+
+        Returns:
+            (Kx1 Numpy Array): An Array of Flakes, or a FlakeTable if `as_table` is True
+        """
+
+        assert (
+            image.shape[2] == 3
+        ), f"The Image has to have the shape of NxMx3, the shape is {image.shape}"
+        assert image.dtype == np.uint8, "The Image has to be of type uint8"
+
+        features = self._get_requested_features(features)
+
+        pruning_stats = {"layer": 0, "size": 0, "confidence": 0, "max_flakes": 0}
+
+        if workspace is None:
+            workspace = self.workspace
+        workspace.prepare(image.shape, len(self.layer_name_lookup))
+        height, width = image.shape[:2]
+
+        image = cv2.medianBlur(
+            image,
+            5,
+            dst=workspace.get("blurred_image", image.shape, np.uint8),
+        )
+
+        if self.fast_reject:
+            # the histograms of the channels are also used to estimate the background
+            (
+                color_histogram,
+                channel_histograms,
+            ) = MaterialDetector._get_color_histograms(
+                image,
+                MaterialDetector._get_color_histogram_buffer(workspace),
+            )
+            mean_background_values = (
+                MaterialDetector._get_mean_background_values_from_histograms(
+                    channel_histograms
+                )
+            )
+
+            is_rejected = not self._could_contain_flakes(
+                color_histogram, mean_background_values
+            )
+            self._count_fast_reject(1, int(is_rejected))
+            if is_rejected:
+                self._set_pruning_stats(pruning_stats, workspace)
+                return self._format_detected_flakes([], as_table)
+        else:
+            mean_background_values = MaterialDetector.get_mean_background_values_numba(
+                image,
+            )
+
+        label_map = self._generate_layer_label_map(
+            image,
+            mean_background_values,
+            workspace.get("label_map", (height, width), np.uint8),
+            workspace,
+        )
+
+        detected_flakes = self._extract_flakes(
+            image,
+            mean_background_values,
+            label_map,
+            features,
+            min_confidence,
+            max_flakes,
+            layers,
+            workspace,
+            pruning_stats,
+        )
+        self._set_pruning_stats(pruning_stats, workspace)
+        return self._format_detected_flakes(detected_flakes, as_table)
+
+    def detect_flakes_batch(
+        self,
+        images: Union[np.ndarray, List[np.ndarray]],
+        as_table: bool = False,
+        features: Iterable[str] = None,
+        min_confidence: float = None,
+        max_flakes: int = None,
+        layers: Iterable[str] = None,
+        workspace: DetectorWorkspace = None,
+    ) -> List[Union[List[Flake], FlakeTable]]:
+        """
+        Detects Flakes in a stack of images of the same shape.\n
+        The histograms for the background estimation and the fast reject of all images are calculated in one parallel kernel call,
+        which splits the work over the frames and their rows. The "fused" and "affine" engines also classify the pixels of all images in one kernel call,
+        the "unique", "lut" and "legacy" engines classify the images one by one. The flakes of each frame are then extracted one by one.\n
+        Gives the same flakes as calling `detect_flakes` on each image, `pruning_stats` holds the sum over all frames.\n
+
+        Args:
+            images (N x H x W x 3 Numpy Array or List of H x W x 3 Numpy Arrays): The original images without vignette, Expected to be in format BGR
+            as_table (bool, optional): If True the flakes of each frame are returned as a FlakeTable with the `frame_index` set to the index of the frame. Defaults to False.
+            features (Iterable[str], optional): The features to calculate, see `detect_flakes`. Defaults to None, which calculates all features.
+            min_confidence (float, optional): The minimum confidence of the returned flakes, see `detect_flakes`. Defaults to None.
+            max_flakes (int, optional): The maximum number of returned flakes per frame, see `detect_flakes`. Defaults to None.
+            layers (Iterable[str], optional): The names of the layers to detect flakes of. Defaults to None, which detects all layers.
+            workspace (DetectorWorkspace, optional): The reusable buffers used for this call, see `detect_flakes`. Defaults to None, meaning the workspace of the detector is used.
+
+        Returns:
+            List: The result of `detect_flakes` for each image, in the order of the images
+        """
+        if len(images) == 0:
+            return []
+
+        frame_shape = images[0].shape
+        for image in images:
+            if image.shape != frame_shape or image.ndim != 3 or image.shape[2] != 3:
+                raise ValueError(
+                    f"All images have to have the same shape of NxMx3, got {image.shape} and {frame_shape}"
+                )
+            if image.dtype != np.uint8:
+                raise ValueError("The images have to be of type uint8")
+
+        features = self._get_requested_features(features)
+
+        pruning_stats = {"layer": 0, "size": 0, "confidence": 0, "max_flakes": 0}
+
+        if workspace is None:
+            workspace = self.workspace
+        workspace.prepare(frame_shape, len(self.layer_name_lookup))
+        num_images = len(images)
+        height, width = frame_shape[:2]
+
+        blurred_images = workspace.get(
+            "blurred_images", (num_images, *frame_shape), np.uint8
+        )
+        for index, image in enumerate(images):
+            cv2.medianBlur(image, 5, dst=blurred_images[index])
+
+        # the histograms of the channels are used to estimate the background of every frame
+        color_histograms, channel_histograms = self._get_color_histograms_batch(
+            blurred_images,
+            *MaterialDetector._get_color_histogram_buffers_batch(workspace, num_images),
+        )
+        mean_background_values = np.stack(
+            [
+                self._get_mean_background_values_from_histograms(frame_histograms)
+                for frame_histograms in channel_histograms
+            ]
+        )
+
+        kept_indexes = np.arange(num_images)
+        if self.fast_reject:
+            kept_indexes = np.array(
+                [
+                    index
+                    for index in range(num_images)
+                    if self._could_contain_flakes(
+                        color_histograms[index], mean_background_values[index]
+                    )
+                ],
+                dtype=np.int64,
+            )
+            self._count_fast_reject(num_images, num_images - len(kept_indexes))
+
+        results = [None] * num_images
+        for index in range(num_images):
+            results[index] = self._format_detected_flakes([], as_table, index)
+        if len(kept_indexes) == 0:
+            self._set_pruning_stats(pruning_stats, workspace)
+            return results
+
+        # only the kept frames are classified
+        kept_images = blurred_images
+        if len(kept_indexes) != num_images:
+            kept_images = np.ascontiguousarray(blurred_images[kept_indexes])
+        label_maps = self._generate_layer_label_maps(
+            kept_images,
+            np.ascontiguousarray(mean_background_values[kept_indexes]),
+            workspace.get("label_maps", (len(kept_indexes), height, width), np.uint8),
+            workspace,
+        )
+
+        for label_map, index in zip(label_maps, kept_indexes):
+            detected_flakes = self._extract_flakes(
+                blurred_images[index],
+                mean_background_values[index],
+                label_map,
+                features,
+                min_confidence,
+                max_flakes,
+                layers,
+                workspace,
+                pruning_stats,
+            )
+            results[index] = self._format_detected_flakes(
+                detected_flakes, as_table, int(index)
+            )
+        self._set_pruning_stats(pruning_stats, workspace)
+        return results
+
+    def _get_tile_size(
+        self,
+        memory_budget: int,
+        halo: int,
+    ) -> int:
+        """
+        Calculates the largest tile size for which the buffers of one tile fit into the memory budget\n
+        The estimate counts the copy of the tile, the blurred tile and the label maps of `detect_flakes`,
+        the "legacy" engine additionally needs the contrast image and the distance map of each component\n
+
+        Args:
+            memory_budget (int): The memory available for one tile in bytes
+            halo (int): The width of the halo around each tile in pixels
+
+        Returns:
+            int: The side length of the core of the tiles in pixels
+        """
+        # raw and blurred tile, the label, eroded, opened, allowed and gray maps, the union find parents and the labeled mask
+        bytes_per_pixel = 3 + 3 + 5 * 1 + 4 + 4
+        if self.engine == "legacy":
+            bytes_per_pixel += 3 * 8 + len(self.contrast_means) * (4 + 1) + 8
+
+        padded_tile_size = int(np.sqrt(memory_budget / bytes_per_pixel))
+        tile_size = padded_tile_size - 2 * halo
+        if tile_size < halo:
+            raise ValueError(
+                f"The memory budget of {memory_budget} bytes is too small for a halo of {halo} pixels"
+            )
+        return tile_size
+
+    def _get_mosaic_background_values(
+        self,
+        mosaic: np.ndarray,
+        tile_size: int,
+        workspace: DetectorWorkspace,
+    ) -> np.ndarray:
+        """
+        Calculates the mean background values of a whole mosaic from the histograms of its tiles\n
+        Each tile is read with a border of 2 pixels for the median blur, so the result is the same as for the whole mosaic in memory\n
+
+        Args:
+            mosaic (np.ndarray): The mosaic of shape H x W x 3, dtype=np.uint8, only read tile by tile
+            tile_size (int): The side length of the tiles in pixels
+            workspace (DetectorWorkspace): The reusable buffers
+
+        Returns:
+            np.ndarray: The mean background values for each channel in form BGR, dtype=np.float32
+        """
+        height, width = mosaic.shape[:2]
+        channel_histograms = np.zeros(shape=(3, 256), dtype=np.int64)
+        border = 2
+
+        for tile_y in range(0, height, tile_size):
+            for tile_x in range(0, width, tile_size):
+                y0, x0 = max(tile_y - border, 0), max(tile_x - border, 0)
+                y1 = min(tile_y + tile_size + border, height)
+                x1 = min(tile_x + tile_size + border, width)
+
+                blurred_tile = cv2.medianBlur(
+                    np.ascontiguousarray(mosaic[y0:y1, x0:x1]), 5
+                )
+                core = np.ascontiguousarray(
+                    blurred_tile[
+                        tile_y - y0 : min(tile_y + tile_size, height) - y0,
+                        tile_x - x0 : min(tile_x + tile_size, width) - x0,
+                    ]
+                )
+                channel_histograms += MaterialDetector._get_color_histograms(
+                    core,
+                    MaterialDetector._get_color_histogram_buffer(workspace),
+                )[1]
+
+        return MaterialDetector._get_mean_background_values_from_histograms(
+            channel_histograms
+        )
+
+    def detect_flakes_tiled(
+        self,
+        mosaic: np.ndarray,
+        tile_size: int = None,
+        halo: int = 256,
+        memory_budget: int = 512 * 1024**2,
+        background: Union[str, np.ndarray] = "global",
+        as_table: bool = False,
+        features: Iterable[str] = None,
+        min_confidence: float = None,
+        max_flakes: int = None,
+        layers: Iterable[str] = None,
+        workspace: DetectorWorkspace = None,
+    ) -> Union[List[Flake], FlakeTable]:
+        """
+        Detects Flakes in a mosaic which does not fit into memory by processing it in overlapping tiles.\n
+        The mosaic can be any array which is sliced tile by tile, e.g. a `np.memmap`, `np.load(path, mmap_mode="r")` or a zarr or h5py array.
+        Only one tile with its halo and the buffers of `detect_flakes` are held in memory at a time.\n
+        Every tile is processed together with a halo of `halo` pixels on each side. A flake is kept by the tile which contains the top left corner
+        of its bounding box, so flakes crossing the tile edges are found exactly once if their bounding box is at most `halo - TILE_CONTEXT` pixels wide and high.
+        Larger flakes are cut off at the tile edges, they are counted in `tiling_stats["truncated"]` and extracted again after all tiles
+        from a window around them, which is grown until the whole flake is inside, see `tiling_stats["recovered"]`.
+        Parts which are no flake in the grown window are counted in `tiling_stats["lost"]` and a warning is issued.
+        With the global background the flakes are the same as those of `detect_flakes` on the whole mosaic.\n
+        The flakes are in the coordinates of the mosaic and store only the mask of their bounding box, use `cropped_mask`, `bounding_box` or `to_rle`
+        instead of `mask`, which creates a mask with the size of the mosaic.\n
+
+        Args:
+            mosaic (H x W x 3 Array): The mosaic without vignette in format BGR, dtype=np.uint8
+            tile_size (int, optional): The side length of the tiles without the halo in pixels. Defaults to None, meaning the largest size within `memory_budget`.
+            halo (int, optional): The width of the overlap around each tile in pixels, has to be larger than `TILE_CONTEXT`. Defaults to 256.
+            memory_budget (int, optional): The memory used for one tile in bytes, only used if `tile_size` is None. Defaults to 512 MiB.
+            background (Union[str, np.ndarray], optional): "global" estimates the background from the histogram of the whole mosaic in an extra pass,
+                "tile" estimates it for each tile with its halo, an array of the mean background values in form BGR is used directly. Defaults to "global".
+            as_table (bool, optional): If True the flakes are returned as a FlakeTable. Defaults to False.
+            features (Iterable[str], optional): The features to calculate, see `detect_flakes`. Defaults to None, which calculates all features.
+            min_confidence (float, optional): The minimum confidence of the returned flakes, see `detect_flakes`. Defaults to None.
+            max_flakes (int, optional): The maximum number of returned flakes of the whole mosaic, the largest flakes are kept. Defaults to None.
+            layers (Iterable[str], optional): The names of the layers to detect flakes of. Defaults to None, which detects all layers.
+            workspace (DetectorWorkspace, optional): The reusable buffers used for this call, see `detect_flakes`. Defaults to None, meaning the workspace of the detector is used.
+
+        Returns:
+            (Kx1 Numpy Array): An Array of Flakes sorted by layer and position, or a FlakeTable if `as_table` is True
+        """
+        if len(mosaic.shape) != 3 or mosaic.shape[2] != 3:
+            raise ValueError(
+                f"The mosaic has to have the shape of NxMx3, the shape is {mosaic.shape}"
+            )
+        if mosaic.dtype != np.uint8:
+            raise ValueError("The mosaic has to be of type uint8")
+        if halo <= self.TILE_CONTEXT:
+            raise ValueError(
+                f"The halo has to be larger than {self.TILE_CONTEXT} pixels, got {halo}"
+            )
+        if isinstance(background, str) and background not in ("global", "tile"):
+            raise ValueError(
+                f"Unknown background '{background}', expected 'global', 'tile' or the mean background values"
+            )
+
+        features = self._get_requested_features(features)
+        if tile_size is None:
+            tile_size = self._get_tile_size(memory_budget, halo)
+
+        pruning_stats = {"layer": 0, "size": 0, "confidence": 0, "max_flakes": 0}
+        tiling_stats = {
+            "tiles": 0,
+            "halo_duplicates": 0,
+            "truncated": 0,
+            "recovered": 0,
+            "lost": 0,
+        }
+
+        if workspace is None:
+            workspace = self.workspace
+        height, width = mosaic.shape[:2]
+
+        # the tallest row and the widest column of tiles are processed first, so the buffers are allocated once
+        # for the largest tile and the smaller tiles at the edges of the mosaic reuse their memory
+        tile_rows = sorted(
+            range(0, height, tile_size),
+            key=lambda tile_y: max(tile_y - halo, 0)
+            - min(tile_y + tile_size + halo, height),
+        )
+        tile_columns = sorted(
+            range(0, width, tile_size),
+            key=lambda tile_x: max(tile_x - halo, 0)
+            - min(tile_x + tile_size + halo, width),
+        )
+        workspace_shape = (
+            min(tile_rows[0] + tile_size + halo, height) - max(tile_rows[0] - halo, 0),
+            min(tile_columns[0] + tile_size + halo, width)
+            - max(tile_columns[0] - halo, 0),
+            3,
+        )
+        workspace.prepare(workspace_shape, len(self.layer_name_lookup))
+
+        mean_background_values = None
+        if isinstance(background, str) and background == "global":
+            mean_background_values = self._get_mosaic_background_values(
+                mosaic, tile_size, workspace
+            )
+        elif not isinstance(background, str):
+            mean_background_values = np.asarray(background, dtype=np.float32)
+
+        detected_flakes = []
+        # the bounding boxes in coordinates of the mosaic, the layers and the backgrounds of the flakes cut off at a tile edge
+        truncated_candidates = []
+        for tile_y in tile_rows:
+            for tile_x in tile_columns:
+                tiling_stats["tiles"] += 1
+
+                # the tile with its halo, clipped to the mosaic
+                y0, x0 = max(tile_y - halo, 0), max(tile_x - halo, 0)
+                y1 = min(tile_y + tile_size + halo, height)
+                x1 = min(tile_x + tile_size + halo, width)
+                tile = np.ascontiguousarray(mosaic[y0:y1, x0:x1])
+                tile = cv2.medianBlur(
+                    tile,
+                    5,
+                    dst=workspace.get("blurred_image", tile.shape, np.uint8),
+                )
+
+                tile_background_values = mean_background_values
+                if self.fast_reject or tile_background_values is None:
+                    (
+                        color_histogram,
+                        channel_histograms,
+                    ) = MaterialDetector._get_color_histograms(
+                        tile,
+                        MaterialDetector._get_color_histogram_buffer(workspace),
+                    )
+                    if tile_background_values is None:
+                        tile_background_values = MaterialDetector._get_mean_background_values_from_histograms(
+                            channel_histograms
+                        )
+
+                    if self.fast_reject:
+                        is_rejected = not self._could_contain_flakes(
+                            color_histogram, tile_background_values
+                        )
+                        self._count_fast_reject(1, int(is_rejected))
+                        if is_rejected:
+                            continue
+
+                label_map = self._generate_layer_label_map(
+                    tile,
+                    tile_background_values,
+                    workspace.get("label_map", tile.shape[:2], np.uint8),
+                    workspace,
+                )
+
+                # the bounds of the core of the tile and the edges within the mosaic, in coordinates of the tile
+                core_x0, core_y0 = tile_x - x0, tile_y - y0
+                core_x1 = min(tile_x + tile_size, width) - x0
+                core_y1 = min(tile_y + tile_size, height) - y0
+                inner_x0 = self.TILE_CONTEXT if x0 > 0 else 0
+                inner_y0 = self.TILE_CONTEXT if y0 > 0 else 0
+                inner_x1 = x1 - x0 - (self.TILE_CONTEXT if x1 < width else 0)
+                inner_y1 = y1 - y0 - (self.TILE_CONTEXT if y1 < height else 0)
+
+                def is_owned_by_tile(
+                    x: int, y: int, w: int, h: int, layer_name: str
+                ) -> bool:
+                    # the tile which contains the top left corner of a flake extracts it
+                    if not (core_x0 <= x < core_x1 and core_y0 <= y < core_y1):
+                        tiling_stats["halo_duplicates"] += 1
+                        return False
+                    # flakes close to a tile edge inside the mosaic may be cut off
+                    if (
+                        x < inner_x0
+                        or y < inner_y0
+                        or x + w > inner_x1
+                        or y + h > inner_y1
+                    ):
+                        tiling_stats["truncated"] += 1
+                        truncated_candidates.append(
+                            ((x + x0, y + y0, w, h), layer_name, tile_background_values)
+                        )
+                        return False
+                    return True
+
+                tile_flakes = self._extract_flakes(
+                    tile,
+                    tile_background_values,
+                    label_map,
+                    features,
+                    min_confidence,
+                    None,
+                    layers,
+                    workspace,
+                    pruning_stats,
+                    candidate_filter=is_owned_by_tile,
+                    offset=(x0, y0),
+                )
+
+                # the centers are already in the coordinates of the mosaic
+                for flake in tile_flakes:
+                    x, y, w, h = flake.bounding_box
+                    flake.bounding_box = (x + x0, y + y0, w, h)
+                    flake.image_shape = (height, width)
+                detected_flakes.extend(tile_flakes)
+
+        # the flakes cut off at a tile edge are extracted again from a window grown to their size
+        detected_keys = {
+            (flake.thickness, tuple(flake.bounding_box)) for flake in detected_flakes
+        }
+        for bounding_box, layer_name, tile_background_values in truncated_candidates:
+            recovered_flakes, is_found = self._extract_truncated_flake(
+                mosaic,
+                bounding_box,
+                layer_name,
+                halo,
+                tile_background_values,
+                features,
+                min_confidence,
+                workspace,
+                workspace_shape,
+            )
+            if not is_found:
+                tiling_stats["lost"] += 1
+            # several parts of one flake lead to the same flake
+            for flake in recovered_flakes:
+                key = (flake.thickness, tuple(flake.bounding_box))
+                if key not in detected_keys:
+                    detected_keys.add(key)
+                    detected_flakes.append(flake)
+                    tiling_stats["recovered"] += 1
+
+        if tiling_stats["lost"] > 0:
+            warnings.warn(
+                f"{tiling_stats['lost']} of {tiling_stats['truncated']} flakes cut off at the tile edges were not found again, "
+                "a larger halo avoids cutting them off",
+                RuntimeWarning,
+            )
+
+        # the order does not depend on the tiling, by layer and then by the top left corner
+        detected_flakes.sort(
+            key=lambda flake: (
+                self.layer_index_lookup[flake.thickness],
+                flake.bounding_box[1],
+                flake.bounding_box[0],
+            )
+        )
+        kept_flake_indexes = self._prune_flakes(
+            detected_flakes, None, max_flakes, pruning_stats
+        )
+        detected_flakes = [detected_flakes[index] for index in kept_flake_indexes]
+
+        self.tiling_stats = tiling_stats
+        self._set_pruning_stats(pruning_stats, workspace)
+        return self._format_detected_flakes(detected_flakes, as_table)
+
+    def _extract_truncated_flake(
+        self,
+        mosaic: np.ndarray,
+        bounding_box: Tuple[int, int, int, int],
+        layer_name: str,
+        halo: int,
+        mean_background_values: np.ndarray,
+        features: Tuple[str, ...],
+        min_confidence: float,
+        workspace: DetectorWorkspace,
+        workspace_shape: Tuple[int, int, int],
+    ) -> Tuple[List[Flake], bool]:
+        """
+        Extracts a flake which is cut off at the edge of its tile from a window around the part seen by the tile\n
+        The window has a margin of `halo` pixels around the flake and is grown as long as the flake reaches
+        closer than `TILE_CONTEXT` pixels to an edge of the window inside the mosaic\n
+
+        Args:
+            mosaic (np.ndarray): The mosaic of shape H x W x 3, dtype=np.uint8
+            bounding_box (Tuple[int, int, int, int]): The bounding box (x, y, w, h) of the part seen by the tile in coordinates of the mosaic
+            layer_name (str): The layer of the flake
+            halo (int): The margin of the window around the flake in pixels
+            mean_background_values (np.ndarray): The mean background values used for the tile of the part for each channel in form BGR
+            features (Tuple[str, ...]): The features to calculate, see `_get_requested_features`
+            min_confidence (float): The minimum confidence of the returned flake, or None
+            workspace (DetectorWorkspace): The reusable buffers
+            workspace_shape (Tuple[int, int, int]): The shape the buffers of the workspace are prepared for
+
+        Returns:
+            Tuple[List[Flake], bool]: The flake in coordinates of the mosaic, which is empty if it is removed by `min_confidence`,
+            and whether a flake containing the part was found
+        """
+        height, width = mosaic.shape[:2]
+        part_x, part_y, part_w, part_h = bounding_box
+        x_min, y_min, x_max, y_max = part_x, part_y, part_x + part_w, part_y + part_h
+
+        while True:
+            y0, x0 = max(y_min - halo, 0), max(x_min - halo, 0)
+            y1, x1 = min(y_max + halo, height), min(x_max + halo, width)
+            window = np.ascontiguousarray(mosaic[y0:y1, x0:x1])
+
+            # windows within the largest tile reuse the buffers of the tiles
+            workspace.prepare(
+                tuple(np.maximum(window.shape, workspace_shape).tolist()),
+                len(self.layer_name_lookup),
+            )
+            window = cv2.medianBlur(
+                window,
+                5,
+                dst=workspace.get("blurred_image", window.shape, np.uint8),
+            )
+            label_map = self._generate_layer_label_map(
+                window,
+                mean_background_values,
+                workspace.get("label_map", window.shape[:2], np.uint8),
+                workspace,
+            )
+
+            inner_x0 = self.TILE_CONTEXT if x0 > 0 else 0
+            inner_y0 = self.TILE_CONTEXT if y0 > 0 else 0
+            inner_x1 = x1 - x0 - (self.TILE_CONTEXT if x1 < width else 0)
+            inner_y1 = y1 - y0 - (self.TILE_CONTEXT if y1 < height else 0)
+            search = {"is_found": False, "grown_box": None}
+
+            def is_truncated_flake(
+                x: int, y: int, w: int, h: int, candidate_layer_name: str
+            ) -> bool:
+                # the flake contains the part, whose edges within `TILE_CONTEXT` of the tile edge may differ
+                if (
+                    candidate_layer_name != layer_name
+                    or search["is_found"]
+                    or x + x0 > part_x
+                    or y + y0 > part_y
+                    or x + x0 + w < part_x + part_w - self.TILE_CONTEXT
+                    or y + y0 + h < part_y + part_h - self.TILE_CONTEXT
+                ):
+                    return False
+                if x < inner_x0 or y < inner_y0 or x + w > inner_x1 or y + h > inner_y1:
+                    search["grown_box"] = (x + x0, y + y0, x + x0 + w, y + y0 + h)
+                    return False
+                search["is_found"] = True
+                return True
+
+            flakes = self._extract_flakes(
+                window,
+                mean_background_values,
+                label_map,
+                features,
+                min_confidence,
+                None,
+                None,
+                workspace,
+                # the candidates of the window are already counted by the tiles
+                {"layer": 0, "size": 0, "confidence": 0, "max_flakes": 0},
+                candidate_filter=is_truncated_flake,
+                offset=(x0, y0),
+            )
+            if search["is_found"] or search["grown_box"] is None:
+                for flake in flakes:
+                    x, y, w, h = flake.bounding_box
+                    flake.bounding_box = (x + x0, y + y0, w, h)
+                    flake.image_shape = (height, width)
+                return flakes, search["is_found"]
+
+            # the window only grows, so the search ends at the latest with the whole mosaic
+            x_min = min(x_min, search["grown_box"][0])
+            y_min = min(y_min, search["grown_box"][1])
+            x_max = max(x_max, search["grown_box"][2])
+            y_max = max(y_max, search["grown_box"][3])
+
+    def _extract_flakes(
+        self,
+        image: np.ndarray,
+        mean_background_values: np.ndarray,
+        label_map: np.ndarray,
+        features: Tuple[str, ...],
+        min_confidence: float,
+        max_flakes: int,
+        layers: Iterable[str],
+        workspace: DetectorWorkspace,
+        pruning_stats: dict,
+        candidate_filter: Callable[[int, int, int, int, str], bool] = None,
+        offset: Tuple[int, int] = (0, 0),
+    ) -> List[Flake]:
+        """
+        Extracts the flakes of one image from its label map and calculates the requested features, see `detect_flakes`\n
+        The removed candidates are added to `pruning_stats`, except those removed by `candidate_filter`.
+
+        Args:
+            image (np.ndarray): The blurred image of shape H x W x 3, dtype=np.uint8
+            mean_background_values (np.ndarray): The mean background values for each channel in form BGR
+            label_map (np.ndarray): The label map of the image of shape H x W, dtype=np.uint8
+            features (Tuple[str, ...]): The features to calculate, see `_get_requested_features`
+            min_confidence (float): The minimum confidence of the returned flakes, or None
+            max_flakes (int): The maximum number of returned flakes, or None
+            layers (Iterable[str]): The names of the layers to detect flakes of, or None for all layers
+            workspace (DetectorWorkspace): The reusable buffers, prepared for the shape of the image
+            pruning_stats (dict): The pruning statistics of the call, the removed candidates are added to it
+            candidate_filter (Callable[[int, int, int, int, str], bool], optional): Called with the bounding box (x, y, w, h) and the layer name of each candidate above the size threshold,
+                candidates for which it returns False are skipped before any feature is calculated. Defaults to None, meaning all candidates are kept.
+            offset (Tuple[int, int], optional): The position (x, y) of the image in a larger image, the contours and centers are calculated in the coordinates of the larger image. Defaults to (0, 0).
+
+        Returns:
+            List[Flake]: The detected flakes
+        """
+        height, width = image.shape[:2]
+        offset_x, offset_y = offset
+        has_fp_detector = (
+            self.FP_Detector is not None or self.FP_coefficients is not None
+        )
+        calculate_fp_probability = has_fp_detector and (
+            "false_positive_probability" in features or min_confidence is not None
+        )
+
+        detected_flakes = []
+        fp_features = []
+
+        # Skip the layers which are not requested
+        if layers is not None:
+            layer_lookup = np.arange(256, dtype=np.uint8)
+            for layer_index, layer_name in self.layer_name_lookup.items():
+                if layer_name not in layers:
+                    layer_lookup[layer_index + 1] = 0
+                    pruning_stats["layer"] += 1
+            label_map = cv2.LUT(
+                label_map,
+                layer_lookup,
+                dst=workspace.get("allowed_label_map", (height, width), np.uint8),
+            )
+
+        # Remove small outliers and label each connected 'blob' of each layer with an individual number
+        # each of these blobs is a flake candidate
+        # the statistics contain the bounding box and the size of each candidate
+        (
+            labeled_mask,
+            stats,
+            component_layers,
+        ) = MaterialDetector._label_layer_components(
+            label_map,
+            workspace.get("eroded_map", (height, width), np.uint8),
+            workspace.get("opened_map", (height, width), np.uint8),
+            workspace.get("union_find_parents", (height * width,), np.int32),
+            workspace.get("labeled_mask", (height, width), np.int32),
+            get_num_threads(),
+        )
+
+        # the labels are kept to calculate the contrast of the remaining flakes
+        flake_labels = []
+
+        # iterate over all flake candidates IDs layer by layer, the 0 ID is the background
+        for i in (np.argsort(component_layers[1:], kind="stable") + 1).tolist():
+            layer_name = self.layer_name_lookup[component_layers[i] - 1]
+
+            # if the flake has less pixel than the Threshold skip it
+            flake_size = int(stats[i, cv2.CC_STAT_AREA])
+            if flake_size < self.size_threshold:
+                pruning_stats["size"] += 1
+                continue
+
+            # all further work is done inside the bounding box of the flake
+            x, y, w, h = stats[i, :4]
+            if candidate_filter is not None and not candidate_filter(
+                int(x), int(y), int(w), int(h), layer_name
+            ):
+                continue
+
+            # mask out only the pixels of the flake, with a one pixel border
+            # so the contours at the edge of the box are traced the same way as in the full image
+            masked_flake_box = np.zeros(shape=(h + 2, w + 2), dtype=np.uint8)
+            masked_flake_box[1:-1, 1:-1] = cv2.inRange(
+                labeled_mask[y : y + h, x : x + w], i, i
+            )
+
+            # the contours are returned in the coordinates of the full image
+            contours, hierarchy = cv2.findContours(
+                image=masked_flake_box,
+                mode=cv2.RETR_TREE,
+                method=cv2.CHAIN_APPROX_NONE,
+                offset=(int(x) + offset_x - 1, int(y) + offset_y - 1),
+            )
+
+            # extract the toplevel contour by finding the contour with no parents
+            top_level_contour = [
+                contours[i] for i in range(len(contours)) if hierarchy[0, i, 3] == -1
+            ]
+
+            # Fill all the holes in the contour by redrawing the contour
+            masked_flake_box = cv2.drawContours(
+                masked_flake_box,
+                top_level_contour,
+                -1,
+                255,
+                -1,
+                offset=(1 - int(x) - offset_x, 1 - int(y) - offset_y),
+            )
+
+            #### Gather the features for the false positive probability
+            if calculate_fp_probability:
+                fp_features.append(self._get_fp_features(top_level_contour[0]))
+
+            #### Calculate the Aspect Ratio and Center Position of the Flake
+            ((center_x, center_y), (width_r, height_r), _) = cv2.minAreaRect(
+                top_level_contour[0]
+            )
+
+            # only the bounding box of the mask is stored in the flake
+            flake = Flake(
+                mask=masked_flake_box[1:-1, 1:-1].copy(),
+                thickness=layer_name,
+                size=flake_size,
+                mean_contrast=[np.nan, np.nan, np.nan],
+                center=(int(center_x), int(center_y)),
+                min_sidelength=min(width_r, height_r),
+                max_sidelength=max(width_r, height_r),
+                bounding_box=(x, y, w, h),
+                image_shape=labeled_mask.shape,
+            )
+
+            detected_flakes.append(flake)
+            flake_labels.append(i)
+
+        #### Calculate the false positive probability of all flakes at once
+        if calculate_fp_probability:
+            false_positive_probabilities = self._get_fp_probabilities(
+                np.array(fp_features, dtype=np.float64).reshape(-1, 2)
+            )
+            for flake, false_positive_probability in zip(
+                detected_flakes, false_positive_probabilities
+            ):
+                flake.false_positive_probability = false_positive_probability
+
+        #### Prune the flakes before calculating the expensive features
+        kept_flake_indexes = self._prune_flakes(
+            detected_flakes,
+            min_confidence,
+            max_flakes,
+            pruning_stats,
+        )
+        detected_flakes = [detected_flakes[index] for index in kept_flake_indexes]
+        flake_labels = [flake_labels[index] for index in kept_flake_indexes]
+
+        #### Calculate the Contrast of the Flakes
+        if "mean_contrast" in features and len(detected_flakes) > 0:
+            # the pixel sums of all candidates are gathered in one pass
+            label_sums = MaterialDetector._get_label_sums(
+                labeled_mask,
+                image,
+                len(stats),
+                get_num_threads(),
+            )
+
+            for flake, label in zip(detected_flakes, flake_labels):
+                # the filled holes are not part of the label sums and are added separately
+                x, y, w, h = flake.bounding_box
+                pixel_sums = label_sums[label].astype(np.float64)
+                num_pixels = flake.size
+                hole_pixels = (flake.cropped_mask != 0) & (
+                    labeled_mask[y : y + h, x : x + w] != label
+                )
+                if hole_pixels.any():
+                    hole_values = image[y : y + h, x : x + w][hole_pixels]
+                    pixel_sums += hole_values.sum(axis=0)
+                    num_pixels += len(hole_values)
+
+                flake.mean_contrast = self._get_mean_contrast(
+                    pixel_sums,
+                    num_pixels,
+                    mean_background_values,
+                )
+
+        #### Calculate the Entropy of all flakes at once
+        if "entropy" in features and len(detected_flakes) > 0:
+            entropy_boxes, entropy_masks = zip(
+                *[
+                    self._get_entropy_mask(
+                        flake.cropped_mask,
+                        flake.bounding_box,
+                        image.shape,
+                    )
+                    for flake in detected_flakes
+                ]
+            )
+            flake_entropies = MaterialDetector._get_mean_entropies(
+                cv2.cvtColor(
+                    image,
+                    cv2.COLOR_BGR2GRAY,
+                    dst=workspace.get("gray_image", (height, width), np.uint8),
+                ),
+                np.concatenate([mask.ravel() for mask in entropy_masks]),
+                np.cumsum([0] + [mask.size for mask in entropy_masks]),
+                np.array(entropy_boxes, dtype=np.int64),
+            )
+            for flake, flake_entropy in zip(detected_flakes, flake_entropies):
+                flake.entropy = float(flake_entropy)
+
+        return detected_flakes
@@ -0,0 +1,275 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .Detector import MaterialDetector
+from .structures import DetectorWorkspace, Flake, FlakeTable
+
+# marks the end of the items in the queues between the stages
+_STOP = object()
+
+
+def _read_image(item: str) -> np.ndarray:
+    """The default reader of the pipeline, reads the image at the path with OpenCV"""
+    return cv2.imread(item)
+
+
+class DetectionPipeline:
+    """
+    Runs the detector in a pipeline of threads which overlaps reading, detecting, rendering and writing of the images.\n
+    The stages are connected by bounded queues, a slow stage blocks the stages before it, so at most a few images are in memory.
+    The numba kernels and most OpenCV functions release the GIL, so the stages run in parallel without the startup cost of processes.\n
+    Each detector thread uses its own `DetectorWorkspace`. More than one detector thread requires the "tbb" or "omp" threading layer of numba,
+    one detector thread already uses all cores in the parallel kernels. The `pruning_stats` of each call are stored on the workspace of its thread,
+    those of the detector hold the last finished call of any thread.
+    """
+
+    def __init__(
+        self,
+        detector: MaterialDetector,
+        read: Callable[[Any], np.ndarray] = _read_image,
+        render: Callable[
+            [np.ndarray, Union[List[Flake], FlakeTable]], np.ndarray
+        ] = None,
+        write: Callable[[Any, np.ndarray, Union[List[Flake], FlakeTable]], None] = None,
+        readers: int = 2,
+        detectors: int = 1,
+        renderers: int = 1,
+        writers: int = 2,
+        queue_size: int = 4,
+        **detect_kwargs,
+    ):
+        """
+        Initialize the pipeline.
+
+        Args:
+            detector (MaterialDetector): The detector, shared by the detector threads
+            read (Callable, optional): Returns the BGR image of an item, an error is raised if it returns None. Defaults to reading the item as path with `cv2.imread`.
+            render (Callable, optional): Called with the image and the flakes, returns the image passed to `write`. Defaults to None, meaning the image is passed unchanged.
+            write (Callable, optional): Called with the item, the rendered image and the flakes, e.g. to save the image. Defaults to None, meaning nothing is written.
+            readers (int, optional): The number of reader threads. Defaults to 2.
+            detectors (int, optional): The number of detector threads. Defaults to 1.
+            renderers (int, optional): The number of renderer threads, only used if `render` is given. Defaults to 1.
+            writers (int, optional): The number of writer threads, only used if `write` is given. Defaults to 2.
+            queue_size (int, optional): The maximum number of images waiting in front of each stage. Defaults to 4.
+            **detect_kwargs: The keyword arguments passed to `detect_flakes`, e.g. `features` or `min_confidence`
+        """
+        for name, num_workers in (
+            ("readers", readers),
+            ("detectors", detectors),
+            ("renderers", renderers),
+            ("writers", writers),
+        ):
+            if num_workers < 1:
+                raise ValueError(f"{name} has to be at least 1, got {num_workers}")
+        if queue_size < 1:
+            raise ValueError(f"queue_size has to be at least 1, got {queue_size}")
+
+        self.detector = detector
+        self.read = read
+        self.render = render
+        self.write = write
+        self.readers = readers
+        self.detectors = detectors
+        self.renderers = renderers
+        self.writers = writers
+        self.queue_size = queue_size
+        self.detect_kwargs = detect_kwargs
+
+    def _get_stages(self) -> List[Tuple[str, int, Callable[[tuple], tuple]]]:
+        """
+        Returns the stages of the pipeline, each stage maps the task (index, item, image, flakes) to the task of the next stage\n
+
+        Returns:
+            List[Tuple[str, int, Callable[[tuple], tuple]]]: The name, the number of threads and a function creating the task function of each thread
+        """
+
+        def create_reader():
+            def read_task(task):
+                index, item, _, _ = task
+                image = self.read(item)
+                if image is None:
+                    raise FileNotFoundError(f"Could not read the image of {item}")
+                return index, item, image, None
+
+            return read_task
+
+        def create_detector():
+            # every thread needs its own buffers
+            workspace = DetectorWorkspace()
+
+            def detect_task(task):
+                index, item, image, _ = task
+                flakes = self.detector.detect_flakes(
+                    image, workspace=workspace, **self.detect_kwargs
+                )
+                return index, item, image, flakes
+
+            return detect_task
+
+        def create_renderer():
+            def render_task(task):
+                index, item, image, flakes = task
+                return index, item, self.render(image, flakes), flakes
+
+            return render_task
+
+        def create_writer():
+            def write_task(task):
+                index, item, image, flakes = task
+                self.write(item, image, flakes)
+                return task
+
+            return write_task
+
+        stages = [
+            ("reader", self.readers, create_reader),
+            ("detector", self.detectors, create_detector),
+        ]
+        if self.render is not None:
+            stages.append(("renderer", self.renderers, create_renderer))
+        if self.write is not None:
+            stages.append(("writer", self.writers, create_writer))
+        return stages
+
+    def run(
+        self,
+        items: Iterable[Any],
+        ordered: bool = True,
+    ) -> Iterator[Tuple[Any, Union[List[Flake], FlakeTable]]]:
+        """
+        Runs the pipeline on the items and yields the item and the flakes of each image after it passed all stages\n
+        An error in any stage stops the pipeline and is raised here. Stopping the iteration early also stops the threads\n
+
+        Args:
+            items (Iterable[Any]): The items passed to `read`, e.g. the paths of the images
+            ordered (bool, optional): If True the results are returned in the order of the items, else as soon as they are done. Defaults to True.
+
+        Returns:
+            Iterator[Tuple[Any, Union[List[Flake], FlakeTable]]]: The item and the result of `detect_flakes` of each image
+        """
+        stop_event = threading.Event()
+        errors = []
+
+        def put(target_queue: queue.Queue, value) -> bool:
+            # a full queue is retried, so the threads notice when the pipeline is stopped
+            while not stop_event.is_set():
+                try:
+                    target_queue.put(value, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def feed(target_queue: queue.Queue, num_workers: int) -> None:
+            try:
+                for index, item in enumerate(items):
+                    if not put(target_queue, (index, item, None, None)):
+                        return
+            except BaseException as error:
+                errors.append(error)
+                stop_event.set()
+                return
+            for _ in range(num_workers):
+                put(target_queue, _STOP)
+
+        def work(
+            task_function: Callable[[tuple], tuple],
+            source_queue: queue.Queue,
+            target_queue: queue.Queue,
+            stage_state: dict,
+            num_next_workers: int,
+        ) -> None:
+            while not stop_event.is_set():
+                try:
+                    task = source_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if task is _STOP:
+                    break
+                try:
+                    task = task_function(task)
+                except BaseException as error:
+                    errors.append(error)
+                    stop_event.set()
+                    return
+                if not put(target_queue, task):
+                    return
+
+            # the last thread of a stage tells the next stage that all items are done
+            with stage_state["lock"]:
+                stage_state["running"] -= 1
+                is_last = stage_state["running"] == 0
+            if is_last:
+                for _ in range(num_next_workers):
+                    put(target_queue, _STOP)
+
+        stages = self._get_stages()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(stages) + 1)]
+
+        threads = [
+            threading.Thread(
+                target=feed,
+                args=(queues[0], stages[0][1]),
+                name="DetectionPipeline-feeder",
+                daemon=True,
+            )
+        ]
+        for stage_index, (name, num_workers, create_task_function) in enumerate(stages):
+            stage_state = {"lock": threading.Lock(), "running": num_workers}
+            num_next_workers = (
+                stages[stage_index + 1][1] if stage_index + 1 < len(stages) else 1
+            )
+            for worker_index in range(num_workers):
+                threads.append(
+                    threading.Thread(
+                        target=work,
+                        args=(
+                            create_task_function(),
+                            queues[stage_index],
+                            queues[stage_index + 1],
+                            stage_state,
+                            num_next_workers,
+                        ),
+                        name=f"DetectionPipeline-{name}-{worker_index}",
+                        daemon=True,
+                    )
+                )
+
+        for thread in threads:
+            thread.start()
+
+        output_queue = queues[-1]
+        # the results which finished before an earlier item, only used if ordered
+        finished = {}
+        next_index = 0
+        try:
+            while True:
+                try:
+                    task = output_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if stop_event.is_set():
+                        break
+                    continue
+                if task is _STOP:
+                    break
+
+                index, item, _, flakes = task
+                if not ordered:
+                    yield item, flakes
+                    continue
+
+                finished[index] = (item, flakes)
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
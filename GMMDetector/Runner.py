@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, List, Tuple, Union
+
+import cv2
+
+from .Detector import MaterialDetector
+from .structures import Flake, FlakeTable
+
+# the detector of a worker process, created once by `_initialize_worker`
+_worker_detector: MaterialDetector = None
+_worker_kwargs: dict = None
+
+
+def _initialize_worker(spec: dict, num_threads: int, detect_kwargs: dict) -> None:
+    """
+    Creates the detector of a worker process from its description and limits the threads of numba and OpenCV\n
+
+    Args:
+        spec (dict): The description of the detector, see `MaterialDetector.to_spec`
+        num_threads (int): The number of threads of numba and OpenCV in this worker
+        detect_kwargs (dict): The keyword arguments of `detect_flakes`
+    """
+    global _worker_detector, _worker_kwargs
+    from numba import set_num_threads
+
+    set_num_threads(num_threads)
+    cv2.setNumThreads(num_threads)
+
+    _worker_detector = MaterialDetector.from_spec(spec)
+    _worker_kwargs = detect_kwargs
+
+
+def _detect_file(path: str) -> Union[List[Flake], FlakeTable]:
+    """
+    Reads the image at the path and detects its flakes with the detector of the worker\n
+
+    Args:
+        path (str): The path of the image
+
+    Returns:
+        The result of `detect_flakes`
+    """
+    image = cv2.imread(path)
+    if image is None:
+        raise FileNotFoundError(f"Could not read the image {path}")
+    return _worker_detector.detect_flakes(image, **_worker_kwargs)
+
+
+def run_folder(
+    detector: MaterialDetector,
+    paths: Iterable[str],
+    workers: int = None,
+    ordered: bool = True,
+    threads_per_worker: int = None,
+    start_method: str = "spawn",
+    **detect_kwargs,
+) -> Iterator[Tuple[str, Union[List[Flake], FlakeTable]]]:
+    """
+    Detects the flakes of the images at the given paths on a pool of worker processes\n
+    Each worker creates its detector once from `detector.to_spec()`, the detector itself is not pickled.
+    The threads of numba and OpenCV are split between the workers so the workers do not oversubscribe the cores.
+    At most two images per worker are in flight, so the results of large folders are not held in memory\n
+    The worker processes are started with "spawn" by default, so scripts using this function need an `if __name__ == "__main__":` guard\n
+
+    Args:
+        detector (MaterialDetector): The detector to run, its parameters and False Positive Detector are copied to the workers
+        paths (Iterable[str]): The paths of the images
+        workers (int, optional): The number of worker processes. Defaults to None, meaning one per core.
+        ordered (bool, optional): If True the results are returned in the order of the paths, else as soon as they are done. Defaults to True.
+        threads_per_worker (int, optional): The number of numba and OpenCV threads of each worker. Defaults to None, meaning the cores divided by the workers.
+        start_method (str, optional): The multiprocessing start method of the workers. Defaults to "spawn".
+        **detect_kwargs: The keyword arguments passed to `detect_flakes`, e.g. `features` or `min_confidence`
+
+    Returns:
+        Iterator[Tuple[str, Union[List[Flake], FlakeTable]]]: The path of each image and its detected flakes
+    """
+    num_cores = os.cpu_count() or 1
+    if workers is None:
+        workers = num_cores
+    if workers < 1:
+        raise ValueError(f"workers has to be at least 1, got {workers}")
+    if threads_per_worker is None:
+        threads_per_worker = max(1, num_cores // workers)
+
+    paths = iter(paths)
+    max_pending = 2 * workers
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=_initialize_worker,
+        initargs=(detector.to_spec(), threads_per_worker, detect_kwargs),
+    ) as executor:
+        if ordered:
+            pending = deque()
+            for path in paths:
+                pending.append((path, executor.submit(_detect_file, path)))
+                if len(pending) >= max_pending:
+                    path, future = pending.popleft()
+                    yield path, future.result()
+            while pending:
+                path, future = pending.popleft()
+                yield path, future.result()
+            return
+
+        pending = {}
+        for path in paths:
+            pending[executor.submit(_detect_file, path)] = path
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
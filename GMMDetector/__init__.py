@@ -1 +1,3 @@
 from .Detector import MaterialDetector
+from .Runner import run_folder
+from .Pipeline import DetectionPipeline
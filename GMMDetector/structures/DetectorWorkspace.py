@@ -0,0 +1,127 @@
+from typing import Callable, Dict, Hashable, Tuple
+
+import numpy as np
+
+
+class DetectorWorkspace:
+    """
+    Reusable buffers for repeated calls of `MaterialDetector.detect_flakes`.\n
+    The buffers are kept for one frame shape and number of components, when either changes all buffers are released.
+    A buffer requested with a smaller shape is a contiguous view of the existing buffer, e.g. for the smaller tiles at the edges of a mosaic.
+    In the steady state a call of `detect_flakes` reuses the buffers instead of allocating new ones.\n
+    A workspace must not be used by several calls at the same time, give each thread its own workspace.
+    The workspace also holds the `pruning_stats` of the last call which used it, see `MaterialDetector.pruning_stats`.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty workspace.
+        """
+        self.key = None
+        self.allocations = 0
+        self.pruning_stats = None
+
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    @property
+    def nbytes(self) -> int:
+        """The memory used by the buffers in bytes."""
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def prepare(
+        self,
+        image_shape: Tuple[int, ...],
+        num_components: int,
+    ) -> None:
+        """
+        Prepares the workspace for a frame, releases all buffers if the frame shape or the number of components changed.
+
+        Args:
+            image_shape (Tuple[int, ...]): The shape of the frame.
+            num_components (int): The number of components of the detector.
+        """
+        key = (tuple(image_shape), num_components)
+        if key != self.key:
+            self.clear()
+            self.key = key
+
+    def get(
+        self,
+        name: Hashable,
+        shape: Tuple[int, ...],
+        dtype: np.dtype,
+    ) -> np.ndarray:
+        """
+        Returns the buffer with the given name, the content of the buffer is undefined.\n
+        A new buffer is allocated if there is no buffer with the name, if it is too small or if its dtype differs,
+        otherwise the returned buffer is a contiguous view of the start of the existing buffer.
+
+        Args:
+            name (Hashable): The name of the buffer.
+            shape (Tuple[int, ...]): The shape of the buffer.
+            dtype (np.dtype): The dtype of the buffer.
+
+        Returns:
+            np.ndarray: The buffer.
+        """
+        return self._get_buffer(name, shape, dtype, np.empty)
+
+    def get_zeros(
+        self,
+        name: Hashable,
+        shape: Tuple[int, ...],
+        dtype: np.dtype,
+    ) -> np.ndarray:
+        """
+        Returns the buffer with the given name like `get`, a newly allocated buffer is filled with zeros.\n
+        The buffer is not cleared between the calls, the caller has to reset the entries it changed to zero after use.
+        This allows large tables of which each call only touches a few entries, e.g. the occupancy table of the colors.
+
+        Args:
+            name (Hashable): The name of the buffer.
+            shape (Tuple[int, ...]): The shape of the buffer.
+            dtype (np.dtype): The dtype of the buffer.
+
+        Returns:
+            np.ndarray: The buffer.
+        """
+        return self._get_buffer(name, shape, dtype, np.zeros)
+
+    def _get_buffer(
+        self,
+        name: Hashable,
+        shape: Tuple[int, ...],
+        dtype: np.dtype,
+        allocate: Callable[..., np.ndarray],
+    ) -> np.ndarray:
+        """Returns the start of the buffer with the given name, a new buffer is created with `allocate`."""
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = allocate(shape=size, dtype=dtype)
+            self._buffers[name] = buffer
+            self.allocations += 1
+        return buffer[:size].reshape(shape)
+
+    def clear(self) -> None:
+        """Releases all buffers."""
+        self._buffers.clear()
+        self.key = None
+
+    def memory_report(self) -> Dict[str, int]:
+        """
+        Returns the memory used by each buffer.
+
+        Returns:
+            Dict[str, int]: The name of each buffer and its size in bytes, largest first.
+        """
+        return dict(
+            sorted(
+                ((str(name), buffer.nbytes) for name, buffer in self._buffers.items()),
+                key=lambda item: item[1],
+                reverse=True,
+            )
+        )
+
+    def __repr__(self) -> str:
+        return f"DetectorWorkspace(buffers={len(self._buffers)}, nbytes={self.nbytes / 1024**2:.1f}MiB, allocations={self.allocations})"
@@ -1,3 +1,6 @@
+from typing import Tuple
+
+import cv2
 import numpy as np
 
 
@@ -6,6 +9,21 @@ class Flake:
     This class is used to store the information of a flake.
     """
 
+    __slots__ = (
+        "cropped_mask",
+        "bounding_box",
+        "image_shape",
+        "thickness",
+        "size",
+        "mean_contrast",
+        "center",
+        "max_sidelength",
+        "min_sidelength",
+        "aspect_ratio",
+        "false_positive_probability",
+        "entropy",
+    )
+
     def __init__(
         self,
         mask: np.ndarray,
@@ -17,12 +35,14 @@ class Flake:
         min_sidelength: int,
         false_positive_probability: float = 0,
         entropy: float = -1,
+        bounding_box: Tuple[int, int, int, int] = None,
+        image_shape: Tuple[int, int] = None,
     ):
         """
         Initialize a flake object.
 
         Args:
-            mask (np.ndarray): The mask of the flake, a 2D array with 1s and 0s indicating the flake and background respectively.
+            mask (np.ndarray): The mask of the flake, a 2D array with 1s and 0s indicating the flake and background respectively. Only the cut out of the bounding box is stored.
             thickness (str): The name of the layer the flake is from.
             size (int): The size of the flake in pixels.
             mean_contrast (np.ndarray): The mean contrast of the flake in BGR as defined in "https://arxiv.org/abs/2306.14845".
@@ -31,8 +51,15 @@ class Flake:
             min_sidelength (int): The minimum sidelength of the flake in pixels, measured using a rotated bounding box.
             false_positive_probability (float, optional): The probability of the flake being a false positive. Defaults to 0.
             entropy (float, optional): The Shannon entropy of the flake. Defaults to -1.
+            bounding_box (Tuple[int, int, int, int], optional): The bounding box (x, y, w, h) of the flake in the image, if given the mask is only the cut out of the bounding box. Defaults to None.
+            image_shape (Tuple[int, int], optional): The shape (H, W) of the image the flake is from, needed if the bounding box is given. Defaults to None.
         """
-        self.mask = mask
+        if bounding_box is None:
+            self.mask = mask
+        else:
+            self.cropped_mask = mask
+            self.bounding_box = tuple(int(value) for value in bounding_box)
+            self.image_shape = tuple(int(value) for value in image_shape[:2])
         self.thickness = thickness
         self.size = size
         self.mean_contrast = mean_contrast
@@ -43,6 +70,64 @@ class Flake:
         self.false_positive_probability = false_positive_probability
         self.entropy = entropy
 
+    @property
+    def mask(self) -> np.ndarray:
+        """
+        The full mask of the flake with the shape of the image.\n
+        Only the cut out of the bounding box is stored, the full mask is created on every access.
+        """
+        height, width = self.image_shape
+        x, y, w, h = self.bounding_box
+
+        mask = np.zeros(shape=(height, width), dtype=self.cropped_mask.dtype)
+        mask[y : y + h, x : x + w] = self.cropped_mask
+        return mask
+
+    @mask.setter
+    def mask(self, mask: np.ndarray) -> None:
+        """Stores the cut out of the bounding box of a full mask."""
+        x, y, w, h = cv2.boundingRect(np.asarray(mask, dtype=np.uint8))
+
+        self.cropped_mask = np.array(mask[y : y + h, x : x + w])
+        self.bounding_box = (x, y, w, h)
+        self.image_shape = tuple(mask.shape[:2])
+
+    def to_rle(self) -> dict:
+        """
+        Encode the mask of the flake as an uncompressed run length encoding.\n
+        The encoding is column major, starting with the number of background pixels, as used by pycocotools.\n
+        It can be compressed with `pycocotools.mask.frPyObjects(rle, *rle["size"])`.
+
+        Returns:
+            dict: The run length encoding with the keys "size" (H, W) and "counts".
+        """
+        height, width = self.image_shape
+        x, y, w, h = self.bounding_box
+
+        if w == 0 or h == 0:
+            return {"size": [height, width], "counts": [height * width]}
+
+        # only the columns of the bounding box contain flake pixels
+        columns = np.zeros(shape=(height, w), dtype=np.uint8)
+        columns[y : y + h] = self.cropped_mask != 0
+        pixels = columns.ravel(order="F")
+
+        run_starts = np.flatnonzero(np.diff(pixels)) + 1
+        counts = np.diff(np.concatenate([[0], run_starts, [len(pixels)]]))
+        if pixels[0] != 0:
+            counts = np.concatenate([[0], counts])
+
+        # add the background columns left and right of the bounding box
+        counts[0] += x * height
+        trailing_pixels = (width - x - w) * height
+        if trailing_pixels > 0:
+            if pixels[-1] == 0:
+                counts[-1] += trailing_pixels
+            else:
+                counts = np.append(counts, trailing_pixels)
+
+        return {"size": [height, width], "counts": counts.tolist()}
+
     def to_dict(self) -> dict:
         """
         Convert the flake object to a dictionary.
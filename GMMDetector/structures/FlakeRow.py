@@ -0,0 +1,160 @@
+from typing import Tuple
+
+import numpy as np
+
+from .FlakeClass import Flake
+
+
+class FlakeRow(Flake):
+    """
+    A view of one row of a `FlakeTable` with the attributes of a `Flake`.\n
+    The row only holds the table and its index, every attribute is read from and written to the columns of the table.
+    Changes of the row are therefore visible in the table and the other way round.
+    The row is an instance of `Flake`, so `mask`, `to_rle`, `to_dict` and the string representation work like those of a flake.\n
+    Use `to_flake` to get an independent copy of the row.
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(
+        self,
+        table,
+        index: int,
+    ):
+        """
+        Initialize a view of a row.
+
+        Args:
+            table (FlakeTable): The table the row belongs to.
+            index (int): The index of the row in the table, between 0 and `len(table) - 1`.
+        """
+        self.table = table
+        self.index = index
+
+    def __reduce__(self):
+        # only the table and the index describe the row, the attributes are read from the table
+        return FlakeRow, (self.table, self.index)
+
+    @property
+    def cropped_mask(self) -> np.ndarray:
+        """The mask of the flake cut out to its bounding box, shared with the table."""
+        return self.table.masks[self.index]
+
+    @cropped_mask.setter
+    def cropped_mask(self, cropped_mask: np.ndarray) -> None:
+        self.table.masks[self.index] = cropped_mask
+
+    @property
+    def bounding_box(self) -> Tuple[int, int, int, int]:
+        """The bounding box (x, y, w, h) of the flake in the image."""
+        return tuple(self.table.bounding_box[self.index].tolist())
+
+    @bounding_box.setter
+    def bounding_box(self, bounding_box: Tuple[int, int, int, int]) -> None:
+        self.table.bounding_box[self.index] = bounding_box
+
+    @property
+    def image_shape(self) -> Tuple[int, int]:
+        """The shape (H, W) of the image the flake is from."""
+        return tuple(self.table.image_shape[self.index].tolist())
+
+    @image_shape.setter
+    def image_shape(self, image_shape: Tuple[int, int]) -> None:
+        self.table.image_shape[self.index] = image_shape[:2]
+
+    @property
+    def thickness(self) -> str:
+        """The name of the layer of the flake, it has to be one of the layer names of the table."""
+        return self.table.layer_names[self.table.thickness_index[self.index]]
+
+    @thickness.setter
+    def thickness(self, thickness: str) -> None:
+        self.table.thickness_index[self.index] = self.table.layer_names.index(thickness)
+
+    @property
+    def size(self) -> int:
+        return int(self.table.size[self.index])
+
+    @size.setter
+    def size(self, size: int) -> None:
+        self.table.size[self.index] = size
+
+    @property
+    def mean_contrast(self) -> np.ndarray:
+        """The mean contrast of the flake, a view of the row of the column."""
+        return self.table.mean_contrast[self.index]
+
+    @mean_contrast.setter
+    def mean_contrast(self, mean_contrast: np.ndarray) -> None:
+        self.table.mean_contrast[self.index] = mean_contrast
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        return tuple(self.table.center[self.index].tolist())
+
+    @center.setter
+    def center(self, center: Tuple[int, int]) -> None:
+        self.table.center[self.index] = center
+
+    @property
+    def max_sidelength(self) -> float:
+        return float(self.table.max_sidelength[self.index])
+
+    @max_sidelength.setter
+    def max_sidelength(self, max_sidelength: float) -> None:
+        self.table.max_sidelength[self.index] = max_sidelength
+
+    @property
+    def min_sidelength(self) -> float:
+        return float(self.table.min_sidelength[self.index])
+
+    @min_sidelength.setter
+    def min_sidelength(self, min_sidelength: float) -> None:
+        self.table.min_sidelength[self.index] = min_sidelength
+
+    @property
+    def aspect_ratio(self) -> float:
+        return float(self.table.aspect_ratio[self.index])
+
+    @aspect_ratio.setter
+    def aspect_ratio(self, aspect_ratio: float) -> None:
+        self.table.aspect_ratio[self.index] = aspect_ratio
+
+    @property
+    def false_positive_probability(self) -> float:
+        return float(self.table.false_positive_probability[self.index])
+
+    @false_positive_probability.setter
+    def false_positive_probability(self, false_positive_probability: float) -> None:
+        self.table.false_positive_probability[self.index] = false_positive_probability
+
+    @property
+    def entropy(self) -> float:
+        return float(self.table.entropy[self.index])
+
+    @entropy.setter
+    def entropy(self, entropy: float) -> None:
+        self.table.entropy[self.index] = entropy
+
+    def to_flake(self) -> Flake:
+        """
+        Creates an independent flake from the row, only the mask is shared with the table.
+
+        Returns:
+            Flake: A copy of the row.
+        """
+        flake = Flake(
+            mask=self.cropped_mask,
+            thickness=self.thickness,
+            size=self.size,
+            mean_contrast=self.mean_contrast.tolist(),
+            center=self.center,
+            max_sidelength=self.max_sidelength,
+            min_sidelength=self.min_sidelength,
+            false_positive_probability=self.false_positive_probability,
+            entropy=self.entropy,
+            bounding_box=self.bounding_box,
+            image_shape=self.image_shape,
+        )
+        flake.aspect_ratio = self.aspect_ratio
+        return flake
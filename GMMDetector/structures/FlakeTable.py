@@ -0,0 +1,270 @@
+from typing import Iterator, List, Sequence, Union
+
+import numpy as np
+
+from .FlakeClass import Flake
+from .FlakeRow import FlakeRow
+
+
+class FlakeTable:
+    """
+    This class stores the information of many flakes column wise.\n
+    Every attribute of the flakes is a typed numpy array with one row per flake, so the flakes can be filtered
+    without a python loop, e.g. `table[(table.size > 1000) & (table.false_positive_probability < 0.5)]`.\n
+    Indexing with an integer returns the row as a `FlakeRow`, iterating over the table yields all rows as `FlakeRow`.
+    A row is a `Flake` which reads and writes its attributes in the columns of the table, no values are copied.
+    Use `to_flakes` or `FlakeRow.to_flake` to get independent `Flake` objects.
+    """
+
+    column_names = (
+        "frame_index",
+        "thickness_index",
+        "size",
+        "center",
+        "max_sidelength",
+        "min_sidelength",
+        "aspect_ratio",
+        "false_positive_probability",
+        "entropy",
+        "mean_contrast",
+        "bounding_box",
+        "image_shape",
+    )
+
+    column_dtypes = {
+        "frame_index": (np.int32, ()),
+        "thickness_index": (np.int32, ()),
+        "size": (np.int64, ()),
+        "center": (np.int32, (2,)),
+        "max_sidelength": (np.float64, ()),
+        "min_sidelength": (np.float64, ()),
+        "aspect_ratio": (np.float64, ()),
+        "false_positive_probability": (np.float64, ()),
+        "entropy": (np.float64, ()),
+        "mean_contrast": (np.float64, (3,)),
+        "bounding_box": (np.int32, (4,)),
+        "image_shape": (np.int32, (2,)),
+    }
+
+    def __init__(
+        self,
+        layer_names: Sequence[str],
+        masks: Sequence[np.ndarray] = (),
+        **columns: np.ndarray,
+    ):
+        """
+        Initialize a flake table.
+
+        Args:
+            layer_names (Sequence[str]): The names of the layers, the thickness index of a flake indexes into this list.
+            masks (Sequence[np.ndarray], optional): The masks of the flakes cut out to their bounding boxes. Defaults to no flakes.
+            **columns (np.ndarray): The columns of the table, see `column_names`, missing columns are filled with zeros.
+        """
+        self.layer_names = list(layer_names)
+        self.masks = list(masks)
+
+        unknown_columns = set(columns) - set(self.column_names)
+        if unknown_columns:
+            raise ValueError(f"Unknown columns {sorted(unknown_columns)}")
+
+        for name in self.column_names:
+            dtype, row_shape = self.column_dtypes[name]
+            if name in columns:
+                column = np.asarray(columns[name], dtype=dtype)
+                column = column.reshape((len(column),) + row_shape)
+            else:
+                column = np.zeros(shape=(len(self.masks),) + row_shape, dtype=dtype)
+
+            if len(column) != len(self.masks):
+                raise ValueError(
+                    f"The column {name} has {len(column)} rows, expected {len(self.masks)}"
+                )
+            setattr(self, name, column)
+
+    @classmethod
+    def from_flakes(
+        cls,
+        flakes: Sequence[Flake],
+        layer_names: Sequence[str] = None,
+        frame_index: int = 0,
+    ) -> "FlakeTable":
+        """
+        Creates a flake table from a list of flakes.
+
+        Args:
+            flakes (Sequence[Flake]): The flakes.
+            layer_names (Sequence[str], optional): The names of the layers, if not given the sorted thicknesses of the flakes are used. Defaults to None.
+            frame_index (int, optional): The index of the frame the flakes are from. Defaults to 0.
+
+        Returns:
+            FlakeTable: The flakes as a table.
+        """
+        if layer_names is None:
+            layer_names = sorted({flake.thickness for flake in flakes})
+        layer_indexes = {name: index for index, name in enumerate(layer_names)}
+
+        return cls(
+            layer_names=layer_names,
+            masks=[flake.cropped_mask for flake in flakes],
+            frame_index=np.full(len(flakes), frame_index),
+            thickness_index=[layer_indexes[flake.thickness] for flake in flakes],
+            size=[flake.size for flake in flakes],
+            center=[flake.center for flake in flakes],
+            max_sidelength=[flake.max_sidelength for flake in flakes],
+            min_sidelength=[flake.min_sidelength for flake in flakes],
+            aspect_ratio=[flake.aspect_ratio for flake in flakes],
+            false_positive_probability=[
+                flake.false_positive_probability for flake in flakes
+            ],
+            entropy=[flake.entropy for flake in flakes],
+            mean_contrast=[flake.mean_contrast for flake in flakes],
+            bounding_box=[flake.bounding_box for flake in flakes],
+            image_shape=[flake.image_shape for flake in flakes],
+        )
+
+    @classmethod
+    def concatenate(
+        cls,
+        tables: Sequence["FlakeTable"],
+    ) -> "FlakeTable":
+        """
+        Concatenates the flake tables of several frames, all tables need to have the same layer names.\n
+        Set the `frame_index` of each table beforehand to keep track of the frames.
+
+        Args:
+            tables (Sequence[FlakeTable]): The flake tables.
+
+        Returns:
+            FlakeTable: One table containing the flakes of all tables.
+        """
+        if len(tables) == 0:
+            raise ValueError("At least one table is needed")
+
+        layer_names = tables[0].layer_names
+        for table in tables[1:]:
+            if table.layer_names != layer_names:
+                raise ValueError(
+                    f"The layer names differ, {table.layer_names} != {layer_names}"
+                )
+
+        return cls(
+            layer_names=layer_names,
+            masks=[mask for table in tables for mask in table.masks],
+            **{
+                name: np.concatenate([getattr(table, name) for table in tables])
+                for name in cls.column_names
+            },
+        )
+
+    @property
+    def thickness(self) -> np.ndarray:
+        """The name of the layer of each flake."""
+        return np.array(self.layer_names, dtype=object)[self.thickness_index]
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+    def __getitem__(
+        self,
+        index: Union[int, slice, np.ndarray, List[int]],
+    ) -> Union[FlakeRow, "FlakeTable"]:
+        """
+        Returns a view of a single row for an integer index, otherwise a new table with the selected rows.\n
+        The columns of a new table are copies, the masks are shared with this table.
+
+        Args:
+            index (Union[int, slice, np.ndarray, List[int]]): An integer, a slice, a boolean mask or an array of indexes.
+
+        Returns:
+            Union[FlakeRow, FlakeTable]: The selected row or rows.
+        """
+        if isinstance(index, (int, np.integer)):
+            return FlakeRow(self, range(len(self))[index])
+
+        row_indexes = np.arange(len(self))[index]
+        return FlakeTable(
+            layer_names=self.layer_names,
+            masks=[self.masks[row_index] for row_index in row_indexes],
+            **{name: getattr(self, name)[row_indexes] for name in self.column_names},
+        )
+
+    def __iter__(self) -> Iterator[FlakeRow]:
+        """Yields a view of each row."""
+        for index in range(len(self)):
+            yield FlakeRow(self, index)
+
+    def to_flakes(self) -> List[Flake]:
+        """
+        Creates independent flakes from the rows, only the masks are shared with the table.
+
+        Returns:
+            List[Flake]: A copy of each row.
+        """
+        return [row.to_flake() for row in self]
+
+    def to_arrow(
+        self,
+        include_masks: bool = False,
+    ):
+        """
+        Converts the table to a pyarrow Table, the numeric columns are not copied.\n
+        Columns with more than one value per flake are stored as fixed size lists over the flat buffer of the column.
+        Only columns which are not C contiguous, e.g. strided views set by the user, are copied once.
+
+        Args:
+            include_masks (bool, optional): If True the masks cut out to their bounding boxes are added as a binary column. Defaults to False.
+
+        Returns:
+            pyarrow.Table: The flakes as a pyarrow Table.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as error:
+            raise ImportError("pyarrow is needed to export flake tables") from error
+
+        arrays = {}
+        for name in self.column_names:
+            column = getattr(self, name)
+            if column.ndim == 1:
+                arrays[name] = pa.array(column)
+            else:
+                # the flat values are a view of the contiguous column, pyarrow wraps their buffer without a copy
+                values = np.ascontiguousarray(column).reshape(-1)
+                arrays[name] = pa.FixedSizeListArray.from_arrays(
+                    pa.array(values), column.shape[1]
+                )
+
+        arrays["thickness"] = pa.DictionaryArray.from_arrays(
+            pa.array(self.thickness_index),
+            pa.array(self.layer_names, type=pa.string()),
+        )
+
+        if include_masks:
+            arrays["mask"] = pa.array(
+                [
+                    np.ascontiguousarray(mask, dtype=np.uint8).tobytes()
+                    for mask in self.masks
+                ],
+                type=pa.binary(),
+            )
+
+        return pa.table(arrays)
+
+    def to_parquet(
+        self,
+        path: str,
+        include_masks: bool = False,
+    ) -> None:
+        """
+        Writes the table to a parquet file, see `to_arrow`.
+
+        Args:
+            path (str): The path of the parquet file.
+            include_masks (bool, optional): If True the masks cut out to their bounding boxes are written as well. Defaults to False.
+        """
+        import pyarrow.parquet as pq
+
+        pq.write_table(self.to_arrow(include_masks=include_masks), path)
+
+    def __repr__(self) -> str:
+        return f"FlakeTable(num_flakes={len(self)}, layer_names={self.layer_names})"
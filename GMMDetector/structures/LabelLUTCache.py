@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+import numpy as np
+
+
+class LabelLUTCache:
+    """
+    A least recently used cache for the color lookup tables of the MaterialDetector.\n
+    Each lookup table maps a quantized BGR color to the label of the closest component and
+    is only valid for one model and one quantized background color, which are both part of the key.
+    The cache can be shared by several threads and detectors, a missing table is only built once.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 8,
+        max_bytes: int = 256 * 1024**2,
+    ):
+        """
+        Initialize the lookup table cache.
+
+        Args:
+            max_entries (int, optional): The maximum number of lookup tables kept in the cache. Defaults to 8.
+            max_bytes (int, optional): The maximum memory used by the cached lookup tables in bytes. Defaults to 256 MiB.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+    @property
+    def nbytes(self) -> int:
+        """The memory used by the cached lookup tables in bytes."""
+        return self._nbytes
+
+    def get(self, key: Hashable) -> np.ndarray:
+        """
+        Returns the lookup table for the key and marks it as most recently used.
+
+        Args:
+            key (Hashable): The key of the lookup table
+
+        Returns:
+            np.ndarray: The lookup table or None if it is not cached
+        """
+        with self._lock:
+            lut = self._entries.get(key)
+            if lut is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return lut
+
+    def put(self, key: Hashable, lut: np.ndarray) -> None:
+        """
+        Adds a lookup table to the cache and evicts the least recently used ones if a limit is exceeded.\n
+        Lookup tables larger than `max_bytes` are not cached.
+
+        Args:
+            key (Hashable): The key of the lookup table
+            lut (np.ndarray): The lookup table
+        """
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key).nbytes
+
+            if lut.nbytes > self.max_bytes or self.max_entries < 1:
+                return
+
+            self._entries[key] = lut
+            self._nbytes += lut.nbytes
+
+            while (
+                len(self._entries) > self.max_entries or self._nbytes > self.max_bytes
+            ):
+                _, evicted_lut = self._entries.popitem(last=False)
+                self._nbytes -= evicted_lut.nbytes
+                self.evictions += 1
+
+    def get_or_create(
+        self,
+        key: Hashable,
+        create_function: Callable[[], np.ndarray],
+    ) -> np.ndarray:
+        """
+        Returns the cached lookup table for the key or creates and caches it.
+
+        Args:
+            key (Hashable): The key of the lookup table
+            create_function (Callable[[], np.ndarray]): Called without arguments to build the lookup table on a miss
+
+        Returns:
+            np.ndarray: The lookup table
+        """
+        with self._lock:
+            lut = self.get(key)
+            if lut is None:
+                lut = create_function()
+                self.put(key, lut)
+            return lut
+
+    def clear(self) -> None:
+        """Removes all lookup tables from the cache, the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the cache, useful to size the cache for long scans.
+
+        Returns:
+            dict: The number of hits, misses, evictions and cached entries as well as the used memory in bytes and the hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "nbytes": self._nbytes,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return f"LabelLUTCache(entries={len(self._entries)}/{self.max_entries}, nbytes={self._nbytes}/{self.max_bytes}, hits={self.hits}, misses={self.misses})"
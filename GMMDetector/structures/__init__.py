@@ -1 +1,5 @@
+from .DetectorWorkspace import DetectorWorkspace
 from .FlakeClass import Flake
+from .FlakeRow import FlakeRow
+from .FlakeTable import FlakeTable
+from .LabelLUTCache import LabelLUTCache
@@ -10,7 +10,7 @@ import cv2
 import numpy as np
 
 from demo_functions import visualise_flakes
-from GMMDetector import MaterialDetector
+from GMMDetector import DetectionPipeline, MaterialDetector, run_folder
 
 
 def arg_parse() -> dict:
@@ -30,46 +30,73 @@ def arg_parse() -> dict:
     parser.add_argument("--min_confidence", dest="min_confidence", help="The Confidence threshold", default=0, type=float)
     parser.add_argument("--channels", dest="channels", help="Channels to use", default="BGR", type=str)
     parser.add_argument("--shuffel", dest="shuffel", default=False, type=bool)
+    parser.add_argument("--workers", dest="workers", help="Number of worker processes, 1 runs the detector in this process", default=1, type=int)
     # fmt: on
     return vars(parser.parse_args())
 
 
-args = arg_parse()
+if __name__ == "__main__":
+    args = arg_parse()
 
-# Constants
-FILE_DIR = os.path.dirname(os.path.abspath(__file__))
-CONTRAST_PATH_ROOT = os.path.join(FILE_DIR, "..", "GMMDetector", "trained_parameters")
-DATA_DIR = os.path.join(FILE_DIR, "..", "Datasets", "GMMDetectorDatasets")
-OUT_DIR = os.path.join(FILE_DIR, args["out"])
-os.makedirs(OUT_DIR, exist_ok=True)
+    # Constants
+    FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+    CONTRAST_PATH_ROOT = os.path.join(
+        FILE_DIR, "..", "GMMDetector", "trained_parameters"
+    )
+    DATA_DIR = os.path.join(FILE_DIR, "..", "Datasets", "GMMDetectorDatasets")
+    OUT_DIR = os.path.join(FILE_DIR, args["out"])
+    os.makedirs(OUT_DIR, exist_ok=True)
 
-NUM_IMAGES = args["num_image"]
-MATERIAL = args["material"]
-SIZE_THRESHOLD = args["size"]
-STD_THRESHOLD = args["std"]
+    NUM_IMAGES = args["num_image"]
+    MATERIAL = args["material"]
+    SIZE_THRESHOLD = args["size"]
+    STD_THRESHOLD = args["std"]
 
-with open(os.path.join(CONTRAST_PATH_ROOT, f"{MATERIAL}_GMM.json")) as f:
-    contrast_dict = json.load(f)
+    with open(os.path.join(CONTRAST_PATH_ROOT, f"{MATERIAL}_GMM.json")) as f:
+        contrast_dict = json.load(f)
 
-model = MaterialDetector(
-    contrast_dict=contrast_dict,
-    size_threshold=SIZE_THRESHOLD,
-    standard_deviation_threshold=STD_THRESHOLD,
-    used_channels="BGR",
-)
+    model = MaterialDetector(
+        contrast_dict=contrast_dict,
+        size_threshold=SIZE_THRESHOLD,
+        standard_deviation_threshold=STD_THRESHOLD,
+        used_channels="BGR",
+    )
 
-# load the images and shuffel them so we dont always sample the same images
-image_directory = os.path.join(DATA_DIR, MATERIAL, "test_images")
-image_names = os.listdir(image_directory)
-if args["shuffel"]:
-    np.random.shuffle(image_names)
-used_images = image_names[:NUM_IMAGES]
+    # load the images and shuffel them so we dont always sample the same images
+    image_directory = os.path.join(DATA_DIR, MATERIAL, "test_images")
+    image_names = os.listdir(image_directory)
+    if args["shuffel"]:
+        np.random.shuffle(image_names)
+    used_images = image_names[:NUM_IMAGES]
 
-for image_name in used_images:
-    image_path = os.path.join(image_directory, image_name)
-    image = cv2.imread(image_path)
+    image_paths = [
+        os.path.join(image_directory, image_name) for image_name in used_images
+    ]
 
-    flakes = model(image)
-
-    image_overlay = visualise_flakes(flakes, image, args["min_confidence"])
-    cv2.imwrite(os.path.join(OUT_DIR, image_name), image_overlay)
+    if args["workers"] > 1:
+        # the workers read the images and detect the flakes, the overlays are drawn here
+        for image_path, flakes in run_folder(
+            model,
+            image_paths,
+            workers=args["workers"],
+            min_confidence=args["min_confidence"],
+        ):
+            image = cv2.imread(image_path)
+            image_overlay = visualise_flakes(flakes, image, args["min_confidence"])
+            cv2.imwrite(
+                os.path.join(OUT_DIR, os.path.basename(image_path)), image_overlay
+            )
+    else:
+        # reading, detecting, drawing and saving the images overlap in a pipeline of threads
+        pipeline = DetectionPipeline(
+            model,
+            render=lambda image, flakes: visualise_flakes(
+                flakes, image, args["min_confidence"]
+            ),
+            write=lambda image_path, image_overlay, flakes: cv2.imwrite(
+                os.path.join(OUT_DIR, os.path.basename(image_path)), image_overlay
+            ),
+            min_confidence=args["min_confidence"],
+        )
+        for _ in pipeline.run(image_paths):
+            pass